@@ -3,56 +3,48 @@
 Agent Helper - Use this in Terminal 2 (Code Agent)
 """
 
-import json
 import time
 from datetime import datetime
-import re
+
+from state_store import ROLES, get_store
+from state_watch import wait_until
+
+# Roles an agent terminal can take (the orchestrator role is claimed separately)
+AGENT_ROLES = [role for role in ROLES if role != 'ORCHESTRATOR']
 
 def auto_assign_role(role_to_assign=None):
     """Automatically assign to a role that has pending tasks."""
     # 1. Get pending tasks
+    store = get_store()
     try:
-        with open("agents/tasks.json", "r") as f:
-            tasks = json.load(f)
-        pending_tasks = tasks.get("pending_tasks", [])
-        if not pending_tasks:
+        counts = store.task_counts()
+        if not counts["pending"] and not counts["in_progress"]:
             print("⏳ No pending tasks. No role will be assigned.")
             return None, None
     except FileNotFoundError:
-        print("❌ tasks.json not found. No role will be assigned.")
+        print("❌ Task state not found. No role will be assigned.")
         return None, None
 
     # 2. Get required roles from tasks that are pending
-    required_roles = {
-        task.get("data", {}).get("target_role")
-        for task in pending_tasks
-        if task.get("status") == "pending" and task.get("data", {}).get("target_role")
-    }
+    required_roles = store.pending_roles()
     if not required_roles:
         print("⏳ No tasks with specific target roles are pending. No role will be assigned.")
         return None, None
     
     print(f"📋 Roles required by pending tasks: {list(required_roles)}")
 
-    # 3. Read current role assignments from instructions
-    with open("agents/AGENT_INSTRUCTIONS.md", "r") as f:
-        content = f.read()
-
-    # 4. Find an available role that is also a required role
+    # 3. Find an available role that is also a required role
     if role_to_assign:
         roles_to_check = [role_to_assign]
     else:
-        roles_to_check = ['ARCHITECT', 'TERRAFORM_DEVELOPER', 'PLATFORM_ENGINEER', 'COMPLIANCE_ADMIN', 'FINOPS']
+        roles_to_check = AGENT_ROLES
 
     for role in roles_to_check:
-        # Check if the role is both required and available
-        if role in required_roles and f"{role}: AVAILABLE" in content:
-            # Assign this role
+        # Claim the role in the registry only if it is required and still AVAILABLE
+        if role in required_roles:
             terminal_id = f"terminal-{int(time.time() % 10000)}"
-            updated_content = content.replace(f"{role}: AVAILABLE", f"{role}: {terminal_id}", 1)
-            
-            with open("agents/AGENT_INSTRUCTIONS.md", "w") as f:
-                f.write(updated_content)
+            if not store.assign_role(role, terminal_id, datetime.now().isoformat()):
+                continue
             
             print(f"✅ ROLE ASSIGNED (based on pending tasks): {role}")
             print(f"🆔 Terminal ID: {terminal_id}")
@@ -64,11 +56,21 @@ def auto_assign_role(role_to_assign=None):
         print("❌ No available roles match the roles required for pending tasks.")
     return None, None
 
+def get_role_assignments():
+    """Show which terminal holds each role"""
+    roles = get_store().roles()
+    for role, entry in roles.items():
+        print(f"{role}: {entry['assigned_to'] or 'AVAILABLE'}")
+    return roles
+
+def release_role(role):
+    """Give up a role so another terminal can take it"""
+    get_store().release_role(role)
+    print(f"✅ {role} is AVAILABLE again")
+
 def get_pending_tasks():
     """Get all pending tasks"""
-    with open("agents/tasks.json", "r") as f:
-        tasks = json.load(f)
-    return tasks["pending_tasks"]
+    return get_store().pending_tasks()
 
 def initialize_agent(role_to_assign=None):
     """Complete agent initialization process"""
@@ -118,7 +120,7 @@ def initialize_agent(role_to_assign=None):
     print()
     
     # Step 4: Check MY tasks specifically
-    my_tasks = [t for t in all_tasks if t.get('data', {}).get('target_role') == role]
+    my_tasks = get_store().pending_tasks(role)
     
     if my_tasks:
         print(f"🎯 MY TASKS ({role}):")
@@ -134,53 +136,82 @@ def initialize_agent(role_to_assign=None):
     print()
     print("🔧 Available Commands:")
     print("  get_pending_tasks() - Get all pending tasks")
+    print("  get_role_assignments() - Show which terminal holds each role")
     print("  start_task(task_id) - Start working on a task")
+    print(f"  claim_next_task('{role}') - Claim the next pending task for my role")
+    print(f"  wait_for_task('{role}', timeout) - Block until a task for my role arrives")
     print("  complete_task(task_id, description, output) - Complete a task")
     print()
     
     return role, terminal_id
 
-def check_for_tasks():
-    """Check for new tasks from orchestrator"""
-    with open("agents/tasks.json", "r") as f:
-        tasks = json.load(f)
-    
-    current_task = tasks["current_task"]
-    if current_task and current_task["status"] == "pending":
-        print(f"📋 New task received: {current_task['description']}")
-        print(f"🔧 Type: {current_task['type']}")
-        print(f"📊 Task ID: {current_task['id']}")
-        print(f"📄 Data: {current_task.get('data', {})}")
-        return current_task
+def check_for_tasks(role=None):
+    """Check for the next pending task from orchestrator (optionally for one role)"""
+    next_task = get_store().next_pending(role)
+    if next_task:
+        print(f"📋 New task received: {next_task['description']}")
+        print(f"🔧 Type: {next_task['type']}")
+        print(f"📊 Task ID: {next_task['id']}")
+        print(f"📄 Data: {next_task.get('data', {})}")
+        return next_task
     else:
         print("⏳ No pending tasks")
         return None
 
+def wait_for_task(role=None, timeout=300):
+    """Block until a pending task for role exists; return it or None on timeout.
+    
+    Wakes up as soon as the orchestrator writes new state instead of polling.
+    """
+    store = get_store()
+    task = wait_until(store.state_dir, lambda: store.next_pending(role), timeout)
+    if task:
+        print(f"📋 New task received: {task['description']} (ID: {task['id']})")
+    else:
+        print(f"⏳ No pending tasks after {timeout}s")
+    return task
+
 def start_task(task_id):
     """Mark a task as started"""
-    # Update task status
-    with open("agents/tasks.json", "r") as f:
-        tasks = json.load(f)
-    
-    if tasks["current_task"] and tasks["current_task"]["id"] == task_id:
-        tasks["current_task"]["status"] = "in_progress"
-        tasks["current_task"]["started_at"] = datetime.now().isoformat()
-    
-    with open("agents/tasks.json", "w") as f:
-        json.dump(tasks, f, indent=2)
-    
-    # Update status
-    with open("agents/status.json", "r") as f:
-        status = json.load(f)
+    now = datetime.now().isoformat()
     
-    status["agent_status"] = "working"
-    status["last_update"] = datetime.now().isoformat()
+    # Claim the task and update agent status atomically
+    task = get_store().claim_task(
+        task_id,
+        {"started_at": now},
+        status={"agent_status": "working", "last_update": now}
+    )
     
-    with open("agents/status.json", "w") as f:
-        json.dump(status, f, indent=2)
+    if task is None:
+        print(f"⚠️ Task {task_id} is not pending (already started, finished or unknown)")
+        return
     
     print(f"▶️ Started working on task: {task_id}")
 
+def claim_next_task(role, terminal_id=None):
+    """Atomically claim the next pending task for a role: highest priority first, then oldest.
+    
+    Safe to call from any number of agents at once: each pending task is
+    handed to exactly one caller. Returns the claimed task or None.
+    """
+    now = datetime.now().isoformat()
+    fields = {"started_at": now}
+    if terminal_id:
+        fields["claimed_by"] = terminal_id
+    
+    task = get_store().claim_next(
+        role,
+        fields,
+        status={"agent_status": "working", "last_update": now}
+    )
+    
+    if task is None:
+        print(f"⏳ No pending tasks for {role}")
+        return None
+    
+    print(f"▶️ Claimed task: {task['description']} (ID: {task['id']})")
+    return task
+
 def complete_task(task_id, result_description, output=None, success=True):
     """Mark a task as completed and send results"""
     result = {
@@ -191,52 +222,40 @@ def complete_task(task_id, result_description, output=None, success=True):
         "timestamp": datetime.now().isoformat()
     }
     
-    # Update results
-    with open("agents/results.json", "r") as f:
-        results = json.load(f)
-    
-    results["latest_result"] = result
-    results["results_history"].append(result)
-    
-    with open("agents/results.json", "w") as f:
-        json.dump(results, f, indent=2)
-    
-    # Update task status
-    with open("agents/tasks.json", "r") as f:
-        tasks = json.load(f)
-    
-    if tasks["current_task"] and tasks["current_task"]["id"] == task_id:
-        tasks["current_task"]["status"] = "completed" if success else "failed"
-        tasks["current_task"]["completed_at"] = datetime.now().isoformat()
-        tasks["task_history"].append(tasks["current_task"])
-        tasks["current_task"] = None
-    
-    with open("agents/tasks.json", "w") as f:
-        json.dump(tasks, f, indent=2)
-    
-    # Update status
-    with open("agents/status.json", "r") as f:
-        status = json.load(f)
-    
-    status["agent_status"] = "idle"
-    status["current_task_id"] = None
-    status["last_update"] = datetime.now().isoformat()
-    
-    with open("agents/status.json", "w") as f:
-        json.dump(status, f, indent=2)
+    now = datetime.now().isoformat()
+    
+    # Record result, move the task to history and update status in one append
+    get_store().apply(
+        {"op": "result_add", "result": result},
+        {
+            "op": "task_finish",
+            "id": task_id,
+            "set": {
+                "status": "completed" if success else "failed",
+                "completed_at": now
+            }
+        },
+        {
+            "op": "status_set",
+            "set": {
+                "agent_status": "idle",
+                "current_task_id": None,
+                "last_update": now
+            }
+        }
+    )
     
     print(f"✅ Task completed: {result_description}")
 
 def get_current_task():
     """Get the current task details"""
-    with open("agents/tasks.json", "r") as f:
-        tasks = json.load(f)
+    current_task = get_store().current_task()
     
-    if tasks["current_task"]:
-        print(f"📋 Current task: {tasks['current_task']['description']}")
-        print(f"🔧 Status: {tasks['current_task']['status']}")
-        print(f"📊 ID: {tasks['current_task']['id']}")
-        return tasks["current_task"]
+    if current_task:
+        print(f"📋 Current task: {current_task['description']}")
+        print(f"🔧 Status: {current_task['status']}")
+        print(f"📊 ID: {current_task['id']}")
+        return current_task
     else:
         print("📭 No current task")
         return None
@@ -251,6 +270,8 @@ if __name__ == "__main__":
     print("Commands:")
     print("  check_for_tasks()")
     print("  start_task('task_id')")
+    print("  claim_next_task('ROLE')")
+    print("  wait_for_task('ROLE', timeout)")
     print("  complete_task('task_id', 'Generated terraform config', 'output_here')")
     print("  get_current_task()")
 
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Coordination Benchmark - Load-test the orchestrator/agent helpers
+
+Starts N orchestrator and M agent processes against a temporary agents/
+directory, drives send -> claim -> complete cycles and reports throughput,
+handoff latency, lost updates and state file sizes for each backend.
+
+Usage:
+    python agents/benchmark_coordination.py --orchestrators 2 --agents 8 --tasks 200
+    python agents/benchmark_coordination.py --backend sqlite --json results.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+
+from state_store import BACKENDS, ROLES, empty_documents, get_store
+
+
+def _quiet():
+    """Silence the helpers' progress output inside worker processes"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def orchestrator_worker(worker_id, tasks, rate, roles, start, reports):
+    import orchestrator_helper
+
+    interval = 1.0 / rate if rate else 0
+    sent = []
+    start.wait()
+    began = time.monotonic()
+    with _quiet():
+        for i in range(tasks):
+            if interval:
+                delay = began + i * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            task_id = orchestrator_helper.send_task(
+                "benchmark",
+                f"orchestrator {worker_id} task {i}",
+                {"target_role": roles[i % len(roles)], "sent_at": time.time()}
+            )
+            sent.append(task_id)
+    reports.put(("sent", worker_id, sent))
+
+
+def agent_worker(worker_id, start, stop, reports):
+    import agent_helper
+    from state_watch import wait_until
+
+    store = get_store()
+    claimed, handoff, cycle = [], [], []
+    start.wait()
+    with _quiet():
+        while not stop.is_set():
+            task = agent_helper.claim_next_task(None, f"bench-agent-{worker_id}")
+            if task is None:
+                wait_until(store.state_dir, lambda: store.next_pending(None), 0.2)
+                continue
+            claimed_at = time.time()
+            agent_helper.complete_task(task["id"], "benchmark result")
+            claimed.append(task["id"])
+            handoff.append(claimed_at - task["data"]["sent_at"])
+            cycle.append(time.time() - task["data"]["sent_at"])
+    reports.put(("claimed", worker_id, {"ids": claimed, "handoff": handoff, "cycle": cycle}))
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def state_sizes(state_dir):
+    """Bytes used by each top-level state file plus the history archive"""
+    sizes = {}
+    for entry in os.scandir(state_dir):
+        if entry.is_file() and not entry.name.endswith((".py", ".md", ".txt")):
+            sizes[entry.name] = entry.stat().st_size
+        elif entry.is_dir() and entry.name == "history":
+            sizes["history/"] = sum(f.stat().st_size for f in os.scandir(entry.path))
+    return sizes
+
+
+def run_backend(backend, args):
+    """Run one benchmark round against a fresh state directory"""
+    state_dir = tempfile.mkdtemp(prefix=f"agents-bench-{backend}-")
+    os.environ["AGENT_STATE_DIR"] = state_dir
+    os.environ["AGENT_STATE_BACKEND"] = backend
+    get_store(state_dir, backend).reset(empty_documents())
+
+    ctx = multiprocessing.get_context("spawn")
+    # Workers and this process meet at the barrier once imports are done,
+    # so interpreter start-up is not counted against the backend
+    start = ctx.Barrier(args.orchestrators + args.agents + 1)
+    stop, reports = ctx.Event(), ctx.Queue()
+    roles = [role for role in ROLES if role != "ORCHESTRATOR"]
+    orchestrators = [
+        ctx.Process(target=orchestrator_worker, args=(i, args.tasks, args.rate, roles, start, reports))
+        for i in range(args.orchestrators)
+    ]
+    agents = [ctx.Process(target=agent_worker, args=(i, start, stop, reports)) for i in range(args.agents)]
+    for process in orchestrators + agents:
+        process.start()
+
+    expected = args.orchestrators * args.tasks
+    store = get_store(state_dir, backend)
+    timeline = []
+    start.wait()
+    began = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - began
+        completed = store.task_counts()["completed"]
+        timeline.append({"t": round(elapsed, 2), "completed": completed, "sizes": state_sizes(state_dir)})
+        if completed >= expected or elapsed > args.timeout:
+            break
+        time.sleep(args.sample_interval)
+    elapsed = time.monotonic() - began
+    stop.set()
+
+    sent, claims, handoff, cycle = [], [], [], []
+    for _ in orchestrators + agents:
+        try:
+            kind, _, data = reports.get(timeout=30)
+        except queue.Empty:
+            break
+        if kind == "sent":
+            sent.extend(data)
+        else:
+            claims.extend(data["ids"])
+            handoff.extend(data["handoff"])
+            cycle.extend(data["cycle"])
+    for process in orchestrators + agents:
+        process.join(timeout=10)
+
+    # Every sent task must end up in history exactly once with a result
+    finished = {}
+    for task in store.query_history("tasks"):
+        finished[task["id"]] = finished.get(task["id"], 0) + 1
+    results = {result["task_id"] for result in store.query_history("results")}
+    report = {
+        "backend": backend,
+        "orchestrators": args.orchestrators,
+        "agents": args.agents,
+        "tasks_sent": len(sent),
+        "tasks_completed": len(claims),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_tps": round(len(claims) / elapsed, 1) if elapsed else None,
+        "handoff_p50_ms": _ms(percentile(handoff, 50)),
+        "handoff_p99_ms": _ms(percentile(handoff, 99)),
+        "cycle_p50_ms": _ms(percentile(cycle, 50)),
+        "cycle_p99_ms": _ms(percentile(cycle, 99)),
+        "lost_tasks": sum(1 for task_id in sent if task_id not in finished),
+        "lost_results": sum(1 for task_id in sent if task_id not in results),
+        "double_claims": len(claims) - len(set(claims)),
+        "duplicate_history": sum(count - 1 for count in finished.values()),
+        "final_sizes": timeline[-1]["sizes"],
+        "timeline": timeline
+    }
+    if args.keep:
+        report["state_dir"] = state_dir
+    else:
+        shutil.rmtree(state_dir, ignore_errors=True)
+    return report
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def print_report(report):
+    print(f"\n📊 Backend: {report['backend']} "
+          f"({report['orchestrators']} orchestrator(s), {report['agents']} agent(s))")
+    print(f"  Tasks: {report['tasks_completed']}/{report['tasks_sent']} completed "
+          f"in {report['elapsed_s']}s ({report['throughput_tps']} tasks/s)")
+    print(f"  Handoff latency: p50 {report['handoff_p50_ms']} ms, p99 {report['handoff_p99_ms']} ms")
+    print(f"  Send -> complete: p50 {report['cycle_p50_ms']} ms, p99 {report['cycle_p99_ms']} ms")
+    problems = {key: report[key] for key in ("lost_tasks", "lost_results", "double_claims", "duplicate_history")}
+    marker = "✅" if not any(problems.values()) else "❌"
+    print(f"  {marker} Lost/duplicate updates: " + ", ".join(f"{k}={v}" for k, v in problems.items()))
+    print("  File sizes over time:")
+    step = max(1, len(report["timeline"]) // 8)
+    for sample in report["timeline"][::step] + report["timeline"][-1:]:
+        total = sum(sample["sizes"].values())
+        largest = max(sample["sizes"].items(), key=lambda item: item[1], default=("-", 0))
+        print(f"    t={sample['t']:>6}s completed={sample['completed']:>5} "
+              f"total={total:>9} B largest={largest[0]} ({largest[1]} B)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark agent coordination state backends")
+    parser.add_argument("--orchestrators", type=int, default=1, help="orchestrator processes (N)")
+    parser.add_argument("--agents", type=int, default=4, help="agent processes (M)")
+    parser.add_argument("--tasks", type=int, default=200, help="tasks sent per orchestrator")
+    parser.add_argument("--rate", type=float, default=100, help="tasks/s per orchestrator (0 = burst)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), action="append",
+                        help="backend to run (repeatable; default: all)")
+    parser.add_argument("--timeout", type=float, default=120, help="give up after this many seconds")
+    parser.add_argument("--sample-interval", type=float, default=0.25, help="file size sampling period")
+    parser.add_argument("--json", metavar="PATH", help="also write the full reports as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary state directories")
+    args = parser.parse_args(argv)
+
+    reports = []
+    for backend in args.backend or sorted(BACKENDS):
+        print(f"🚀 Running {backend} backend...")
+        report = run_backend(backend, args)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n💾 Reports written to {args.json}")
+
+    lost = any(r["lost_tasks"] or r["lost_results"] or r["double_claims"] or r["duplicate_history"]
+               for r in reports)
+    return 1 if lost else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
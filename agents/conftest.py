@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Shared pytest fixtures for the agents test suite
+"""
+
+import pytest
+
+
+@pytest.fixture
+def fake_terraform(tmp_path, monkeypatch):
+    """Point the MCP server at private caches and record terraform commands instead of running them.
+
+    Returns the list of commands run; `plan -out=...` writes the plan file
+    so saved plans behave like real ones.
+    """
+    import terraform_mcp_server as srv
+    from terraform_cache import PlanCache, PlanTimings, StateSnapshots
+
+    monkeypatch.setattr(srv, "plan_cache", PlanCache(root=str(tmp_path / "cache" / "plans")))
+    monkeypatch.setattr(srv, "plan_timings", PlanTimings(path=str(tmp_path / "cache" / "timings.json")))
+    monkeypatch.setattr(srv, "state_snapshots", StateSnapshots())
+    monkeypatch.setattr(srv, "plan_baselines", {})
+    monkeypatch.setattr(srv, "symbol_indexes", {})
+    commands = []
+
+    async def run(cmd, working_dir=None, on_output=None, **kwargs):
+        commands.append(cmd[1:])
+        for arg in cmd:
+            if arg.startswith("-out="):
+                with open(arg[len("-out="):], "w") as f:
+                    f.write("saved plan")
+        return {"success": True, "returncode": 0, "stdout": "", "stderr": "", "command": " ".join(cmd)}
+
+    monkeypatch.setattr(srv, "run_terraform_command", run)
+    return commands
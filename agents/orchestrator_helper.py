@@ -3,42 +3,51 @@
 Orchestrator Helper - Use this in Terminal 1 (Gemini Code Orchestrator)
 """
 
-import json
 import time
 from datetime import datetime
 
+from state_store import DEPENDENCY_FAILED, cache_stats, get_store, new_task_id
+from state_watch import wait_until
+
 def get_orchestration_status():
     """Get current orchestration status and determine next steps"""
     try:
-        with open("agents/status.json", "r") as f:
-            status = json.load(f)
-        
-        with open("agents/tasks.json", "r") as f:
-            tasks = json.load(f)
-        
-        with open("agents/results.json", "r") as f:
-            results = json.load(f)
+        store = get_store()
+        status = store.status()
+        counts = store.task_counts()
         
         # Determine orchestration stage
-        pending_tasks = [t for t in tasks["pending_tasks"] if t["status"] == "pending"]
-        in_progress_tasks = [t for t in tasks["pending_tasks"] if t["status"] == "in_progress"]
-        completed_tasks = [t for t in tasks["task_history"] if t["status"] == "completed"]
+        pending_tasks = counts["pending"]
+        in_progress_tasks = counts["in_progress"]
+        blocked_tasks = counts["blocked"]
+        completed_tasks = counts["completed"]
         
-        if not pending_tasks and not in_progress_tasks and completed_tasks:
+        # Tasks that will never run because a dependency failed
+        dependency_failed = [
+            {"id": t["id"], "description": t["description"], "failed_dependency": t.get("failed_dependency")}
+            for t in store.query_history(status=DEPENDENCY_FAILED)
+        ]
+        
+        idle = not pending_tasks and not in_progress_tasks and not blocked_tasks
+        if idle and dependency_failed:
+            stage = "dependency_failures"
+        elif idle and completed_tasks:
             stage = "orchestration_complete"
         elif in_progress_tasks:
             stage = "work_in_progress"
-        elif pending_tasks:
+        elif pending_tasks or blocked_tasks:
             stage = "tasks_pending"
         else:
             stage = "ready_for_tasks"
         
         return {
             "stage": stage,
-            "pending_tasks": len(pending_tasks),
-            "in_progress_tasks": len(in_progress_tasks),
-            "completed_tasks": len(completed_tasks),
-            "latest_result": results.get("latest_result"),
+            "pending_tasks": pending_tasks,
+            "in_progress_tasks": in_progress_tasks,
+            "blocked_tasks": blocked_tasks,
+            "completed_tasks": completed_tasks,
+            "dependency_failed_tasks": dependency_failed,
+            "latest_result": store.latest_result(),
             "orchestrator_status": status.get("orchestrator_status", "unknown")
         }
     except FileNotFoundError:
@@ -55,7 +64,10 @@ def resume_orchestration():
     print(f"📊 Current Stage: {status['stage']}")
     print(f"⏳ Pending Tasks: {status['pending_tasks']}")
     print(f"🔄 In Progress: {status['in_progress_tasks']}")
+    print(f"🔗 Blocked on dependencies: {status.get('blocked_tasks', 0)}")
     print(f"✅ Completed: {status['completed_tasks']}")
+    for task in status.get("dependency_failed_tasks", []):
+        print(f"⛔ Not run, dependency {task['failed_dependency']} failed: {task['description']} (ID: {task['id']})")
     print()
     
     # Handle different orchestration stages
@@ -75,6 +87,11 @@ def resume_orchestration():
         print("  • start_new_orchestration() - Begin new project")
         print("  • send_task() - Add additional tasks")
         
+    elif status["stage"] == "dependency_failures":
+        print("⛔ DEPENDENCY FAILURES")
+        print("Some tasks were not run because a task they depend on failed.")
+        print("💡 Fix the failed work, then send_task()/send_tasks() the skipped tasks again")
+        
     elif status["stage"] == "work_in_progress":
         print("🔄 WORK IN PROGRESS")
         print("Some tasks are currently being worked on by agents.")
@@ -97,8 +114,13 @@ def resume_orchestration():
     print("🔧 Available Commands:")
     print("  get_orchestration_status() - Check current progress")
     print("  send_task(type, description, data) - Add new tasks")
+    print("  send_tasks(plan) - Submit a dependency-ordered plan in one write")
     print("  check_results() - View completed work")
+    print("  get_task(task_id) - Look up any task by ID")
+    print("  query_history(role, status, since, limit) - Search finished tasks")
+    print("  wait_for_result(task_id, timeout) - Block until a task's result arrives")
     print("  get_status() - Check agent status")
+    print("  cache_stats() - Show state cache hit/miss counters")
     print("  start_new_orchestration() - Begin fresh project")
     
     return status
@@ -107,29 +129,24 @@ def initialize_clean_slate():
     """Initialize clean slate for new orchestration"""
     print("🧹 INITIALIZING CLEAN SLATE...")
     
-    # Clear tasks
-    with open("agents/tasks.json", "w") as f:
-        json.dump({
+    # Clear tasks, results and status, and drop the journal
+    get_store().reset({
+        "tasks": {
             "current_task": None,
             "pending_tasks": [],
             "task_history": []
-        }, f, indent=2)
-    
-    # Clear results  
-    with open("agents/results.json", "w") as f:
-        json.dump({
+        },
+        "results": {
             "latest_result": None,
             "results_history": []
-        }, f, indent=2)
-    
-    # Clear status
-    with open("agents/status.json", "w") as f:
-        json.dump({
+        },
+        "status": {
             "orchestrator_status": "initialized",
             "agent_status": "idle",
             "last_update": datetime.now().isoformat(),
             "current_task_id": None
-        }, f, indent=2)
+        }
+    })
     
     print("✅ Clean slate initialized")
 
@@ -142,94 +159,186 @@ def start_new_orchestration():
     initialize_clean_slate()
     
     # Reset role assignments to AVAILABLE
-    with open("agents/AGENT_INSTRUCTIONS.md", "r") as f:
-        content = f.read()
-    
-    # Reset all roles to AVAILABLE
-    roles = ['ORCHESTRATOR', 'ARCHITECT', 'TERRAFORM_DEVELOPER', 'PLATFORM_ENGINEER', 'COMPLIANCE_ADMIN', 'FINOPS']
-    
-    import re
-    for role in roles:
-        # This regex finds the role and whatever it is assigned to, and replaces it with AVAILABLE
-        content = re.sub(f"({role}: ).*", f"\\1AVAILABLE", content)
-    
-    with open("agents/AGENT_INSTRUCTIONS.md", "w") as f:
-        f.write(content)
+    get_store().reset_roles()
     
     print("✅ New orchestration started - all roles reset to AVAILABLE")
     print("🎯 System ready for new project")
 
+def claim_orchestrator_role(terminal_id=None):
+    """Claim the ORCHESTRATOR role in the role registry"""
+    terminal_id = terminal_id or f"terminal-{int(time.time() % 10000)}"
+    if get_store().assign_role("ORCHESTRATOR", terminal_id, datetime.now().isoformat()):
+        print(f"✅ ROLE ASSIGNED: ORCHESTRATOR ({terminal_id})")
+        return terminal_id
+    print("❌ ORCHESTRATOR role is already assigned")
+    return None
+
 def update_orchestrator_status(status_value):
     """Update orchestrator status"""
-    try:
-        with open("agents/status.json", "r") as f:
-            status = json.load(f)
-    except FileNotFoundError:
-        status = {}
-    
-    status["orchestrator_status"] = status_value
-    status["last_update"] = datetime.now().isoformat()
-    
-    with open("agents/status.json", "w") as f:
-        json.dump(status, f, indent=2)
+    get_store().apply({
+        "op": "status_set",
+        "set": {
+            "orchestrator_status": status_value,
+            "last_update": datetime.now().isoformat()
+        }
+    })
 
-def send_task(task_type, description, data=None):
-    """Send a task to the agent"""
+def send_task(task_type, description, data=None, priority=0):
+    """Send a task to the agent (higher priority tasks are claimed first)"""
     task = {
-        "id": str(int(time.time())),
+        "id": new_task_id(),
         "type": task_type,
         "description": description,
         "data": data or {},
+        "priority": priority,
         "timestamp": datetime.now().isoformat(),
         "status": "pending"
     }
     
-    # Read current tasks
-    with open("agents/tasks.json", "r") as f:
-        tasks = json.load(f)
+    # Add new task and update status in one journal append
+    get_store().apply(
+        {"op": "task_add", "task": task, "current": True},
+        {
+            "op": "status_set",
+            "set": {
+                "orchestrator_status": "task_sent",
+                "current_task_id": task["id"],
+                "last_update": datetime.now().isoformat()
+            }
+        }
+    )
     
-    # Add new task
-    tasks["current_task"] = task
-    tasks["pending_tasks"].append(task)
+    print(f"✅ Task sent: {task['description']}")
+    print(f"📋 Task ID: {task['id']}")
+    return task["id"]
+
+def send_tasks(plan):
+    """Submit a whole plan of tasks in one write.
     
-    # Write back
-    with open("agents/tasks.json", "w") as f:
-        json.dump(tasks, f, indent=2)
+    Each item is a dict with "type", "description" and optionally "data",
+    "priority", "key" and "depends_on". depends_on entries refer to another
+    item by its "key" or list index, or to an existing task ID; anything
+    else raises ValueError. Tasks start "blocked" until every dependency
+    completes; complete_task() releases them, so independent branches (e.g.
+    COMPLIANCE_ADMIN and FINOPS after TERRAFORM_DEVELOPER) can run in
+    parallel. If a dependency fails (now or already), its dependents are
+    finished as "dependency_failed" and listed by get_orchestration_status().
+    Returns the task IDs in plan order.
+    """
+    store = get_store()
+    now = datetime.now().isoformat()
+    keys = {}
+    for i, item in enumerate(plan):
+        if "key" in item:
+            keys[item["key"]] = i
     
-    # Update status
-    with open("agents/status.json", "r") as f:
-        status = json.load(f)
+    def resolve(ref):
+        if isinstance(ref, int):
+            if not 0 <= ref < len(plan):
+                raise ValueError(f"depends_on index out of range: {ref}")
+            return ref
+        if ref in keys:
+            return keys[ref]
+        if store.get_task(ref) is None:
+            raise ValueError(f"depends_on {ref!r} is neither a plan key nor a known task ID")
+        return ref
     
-    status["orchestrator_status"] = "task_sent"
-    status["current_task_id"] = task["id"]
-    status["last_update"] = datetime.now().isoformat()
+    ids = [new_task_id() for _ in plan]
+    edges = [[resolve(ref) for ref in item.get("depends_on", [])] for item in plan]
     
-    with open("agents/status.json", "w") as f:
-        json.dump(status, f, indent=2)
+    # Order the plan so every task is added after the tasks it depends on
+    order, state = [], {}
+    def visit(i):
+        if state.get(i) == "done":
+            return
+        if state.get(i) == "visiting":
+            raise ValueError(f"Dependency cycle involving {plan[i]['description']!r}")
+        state[i] = "visiting"
+        for dep in edges[i]:
+            if isinstance(dep, int):
+                visit(dep)
+        state[i] = "done"
+        order.append(i)
+    for i in range(len(plan)):
+        visit(i)
     
-    print(f"✅ Task sent: {task['description']}")
-    print(f"📋 Task ID: {task['id']}")
-    return task["id"]
+    ops = []
+    for i in order:
+        item = plan[i]
+        ops.append({"op": "task_add", "task": {
+            "id": ids[i],
+            "type": item["type"],
+            "description": item["description"],
+            "data": item.get("data") or {},
+            "priority": item.get("priority", 0),
+            "depends_on": [ids[dep] if isinstance(dep, int) else dep for dep in edges[i]],
+            "timestamp": now,
+            "status": "pending"
+        }})
+    ops.append({
+        "op": "status_set",
+        "set": {"orchestrator_status": "plan_sent", "last_update": now}
+    })
+    store.apply(*ops)
+    
+    print(f"✅ Plan sent: {len(plan)} task(s)")
+    for i, item in enumerate(plan):
+        deps = ", ".join(ids[d] if isinstance(d, int) else d for d in edges[i])
+        print(f"  📋 {ids[i]}: {item['description']}" + (f" (after {deps})" if deps else ""))
+    return ids
+
+def get_task(task_id):
+    """Look up any task (queued, finished or archived) by ID"""
+    task = get_store().get_task(task_id)
+    if task:
+        print(f"📋 {task['description']} [{task.get('status')}] (ID: {task['id']})")
+    else:
+        print(f"❓ No task with ID {task_id}")
+    return task
 
 def check_results():
     """Check for results from the agent"""
-    with open("agents/results.json", "r") as f:
-        results = json.load(f)
-    
-    if results["latest_result"]:
-        print(f"📥 Latest result: {results['latest_result']['description']}")
-        print(f"🔧 Status: {results['latest_result']['status']}")
-        if results["latest_result"]["output"]:
-            print(f"📄 Output: {results['latest_result']['output']}")
-        return results["latest_result"]
+    latest_result = get_store().latest_result()
+    
+    if latest_result:
+        print(f"📥 Latest result: {latest_result['description']}")
+        print(f"🔧 Status: {latest_result['status']}")
+        if latest_result["output"]:
+            print(f"📄 Output: {latest_result['output']}")
+        return latest_result
     else:
         print("⏳ No results yet")
         return None
 
+def wait_for_result(task_id, timeout=300):
+    """Block until an agent reports a result for task_id; return it or None on timeout"""
+    store = get_store()
+    result = wait_until(store.state_dir, lambda: store.result_for(task_id), timeout)
+    if result:
+        print(f"📥 Result for {task_id}: {result['description']}")
+        print(f"🔧 Status: {result['status']}")
+    else:
+        print(f"⏳ No result for {task_id} after {timeout}s")
+    return result
+
+def query_history(role=None, status=None, since=None, limit=20, kind="tasks", until=None):
+    """Query finished tasks (or results with kind="results"), newest first.
+    
+    Older history is rotated into compressed segments under agents/history/;
+    only segments that can match role/status/since/until are read.
+    """
+    entries = get_store().query_history(
+        kind, role=role, status=status, since=since, until=until, limit=limit
+    )
+    for entry in entries:
+        when = entry.get("completed_at") or entry.get("timestamp")
+        print(f"  [{entry.get('status')}] {entry.get('description')} ({when})")
+    print(f"📚 {len(entries)} {kind} matched")
+    return entries
+
 def get_status():
     """Get current status of both agents"""
-    with open("agents/status.json", "r") as f:
-        status = json.load(f)
+    status = get_store().status()
     
     print(f"🎯 Orchestrator: {status['orchestrator_status']}")
     print(f"🤖 Agent: {status['agent_status']}")
@@ -241,5 +350,7 @@ if __name__ == "__main__":
     print("🎯 Orchestrator Helper - Terminal 1")
     print("Commands:")
     print("  send_task(task_type, description, data)")
+    print("  send_tasks([{'type', 'description', 'data', 'key', 'depends_on'}, ...])")
     print("  check_results()")
+    print("  wait_for_result(task_id, timeout)")
     print("  get_status()")
\ No newline at end of file
@@ -0,0 +1,1392 @@
+#!/usr/bin/env python3
+"""
+State Store - Shared persistence layer for orchestrator_helper and agent_helper
+
+Two backends are available, selected with AGENT_STATE_BACKEND:
+
+json (default)
+    tasks.json, results.json and status.json are snapshots. Every state change
+    is appended as a single line to journal.jsonl; readers fold the journal on
+    top of the snapshots. Once the journal grows past
+    AGENT_JOURNAL_COMPACT_BYTES it is folded back into the snapshots and
+    truncated.
+
+sqlite
+    All state lives in state.db (WAL mode) with indexed id, status and
+    target_role columns, so several agent terminals can read and write
+    concurrently and lookups are index queries instead of list scans.
+"""
+
+import gzip
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+# Directory holding the coordination files (relative to the project root)
+STATE_DIR = os.getenv("AGENT_STATE_DIR", "agents")
+
+# "json" (snapshots + journal) or "sqlite"
+BACKEND = os.getenv("AGENT_STATE_BACKEND", "json")
+
+# Journal size that triggers folding it back into the snapshots
+COMPACT_BYTES = int(os.getenv("AGENT_JOURNAL_COMPACT_BYTES", str(64 * 1024)))
+
+SNAPSHOT_FILES = {
+    "tasks": "tasks.json",
+    "results": "results.json",
+    "status": "status.json",
+    "roles": "roles.json",
+}
+
+# Snapshots that must exist for the orchestration to count as initialized
+REQUIRED_SNAPSHOTS = ("tasks", "results", "status")
+
+# Finished tasks/results kept in the live state; older ones are rotated into
+# compressed segments once HISTORY_SEGMENT_SIZE more have accumulated
+HISTORY_HOT_LIMIT = int(os.getenv("AGENT_HISTORY_HOT_LIMIT", "200"))
+HISTORY_SEGMENT_SIZE = int(os.getenv("AGENT_HISTORY_SEGMENT_SIZE", "200"))
+
+JOURNAL_FILE = "journal.jsonl"
+LOCK_FILE = ".state.lock"
+DATABASE_FILE = "state.db"
+HISTORY_DIR = "history"
+
+# Status of a task that can no longer run because a dependency finished
+# without completing (failed, or itself dependency_failed)
+DEPENDENCY_FAILED = "dependency_failed"
+
+ROLES = ['ORCHESTRATOR', 'ARCHITECT', 'TERRAFORM_DEVELOPER', 'PLATFORM_ENGINEER', 'COMPLIANCE_ADMIN', 'FINOPS']
+
+
+class StateNotInitialized(FileNotFoundError):
+    """Raised when no orchestration state exists yet"""
+
+
+# Parsed-state cache counters, shared by every store
+CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def file_signature(path):
+    """Return (inode, mtime_ns, size) for path, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def cache_stats():
+    """Return parsed-state cache hit/miss counters and the hit rate"""
+    total = CACHE_STATS["hits"] + CACHE_STATS["misses"]
+    return dict(CACHE_STATS, hit_rate=CACHE_STATS["hits"] / total if total else 0.0)
+
+
+# Crockford base32, as used by ULIDs
+_ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ulid_lock = threading.Lock()
+_ulid_last = [0, 0]
+
+
+def new_task_id():
+    """Return a new ULID-style task ID.
+
+    26 characters: 48 bits of millisecond timestamp followed by 80 random
+    bits. IDs sort lexicographically by creation time, never collide across
+    processes in practice, and stay strictly increasing within a process
+    even when many are minted in the same millisecond.
+    """
+    with _ulid_lock:
+        now_ms = int(time.time() * 1000)
+        if now_ms <= _ulid_last[0]:
+            now_ms = _ulid_last[0]
+            randomness = _ulid_last[1] + 1
+        else:
+            randomness = int.from_bytes(os.urandom(10), "big")
+        _ulid_last[0], _ulid_last[1] = now_ms, randomness
+    value = (now_ms << 80) | (randomness & ((1 << 80) - 1))
+    chars = []
+    for _ in range(26):
+        chars.append(_ULID_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def default_roles():
+    """Return a role registry with every role AVAILABLE"""
+    return {role: {"assigned_to": None, "assigned_at": None} for role in ROLES}
+
+
+def empty_documents():
+    """Return the documents of a freshly initialized orchestration"""
+    return {
+        "tasks": {
+            "current_task": None,
+            "pending_tasks": [],
+            "task_history": []
+        },
+        "results": {
+            "latest_result": None,
+            "results_history": []
+        },
+        "status": {},
+        "roles": default_roles()
+    }
+
+
+def task_role(task):
+    return task.get("data", {}).get("target_role")
+
+
+def by_priority(tasks):
+    """Order tasks by descending priority, oldest first within a priority (stable sort)"""
+    return sorted(tasks, key=lambda t: -t.get("priority", 0))
+
+
+class TaskIndex:
+    """Lookup tables derived from the tasks document (never persisted).
+
+    Keeps tasks by id and per target_role queues, running status counts and
+    the reverse dependency edges, so "my tasks", "which roles have work",
+    task counts and releasing dependents do not scan the whole queue and
+    history.
+
+    Pending tasks are also kept in per-role heaps (plus one over all roles)
+    keyed by (-priority, arrival), so next_pending does not re-sort the
+    queue on every claim. Entries are invalidated lazily: each time a task
+    becomes pending it gets a new generation, and heap entries for an older
+    generation or for a task that is no longer pending are dropped when
+    they reach the top.
+    """
+
+    def __init__(self, tasks, archived_completed=0, archive=None):
+        self.archive = archive
+        self.by_id = {}
+        self.by_role = {}
+        self.waiting = {}
+        self.dependents = {}
+        self.history_by_id = {task["id"]: task for task in tasks["task_history"]}
+        self.counts = {"pending": 0, "in_progress": 0, "blocked": 0, "completed": 0}
+        self.heaps = {}
+        self.all_pending = []
+        self.arrival = {}
+        self.generation = {}
+        self._seq = 0
+        for task in tasks["pending_tasks"]:
+            self.add(task)
+        self.counts["completed"] = archived_completed + sum(
+            1 for t in tasks["task_history"] if t.get("status") == "completed"
+        )
+
+    def _count(self, task, delta):
+        status = task.get("status")
+        if status in ("pending", "in_progress", "blocked"):
+            self.counts[status] += delta
+        if status == "pending":
+            role = task_role(task)
+            self.waiting[role] = self.waiting.get(role, 0) + delta
+
+    def _enqueue(self, task):
+        """Push a heap entry for task if it is pending (re-pushed on every change)"""
+        if task.get("status") != "pending":
+            return
+        self._seq += 1
+        self.generation[task["id"]] = self._seq
+        entry = (-task.get("priority", 0), self.arrival[task["id"]], self._seq, task["id"])
+        heapq.heappush(self.heaps.setdefault(task_role(task), []), entry)
+        heapq.heappush(self.all_pending, entry)
+
+    def add(self, task):
+        self.by_id[task["id"]] = task
+        self.by_role.setdefault(task_role(task), {})[task["id"]] = task
+        for dep_id in task.get("waiting_on", []):
+            self.dependents.setdefault(dep_id, []).append(task["id"])
+        self._count(task, 1)
+        self._seq += 1
+        self.arrival[task["id"]] = self._seq
+        self._enqueue(task)
+
+    def remove(self, task):
+        del self.by_id[task["id"]]
+        del self.by_role[task_role(task)][task["id"]]
+        del self.arrival[task["id"]]
+        self.generation.pop(task["id"], None)
+        self._count(task, -1)
+
+    def update(self, task, fields):
+        self._count(task, -1)
+        task.update(fields)
+        self._count(task, 1)
+        self._enqueue(task)
+
+    def finish(self, task, fields):
+        self.remove(task)
+        task.update(fields)
+        self.history_by_id[task["id"]] = task
+        if task.get("status") == "completed":
+            self.counts["completed"] += 1
+
+    def finished_task(self, task_id):
+        """The task if it already left the queue (hot history or archive), else None"""
+        task = self.history_by_id.get(task_id)
+        if task is None and self.archive is not None:
+            task = self.archive.find_task(task_id)
+        return task
+
+    def release(self, task_id):
+        """Unblock tasks whose last unfinished dependency was task_id"""
+        for dependent_id in self.dependents.pop(task_id, []):
+            dependent = self.by_id.get(dependent_id)
+            if dependent is None or task_id not in dependent.get("waiting_on", []):
+                continue
+            dependent["waiting_on"].remove(task_id)
+            if not dependent["waiting_on"] and dependent.get("status") == "blocked":
+                self.update(dependent, {"status": "pending"})
+
+    def roles_waiting(self):
+        return {role for role, count in self.waiting.items() if count and role}
+
+    def queue(self, role=None):
+        """Open tasks for role (all roles if None) in claim order"""
+        tasks = self.by_id.values() if role is None else self.by_role.get(role, {}).values()
+        return by_priority(tasks)
+
+    def next_pending(self, role=None):
+        if role is not None and not self.waiting.get(role):
+            return None
+        heap = self.all_pending if role is None else self.heaps.get(role, [])
+        while heap:
+            _, _, generation, task_id = heap[0]
+            task = self.by_id.get(task_id)
+            if task is not None and task.get("status") == "pending" and self.generation.get(task_id) == generation:
+                return task
+            heapq.heappop(heap)
+        return None
+
+
+def _has_result(history, result):
+    # Results are appended in timestamp order, so only the tail can match
+    for existing in reversed(history):
+        if existing == result:
+            return True
+        if existing.get("timestamp", "") < result.get("timestamp", ""):
+            return False
+    return False
+
+
+def _dependency_failed(task_id, dep_id, completed_at):
+    """task_finish op for a task whose dependency dep_id did not complete"""
+    return {"op": "task_finish", "id": task_id, "set": {
+        "status": DEPENDENCY_FAILED,
+        "failed_dependency": dep_id,
+        "completed_at": completed_at
+    }}
+
+
+def apply_op(docs, index, op):
+    """Apply a single journal operation to the in-memory documents and index.
+
+    Operations are idempotent so replaying a journal that was already folded
+    into the snapshots (e.g. after a crash mid-compaction) is harmless: tasks
+    that already finished are neither re-queued nor archived twice.
+
+    A task whose dependency finished without completing is finished as
+    DEPENDENCY_FAILED, whether the dependency failed before or after the
+    task was added; this cascades to that task's own dependents.
+    """
+    tasks, results, status = docs["tasks"], docs["results"], docs["status"]
+    kind = op["op"]
+
+    if kind == "task_add":
+        task = op["task"]
+        if index.finished_task(task["id"]) is not None:
+            return
+        failed_dep = None
+        if task.get("depends_on"):
+            # Only dependencies that are still open hold the task back
+            task["waiting_on"] = [d for d in task["depends_on"] if d in index.by_id]
+            if task["waiting_on"] and task.get("status") == "pending":
+                task["status"] = "blocked"
+            for dep_id in task["depends_on"]:
+                finished = None if dep_id in index.by_id else index.finished_task(dep_id)
+                if finished is not None and finished.get("status") != "completed":
+                    failed_dep = dep_id
+                    break
+        existing = index.by_id.get(task["id"])
+        if existing is not None:
+            index.remove(existing)
+            tasks["pending_tasks"].remove(existing)
+        tasks["pending_tasks"].append(task)
+        index.add(task)
+        if op.get("current"):
+            tasks["current_task"] = task
+        if failed_dep is not None:
+            apply_op(docs, index, _dependency_failed(task["id"], failed_dep, task.get("timestamp")))
+
+    elif kind == "task_update":
+        task = index.by_id.get(op["id"])
+        if task is not None:
+            index.update(task, op["set"])
+
+    elif kind == "task_finish":
+        task = index.by_id.get(op["id"])
+        if task is not None and index.finished_task(task["id"]) is None:
+            index.finish(task, op["set"])
+            if task.get("status") == "completed":
+                index.release(task["id"])
+            tasks["pending_tasks"].remove(task)
+            tasks["task_history"].append(task)
+            current = tasks.get("current_task")
+            if current is not None and current["id"] == task["id"]:
+                tasks["current_task"] = None
+            if task.get("status") != "completed":
+                for dependent_id in index.dependents.pop(task["id"], []):
+                    apply_op(docs, index, _dependency_failed(
+                        dependent_id, task["id"], task.get("completed_at")))
+
+    elif kind == "result_add":
+        result = op["result"]
+        if not _has_result(results["results_history"], result):
+            results["results_history"].append(result)
+        results["latest_result"] = result
+
+    elif kind == "status_set":
+        status.update(op["set"])
+
+    elif kind == "role_set":
+        docs["roles"][op["role"]] = {
+            "assigned_to": op["assigned_to"],
+            "assigned_at": op.get("assigned_at")
+        }
+
+    elif kind == "roles_reset":
+        docs["roles"] = default_roles()
+
+    else:
+        raise ValueError(f"Unknown journal operation: {kind}")
+
+
+def _link_current_task(tasks, index):
+    """Make current_task and its pending_tasks entry the same object again"""
+    current = tasks.get("current_task")
+    if current is not None:
+        linked = index.by_id.get(current.get("id"))
+        if linked is not None:
+            tasks["current_task"] = linked
+
+
+def history_time(entry):
+    """Timestamp used to order a finished task or result in history"""
+    return entry.get("completed_at") or entry.get("timestamp") or ""
+
+
+class HistoryArchive:
+    """Gzip-compressed, time-ordered segments of rotated task/result history.
+
+    history/index.json lists every segment with its time range and per-role
+    and per-status counts, so queries only open the segments that can match.
+    Callers must hold the store's write lock while rotating or clearing.
+    """
+
+    def __init__(self, state_dir):
+        self.directory = os.path.join(state_dir, HISTORY_DIR)
+        self.index_path = os.path.join(self.directory, "index.json")
+        self._index_cache = (None, [])
+
+    def signature(self):
+        """Signature of index.json; it changes whenever a segment is added or cleared"""
+        return file_signature(self.index_path)
+
+    def segments(self, kind=None):
+        """Return the segment index, oldest first"""
+        signature = file_signature(self.index_path)
+        if signature is None:
+            segments = []
+        elif signature == self._index_cache[0]:
+            segments = self._index_cache[1]
+        else:
+            with open(self.index_path, "r") as f:
+                segments = json.load(f)["segments"]
+            self._index_cache = (signature, segments)
+        return [seg for seg in segments if kind is None or seg["kind"] == kind]
+
+    def count(self, kind, status=None):
+        """Number of archived entries of kind, optionally with one status"""
+        if status is None:
+            return sum(seg["count"] for seg in self.segments(kind))
+        return sum(seg["statuses"].get(status, 0) for seg in self.segments(kind))
+
+    def archived_through(self, kind):
+        """Highest store sequence number archived for kind (0 if none recorded)"""
+        return max((seg.get("through", 0) for seg in self.segments(kind)), default=0)
+
+    def append_segment(self, kind, entries, through=None):
+        """Write entries (oldest first) to a new segment and index it.
+
+        through is the highest store sequence number in the segment, for
+        backends that must tell archived rows apart from live ones.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        segments = self.segments()
+        number = segments[-1]["number"] + 1 if segments else 1
+        filename = f"{kind}-{number:06d}.jsonl.gz"
+        with gzip.open(os.path.join(self.directory, filename), "wt") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+        id_key = "id" if kind == "tasks" else "task_id"
+        ids = [str(entry.get(id_key)) for entry in entries]
+        roles, statuses = {}, {}
+        for entry in entries:
+            role = task_role(entry) if kind == "tasks" else None
+            roles[role or ""] = roles.get(role or "", 0) + 1
+            status = entry.get("status") or ""
+            statuses[status] = statuses.get(status, 0) + 1
+        segments = segments + [{
+            "number": number,
+            "kind": kind,
+            "file": filename,
+            "count": len(entries),
+            "first_time": history_time(entries[0]),
+            "last_time": history_time(entries[-1]),
+            "min_id": min(ids),
+            "max_id": max(ids),
+            "roles": roles,
+            "statuses": statuses
+        }]
+        if through is not None:
+            segments[-1]["through"] = through
+        tmp_path = f"{self.index_path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump({"segments": segments}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def rotate(self, kind, history):
+        """Move all but the newest HISTORY_HOT_LIMIT entries out of history.
+
+        Rotation waits until a full segment's worth of entries has piled up,
+        so segments stay reasonably sized. Returns the number rotated.
+        """
+        if len(history) < HISTORY_HOT_LIMIT + HISTORY_SEGMENT_SIZE:
+            return 0
+        cut = len(history) - HISTORY_HOT_LIMIT
+        self.append_segment(kind, history[:cut])
+        del history[:cut]
+        return cut
+
+    def clear(self):
+        """Drop every archived segment"""
+        for seg in self.segments():
+            try:
+                os.remove(os.path.join(self.directory, seg["file"]))
+            except FileNotFoundError:
+                pass
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+    def find_task(self, task_id):
+        """Look up an archived task, opening only segments whose ID range covers it"""
+        for seg in reversed(self.segments("tasks")):
+            if "min_id" in seg and not seg["min_id"] <= task_id <= seg["max_id"]:
+                continue
+            with gzip.open(os.path.join(self.directory, seg["file"]), "rt") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get("id") == task_id:
+                        return entry
+        return None
+
+    def query(self, kind, role=None, status=None, since=None, until=None):
+        """Yield archived entries newest first, opening only matching segments"""
+        for seg in reversed(self.segments(kind)):
+            if since is not None and seg["last_time"] < since:
+                # Segments are time-ordered, so every older one is out of range too
+                break
+            if until is not None and seg["first_time"] > until:
+                continue
+            if role is not None and not seg["roles"].get(role):
+                continue
+            if status is not None and not seg["statuses"].get(status):
+                continue
+            with gzip.open(os.path.join(self.directory, seg["file"]), "rt") as f:
+                entries = [json.loads(line) for line in f]
+            for entry in reversed(entries):
+                if _history_match(entry, role, status, since, until):
+                    yield entry
+
+
+def _history_match(entry, role, status, since, until=None):
+    if role is not None and task_role(entry) != role:
+        return False
+    if status is not None and entry.get("status") != status:
+        return False
+    if since is not None and history_time(entry) < since:
+        return False
+    if until is not None and history_time(entry) > until:
+        return False
+    return True
+
+
+def query_history_entries(hot, archive, kind, role=None, status=None, since=None,
+                          until=None, limit=None):
+    """Filter the hot window (oldest first) and then the archive, newest first"""
+    if kind == "results" and role is not None:
+        raise ValueError("Results have no target_role; query kind='tasks' to filter by role")
+    if isinstance(since, datetime):
+        since = since.isoformat()
+    if isinstance(until, datetime):
+        until = until.isoformat()
+    matches = []
+    for entry in reversed(hot):
+        if _history_match(entry, role, status, since, until):
+            matches.append(entry)
+            if limit is not None and len(matches) >= limit:
+                return matches
+    for entry in archive.query(kind, role, status, since, until):
+        matches.append(entry)
+        if limit is not None and len(matches) >= limit:
+            break
+    return matches
+
+
+class JournalStore:
+    """Snapshot + append-only journal backend"""
+
+    def __init__(self, state_dir=None):
+        self.state_dir = state_dir or STATE_DIR
+        self.journal_path = os.path.join(self.state_dir, JOURNAL_FILE)
+        self.lock_path = os.path.join(self.state_dir, LOCK_FILE)
+        self.archive = HistoryArchive(self.state_dir)
+        # Last fold: snapshot signatures, journal inode/offset, documents and index
+        self._folded = None
+
+    def _path(self, name):
+        return os.path.join(self.state_dir, SNAPSHOT_FILES[name])
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """Hold the state lock: shared for reads/appends, exclusive for compaction"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+        finally:
+            os.close(fd)
+
+    def _snapshot_signatures(self):
+        return tuple(file_signature(self._path(name)) for name in SNAPSHOT_FILES)
+
+    def _read_snapshots(self):
+        docs = empty_documents()
+        for name in SNAPSHOT_FILES:
+            try:
+                with open(self._path(name), "r") as f:
+                    docs[name] = json.load(f)
+            except FileNotFoundError:
+                pass
+        return docs
+
+    def _read_journal(self, offset=0):
+        """Return (ops, end offset) for the complete journal lines past offset"""
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        # A trailing partial line is an append still in flight; leave it
+        complete = data.rfind(b"\n") + 1
+        ops = []
+        for line in data[:complete].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn write from a crashed process
+                continue
+            ops.extend(entry["ops"])
+        return ops, offset + complete
+
+    def _fold(self, missing_ok=False):
+        """Return the folded state, reusing the cached fold when possible.
+
+        The snapshots are validated by (inode, mtime_ns, size). The journal is
+        append-only between compactions, so only bytes past the cached offset
+        need to be read and applied.
+        """
+        signatures = self._snapshot_signatures()
+        if not missing_ok:
+            for name, signature in zip(SNAPSHOT_FILES, signatures):
+                if signature is None and name in REQUIRED_SNAPSHOTS:
+                    raise StateNotInitialized(f"State file not found: {self._path(name)}")
+
+        journal_sig = file_signature(self.journal_path)
+        cached = self._folded
+        if (cached is not None and cached["snapshots"] == signatures
+                and journal_sig is not None and cached["journal_ino"] == journal_sig[0]
+                and journal_sig[2] >= cached["offset"]):
+            if journal_sig[2] > cached["offset"]:
+                ops, cached["offset"] = self._read_journal(cached["offset"])
+                for op in ops:
+                    apply_op(cached["docs"], cached["index"], op)
+            CACHE_STATS["hits"] += 1
+            return cached
+
+        CACHE_STATS["misses"] += 1
+        docs = self._read_snapshots()
+        index = TaskIndex(docs["tasks"], self.archive.count("tasks", "completed"), self.archive)
+        _link_current_task(docs["tasks"], index)
+        ops, offset = self._read_journal()
+        for op in ops:
+            apply_op(docs, index, op)
+        return self._remember(docs, index, signatures, journal_sig, offset)
+
+    def _remember(self, docs, index, signatures, journal_sig, offset):
+        state = {
+            "snapshots": signatures,
+            "journal_ino": journal_sig[0] if journal_sig else None,
+            "offset": offset,
+            "docs": docs,
+            "index": index
+        }
+        self._folded = state if journal_sig is not None else None
+        return state
+
+    def load_all(self):
+        """Return the current tasks, results, status and roles documents.
+
+        The documents are shared with the in-process cache; treat them as
+        read-only. Raises StateNotInitialized if the orchestration was never
+        initialized.
+        """
+        with self._locked():
+            return self._fold()["docs"]
+
+    def load(self, name):
+        """Return one current document ("tasks", "results", "status" or "roles")"""
+        return self.load_all()[name]
+
+    def _index(self):
+        with self._locked():
+            return self._fold()["index"]
+
+    def _append(self, ops):
+        # Caller must hold the state lock
+        data = (json.dumps({"ops": list(ops)}, separators=(",", ":")) + "\n").encode("utf-8")
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            end = os.lseek(fd, 0, os.SEEK_CUR)
+            journal_ino = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+
+        # Write through to the cached fold if it was current up to our append
+        cached = self._folded
+        if (cached is not None and cached["journal_ino"] == journal_ino
+                and cached["offset"] == end - len(data)
+                and cached["snapshots"] == self._snapshot_signatures()):
+            for op in ops:
+                apply_op(cached["docs"], cached["index"], op)
+            cached["offset"] = end
+        return end
+
+    def apply(self, *ops):
+        """Record one state change as a single journal append"""
+        with self._locked():
+            size = self._append(ops)
+        if size >= COMPACT_BYTES:
+            self.compact(force=False)
+
+    def _claim(self, pick, fields, status):
+        # The pick and the append happen under the exclusive state lock, so
+        # two agents can never both claim the same task.
+        with self._locked(exclusive=True):
+            task = pick(self._fold()["index"])
+            if task is None:
+                return None
+            task = dict(task)
+            fields = dict(fields, status="in_progress")
+            ops = [{"op": "task_update", "id": task["id"], "set": fields}]
+            if status:
+                ops.append({"op": "status_set", "set": status})
+            size = self._append(ops)
+        task.update(fields)
+        if size >= COMPACT_BYTES:
+            self.compact(force=False)
+        return task
+
+    def claim_task(self, task_id, fields, status=None):
+        """Move a pending task to in_progress; return it, or None if taken"""
+        def pick(index):
+            task = index.by_id.get(task_id)
+            return task if task is not None and task.get("status") == "pending" else None
+        return self._claim(pick, fields, status)
+
+    def claim_next(self, role=None, fields=None, status=None):
+        """Claim the highest-priority pending task for role (any role if None)"""
+        return self._claim(lambda index: index.next_pending(role), fields or {}, status)
+
+    def assign_role(self, role, terminal_id, assigned_at=None):
+        """Assign role to terminal_id if it is AVAILABLE; return True on success"""
+        with self._locked(exclusive=True):
+            roles = self._fold(missing_ok=True)["docs"]["roles"]
+            if role not in roles or roles[role]["assigned_to"] is not None:
+                return False
+            self._append([{
+                "op": "role_set",
+                "role": role,
+                "assigned_to": terminal_id,
+                "assigned_at": assigned_at
+            }])
+        return True
+
+    def release_role(self, role):
+        """Mark role AVAILABLE again"""
+        self.apply({"op": "role_set", "role": role, "assigned_to": None})
+
+    def reset_roles(self):
+        """Mark every role AVAILABLE"""
+        self.apply({"op": "roles_reset"})
+
+    # Queries
+
+    def task_counts(self):
+        """Return counts of pending, in_progress, blocked and completed tasks"""
+        return dict(self._index().counts)
+
+    def pending_tasks(self, role=None):
+        """Return the tasks still in the queue in claim order, optionally for one role"""
+        return self._index().queue(role)
+
+    def pending_roles(self):
+        """Return the target roles of all tasks waiting to be started"""
+        return self._index().roles_waiting()
+
+    def next_pending(self, role=None):
+        """Return the next task to be started, optionally for one role"""
+        return self._index().next_pending(role)
+
+    def roles(self):
+        """Return the role registry: role -> {"assigned_to", "assigned_at"}"""
+        with self._locked():
+            return self._fold(missing_ok=True)["docs"]["roles"]
+
+    def current_task(self):
+        return self.load("tasks").get("current_task")
+
+    def latest_result(self):
+        return self.load("results").get("latest_result")
+
+    def result_for(self, task_id):
+        """Return the most recent result reported for a task, if any"""
+        for result in reversed(self.load("results")["results_history"]):
+            if result.get("task_id") == task_id:
+                return result
+        return None
+
+    def status(self):
+        return self.load("status")
+
+    def _write_snapshot(self, name, doc):
+        path = self._path(name)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(doc, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _write_all(self, docs):
+        # Caller must hold the exclusive state lock
+        for name, doc in docs.items():
+            self._write_snapshot(name, doc)
+        open(self.journal_path, "w").close()
+        index = TaskIndex(docs["tasks"], self.archive.count("tasks", "completed"), self.archive)
+        _link_current_task(docs["tasks"], index)
+        self._remember(docs, index, self._snapshot_signatures(),
+                       file_signature(self.journal_path), 0)
+
+    def compact(self, force=True):
+        """Fold the journal into the snapshot files and truncate it"""
+        with self._locked(exclusive=True):
+            if not force and os.path.getsize(self.journal_path) < COMPACT_BYTES:
+                # Another process compacted while we waited for the lock
+                return
+            docs = self._fold(missing_ok=True)["docs"]
+            self.archive.rotate("tasks", docs["tasks"]["task_history"])
+            self.archive.rotate("results", docs["results"]["results_history"])
+            self._write_all(docs)
+
+    def reset(self, docs):
+        """Replace the given documents, drop the journal and archived history.
+
+        Documents not passed in (e.g. "roles") keep their current contents.
+        """
+        with self._locked(exclusive=True):
+            current = self._fold(missing_ok=True)["docs"]
+            self.archive.clear()
+            self._write_all({name: docs.get(name, current[name]) for name in SNAPSHOT_FILES})
+
+    def query_history(self, kind="tasks", role=None, status=None, since=None, until=None,
+                      limit=None):
+        """Finished tasks (or results) newest first from the hot window and archive"""
+        with self._locked():
+            docs = self._fold()["docs"]
+            hot = docs["tasks"]["task_history"] if kind == "tasks" else docs["results"]["results_history"]
+            return query_history_entries(hot, self.archive, kind, role, status, since, until, limit)
+
+    def get_task(self, task_id):
+        """Return a task by ID from the queue, the hot history or the archive"""
+        index = self._index()
+        task = index.by_id.get(task_id) or index.history_by_id.get(task_id)
+        return task if task is not None else self.archive.find_task(task_id)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    target_role TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    archived INTEGER NOT NULL DEFAULT 0,
+    history_seq INTEGER,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS status (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS task_deps (
+    task_id TEXT NOT NULL,
+    depends_on TEXT NOT NULL,
+    PRIMARY KEY (task_id, depends_on)
+);
+CREATE TABLE IF NOT EXISTS roles (
+    role TEXT PRIMARY KEY,
+    assigned_to TEXT,
+    assigned_at TEXT
+);
+"""
+
+SQLITE_INDEXES = """
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (archived, status);
+DROP INDEX IF EXISTS tasks_target_role;
+CREATE INDEX IF NOT EXISTS tasks_role_queue ON tasks (target_role, status, priority DESC, seq);
+CREATE INDEX IF NOT EXISTS tasks_history ON tasks (history_seq);
+CREATE INDEX IF NOT EXISTS results_task_id ON results (task_id);
+CREATE INDEX IF NOT EXISTS task_deps_depends_on ON task_deps (depends_on);
+"""
+
+# Rotated history: (archive kind, table, sequence column, row filter)
+SQLITE_HISTORY_TABLES = (
+    ("tasks", "tasks", "history_seq", "archived = 1"),
+    ("results", "results", "seq", "1"),
+)
+
+
+class SqliteStore:
+    """SQLite (WAL) backend"""
+
+    def __init__(self, state_dir=None):
+        self.state_dir = state_dir or STATE_DIR
+        self.db_path = os.path.join(self.state_dir, DATABASE_FILE)
+        self.archive = HistoryArchive(self.state_dir)
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            is_new = not os.path.exists(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SQLITE_SCHEMA)
+            self._migrate(conn)
+            conn.executescript(SQLITE_INDEXES)
+            conn.executemany(
+                "INSERT OR IGNORE INTO roles (role) VALUES (?)", [(role,) for role in ROLES]
+            )
+            self._conn = conn
+            if is_new:
+                self._import_json_state()
+        return self._conn
+
+    def _migrate(self, conn):
+        """Add columns introduced after a database was created"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        if "priority" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0")
+
+    def _import_json_state(self):
+        """Seed a new database from existing JSON snapshots, if any"""
+        try:
+            docs = JournalStore(self.state_dir).load_all()
+        except StateNotInitialized:
+            return
+        self.reset(docs, clear_history=False)
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the write lock up front"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _require_initialized(self, conn):
+        row = conn.execute("SELECT value FROM meta WHERE key = 'initialized'").fetchone()
+        if row is None:
+            raise StateNotInitialized(f"State database not initialized: {self.db_path}")
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _get_meta(self, conn, key):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _insert_task(self, conn, task, archived=False):
+        conn.execute("DELETE FROM tasks WHERE id = ?", (task["id"],))
+        conn.execute("DELETE FROM task_deps WHERE task_id = ?", (task["id"],))
+        if not archived:
+            conn.executemany(
+                "INSERT OR IGNORE INTO task_deps (task_id, depends_on) VALUES (?, ?)",
+                [(task["id"], dep_id) for dep_id in task.get("waiting_on", [])]
+            )
+        history_seq = self._next_history_seq(conn) if archived else None
+        conn.execute(
+            "INSERT INTO tasks (id, status, target_role, priority, archived, history_seq, doc) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task["id"], task.get("status", "pending"), task_role(task), task.get("priority", 0),
+             int(archived), history_seq, json.dumps(task))
+        )
+
+    def _next_history_seq(self, conn):
+        # Never reuse a sequence number that was already rotated into the archive
+        row = conn.execute("SELECT MAX(history_seq) FROM tasks").fetchone()
+        return max(row[0] or 0, self.archive.archived_through("tasks")) + 1
+
+    def _open_task(self, conn, task_id):
+        row = conn.execute(
+            "SELECT doc FROM tasks WHERE id = ? AND archived = 0", (task_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _apply(self, conn, op):
+        kind = op["op"]
+
+        if kind == "task_add":
+            task = op["task"]
+            failed_dep = None
+            if task.get("depends_on"):
+                # Only dependencies that are still open hold the task back
+                task["waiting_on"] = []
+                for dep_id in task["depends_on"]:
+                    status = self._dependency_status(conn, dep_id)
+                    if status == "open":
+                        task["waiting_on"].append(dep_id)
+                    elif status not in (None, "completed") and failed_dep is None:
+                        failed_dep = dep_id
+                if task["waiting_on"] and task.get("status") == "pending":
+                    task["status"] = "blocked"
+            self._insert_task(conn, task)
+            if op.get("current"):
+                self._set_meta(conn, "current_task_id", task["id"])
+            if failed_dep is not None:
+                self._apply(conn, _dependency_failed(task["id"], failed_dep, task.get("timestamp")))
+
+        elif kind in ("task_update", "task_finish"):
+            task = self._open_task(conn, op["id"])
+            if task is None:
+                return
+            task.update(op["set"])
+            if kind == "task_update":
+                conn.execute(
+                    "UPDATE tasks SET status = ?, priority = ?, doc = ? WHERE id = ?",
+                    (task.get("status", "pending"), task.get("priority", 0), json.dumps(task), task["id"])
+                )
+            else:
+                conn.execute(
+                    "UPDATE tasks SET status = ?, doc = ?, archived = 1, history_seq = ? WHERE id = ?",
+                    (task.get("status"), json.dumps(task), self._next_history_seq(conn), task["id"])
+                )
+                if self._get_meta(conn, "current_task_id") == task["id"]:
+                    self._set_meta(conn, "current_task_id", None)
+                if task.get("status") == "completed":
+                    self._release_dependents(conn, task["id"])
+                else:
+                    self._fail_dependents(conn, task["id"], task.get("completed_at"))
+
+        elif kind == "result_add":
+            result = op["result"]
+            conn.execute(
+                "INSERT INTO results (task_id, doc) VALUES (?, ?)",
+                (result.get("task_id"), json.dumps(result))
+            )
+
+        elif kind == "status_set":
+            conn.executemany(
+                "INSERT OR REPLACE INTO status (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in op["set"].items()]
+            )
+
+        elif kind == "role_set":
+            conn.execute(
+                "INSERT OR REPLACE INTO roles (role, assigned_to, assigned_at) VALUES (?, ?, ?)",
+                (op["role"], op["assigned_to"], op.get("assigned_at"))
+            )
+
+        elif kind == "roles_reset":
+            conn.execute("UPDATE roles SET assigned_to = NULL, assigned_at = NULL")
+
+        else:
+            raise ValueError(f"Unknown state operation: {kind}")
+
+    def _dependency_status(self, conn, task_id):
+        """"open" for a queued task, the final status of a finished one, else None"""
+        row = conn.execute("SELECT archived, status FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is not None:
+            return "open" if not row[0] else row[1]
+        task = self.archive.find_task(task_id)
+        return task.get("status") if task is not None else None
+
+    def _fail_dependents(self, conn, task_id, completed_at):
+        """Finish every task still waiting on task_id as DEPENDENCY_FAILED"""
+        rows = conn.execute(
+            "SELECT task_id FROM task_deps WHERE depends_on = ?", (task_id,)
+        ).fetchall()
+        conn.execute("DELETE FROM task_deps WHERE depends_on = ?", (task_id,))
+        for (dependent_id,) in rows:
+            self._apply(conn, _dependency_failed(dependent_id, task_id, completed_at))
+
+    def _release_dependents(self, conn, task_id):
+        """Unblock tasks whose last unfinished dependency was task_id"""
+        rows = conn.execute(
+            "SELECT task_id FROM task_deps WHERE depends_on = ?", (task_id,)
+        ).fetchall()
+        conn.execute("DELETE FROM task_deps WHERE depends_on = ?", (task_id,))
+        for (dependent_id,) in rows:
+            dependent = self._open_task(conn, dependent_id)
+            if dependent is None:
+                continue
+            dependent["waiting_on"] = [d for d in dependent.get("waiting_on", []) if d != task_id]
+            if not dependent["waiting_on"] and dependent.get("status") == "blocked":
+                dependent["status"] = "pending"
+            conn.execute(
+                "UPDATE tasks SET status = ?, doc = ? WHERE id = ?",
+                (dependent["status"], json.dumps(dependent), dependent_id)
+            )
+
+    def apply(self, *ops):
+        """Apply a state change as a single transaction"""
+        with self._transaction() as conn:
+            for op in ops:
+                self._apply(conn, op)
+        if any(op["op"] in ("task_finish", "result_add") for op in ops):
+            self._rotate_history()
+
+    def _rotate_history(self):
+        """Move history beyond the hot window into archive segments.
+
+        Runs in its own write transaction once the change is committed, so
+        a rolled-back change never reaches the archive. Each segment records
+        the highest sequence number it holds and index.json is replaced
+        before the rows are deleted; readers skip rows at or below that mark,
+        so no entry is seen twice while a rotation is in flight, and rows
+        left behind by an interrupted rotation are deleted by the next one.
+        """
+        conn = self._connection()
+        due = []
+        for kind, table, seq, where in SQLITE_HISTORY_TABLES:
+            live = conn.execute(
+                f"SELECT COUNT(*) FROM {table} WHERE {where} AND {seq} > ?",
+                (self.archive.archived_through(kind),)
+            ).fetchone()[0]
+            if live >= HISTORY_HOT_LIMIT + HISTORY_SEGMENT_SIZE:
+                due.append((kind, table, seq, where))
+        if not due:
+            return
+
+        with self._transaction() as conn:
+            for kind, table, seq, where in due:
+                # Re-check under the write lock: another process may have rotated
+                through = self.archive.archived_through(kind)
+                conn.execute(f"DELETE FROM {table} WHERE {where} AND {seq} <= ?", (through,))
+                live = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {where}").fetchone()[0]
+                if live < HISTORY_HOT_LIMIT + HISTORY_SEGMENT_SIZE:
+                    continue
+                rows = conn.execute(
+                    f"SELECT {seq}, doc FROM {table} WHERE {where} ORDER BY {seq} LIMIT ?",
+                    (live - HISTORY_HOT_LIMIT,)
+                ).fetchall()
+                self.archive.append_segment(kind, [json.loads(doc) for _, doc in rows],
+                                            through=rows[-1][0])
+                conn.execute(f"DELETE FROM {table} WHERE {where} AND {seq} <= ?", (rows[-1][0],))
+
+    def _consistent(self, read):
+        """Call read() until the archive index is the same before and after it.
+
+        Rotation replaces index.json before deleting the rotated rows, so an
+        unchanged index means read() saw rows and segments that add up.
+        """
+        while True:
+            signature = self.archive.signature()
+            value = read()
+            if self.archive.signature() == signature:
+                return value
+
+    def _history_rows(self, kind, sql, params=()):
+        """Hot history rows not yet covered by the archive (sql selects seq, doc)"""
+        through = self.archive.archived_through(kind)
+        return [json.loads(doc) for seq, doc in self._query(sql, params) if seq > through]
+
+    def _claim(self, where, params, fields, status):
+        with self._transaction() as conn:
+            row = conn.execute(
+                f"SELECT doc FROM tasks WHERE archived = 0 AND status = 'pending' AND {where} "
+                "ORDER BY priority DESC, seq LIMIT 1",
+                params
+            ).fetchone()
+            if row is None:
+                return None
+            task = json.loads(row[0])
+            task.update(fields, status="in_progress")
+            conn.execute(
+                "UPDATE tasks SET status = 'in_progress', doc = ? WHERE id = ?",
+                (json.dumps(task), task["id"])
+            )
+            if status:
+                self._apply(conn, {"op": "status_set", "set": status})
+        return task
+
+    def claim_task(self, task_id, fields, status=None):
+        """Move a pending task to in_progress; return it, or None if taken"""
+        return self._claim("id = ?", (task_id,), fields, status)
+
+    def claim_next(self, role=None, fields=None, status=None):
+        """Claim the highest-priority pending task for role (any role if None)"""
+        if role is None:
+            return self._claim("1", (), fields or {}, status)
+        return self._claim("target_role = ?", (role,), fields or {}, status)
+
+    def assign_role(self, role, terminal_id, assigned_at=None):
+        """Assign role to terminal_id if it is AVAILABLE; return True on success"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE roles SET assigned_to = ?, assigned_at = ? "
+                "WHERE role = ? AND assigned_to IS NULL",
+                (terminal_id, assigned_at, role)
+            )
+        return cursor.rowcount == 1
+
+    def release_role(self, role):
+        """Mark role AVAILABLE again"""
+        self.apply({"op": "role_set", "role": role, "assigned_to": None})
+
+    def reset_roles(self):
+        """Mark every role AVAILABLE"""
+        self.apply({"op": "roles_reset"})
+
+    def reset(self, docs, clear_history=True):
+        """Replace the given documents; others (e.g. "roles") are kept"""
+        with self._transaction() as conn:
+            if clear_history:
+                self.archive.clear()
+            for table in ("tasks", "task_deps", "results", "status", "meta"):
+                conn.execute(f"DELETE FROM {table}")
+            if "roles" in docs:
+                conn.execute("DELETE FROM roles")
+                for role, entry in docs["roles"].items():
+                    self._apply(conn, dict(entry, op="role_set", role=role))
+            tasks = docs["tasks"]
+            for task in tasks.get("task_history", []):
+                self._insert_task(conn, task, archived=True)
+            for task in tasks.get("pending_tasks", []):
+                self._insert_task(conn, task)
+            current = tasks.get("current_task")
+            self._set_meta(conn, "current_task_id", current["id"] if current else None)
+            for result in docs["results"].get("results_history", []):
+                self._apply(conn, {"op": "result_add", "result": result})
+            self._apply(conn, {"op": "status_set", "set": docs["status"]})
+            self._set_meta(conn, "initialized", "1")
+
+    def compact(self, force=True):
+        """Checkpoint the WAL into the main database file"""
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    # Queries
+
+    def _query(self, sql, params=()):
+        conn = self._connection()
+        self._require_initialized(conn)
+        return conn.execute(sql, params).fetchall()
+
+    def task_counts(self):
+        """Return counts of pending, in_progress, blocked and completed tasks"""
+        counts = {"pending": 0, "in_progress": 0, "blocked": 0, "completed": 0}
+        for status, count in self._query(
+            "SELECT status, COUNT(*) FROM tasks WHERE archived = 0 GROUP BY status"
+        ):
+            if status in counts:
+                counts[status] = count
+
+        def completed():
+            return self._query(
+                "SELECT COUNT(*) FROM tasks WHERE archived = 1 AND status = 'completed' "
+                "AND history_seq > ?",
+                (self.archive.archived_through("tasks"),)
+            )[0][0] + self.archive.count("tasks", "completed")
+
+        counts["completed"] = self._consistent(completed)
+        return counts
+
+    def pending_tasks(self, role=None):
+        """Return the tasks still in the queue in claim order, optionally for one role"""
+        if role is None:
+            rows = self._query(
+                "SELECT doc FROM tasks WHERE archived = 0 ORDER BY priority DESC, seq"
+            )
+        else:
+            rows = self._query(
+                "SELECT doc FROM tasks WHERE target_role = ? AND archived = 0 "
+                "ORDER BY priority DESC, seq",
+                (role,)
+            )
+        return [json.loads(row[0]) for row in rows]
+
+    def pending_roles(self):
+        """Return the target roles of all tasks waiting to be started"""
+        rows = self._query(
+            "SELECT DISTINCT target_role FROM tasks "
+            "WHERE archived = 0 AND status = 'pending' AND target_role IS NOT NULL"
+        )
+        return {row[0] for row in rows}
+
+    def next_pending(self, role=None):
+        """Return the next task to be started, optionally for one role"""
+        where, params = ("1", ()) if role is None else ("target_role = ?", (role,))
+        rows = self._query(
+            f"SELECT doc FROM tasks WHERE archived = 0 AND status = 'pending' AND {where} "
+            "ORDER BY priority DESC, seq LIMIT 1",
+            params
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def roles(self):
+        """Return the role registry: role -> {"assigned_to", "assigned_at"}"""
+        rows = self._connection().execute(
+            "SELECT role, assigned_to, assigned_at FROM roles"
+        ).fetchall()
+        return {role: {"assigned_to": to, "assigned_at": at} for role, to, at in rows}
+
+    def current_task(self):
+        rows = self._query(
+            "SELECT tasks.doc FROM meta JOIN tasks ON tasks.id = meta.value "
+            "WHERE meta.key = 'current_task_id' AND tasks.archived = 0"
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def latest_result(self):
+        rows = self._query("SELECT doc FROM results ORDER BY seq DESC LIMIT 1")
+        return json.loads(rows[0][0]) if rows else None
+
+    def result_for(self, task_id):
+        """Return the most recent result reported for a task, if any"""
+        rows = self._query(
+            "SELECT doc FROM results WHERE task_id = ? ORDER BY seq DESC LIMIT 1", (task_id,)
+        )
+        return json.loads(rows[0][0]) if rows else None
+
+    def status(self):
+        return {key: json.loads(value) for key, value in self._query("SELECT key, value FROM status")}
+
+    def get_task(self, task_id):
+        """Return a task by ID from the database or the archive"""
+        rows = self._query("SELECT doc FROM tasks WHERE id = ?", (task_id,))
+        return json.loads(rows[0][0]) if rows else self.archive.find_task(task_id)
+
+    def query_history(self, kind="tasks", role=None, status=None, since=None, until=None,
+                      limit=None):
+        """Finished tasks (or results) newest first from the hot window and archive"""
+        if kind == "tasks":
+            sql, params = "SELECT history_seq, doc FROM tasks WHERE archived = 1", []
+            if role is not None:
+                sql, params = sql + " AND target_role = ?", params + [role]
+            if status is not None:
+                sql, params = sql + " AND status = ?", params + [status]
+            sql += " ORDER BY history_seq"
+        else:
+            sql, params = "SELECT seq, doc FROM results ORDER BY seq", []
+
+        def read():
+            hot = self._history_rows(kind, sql, params)
+            return query_history_entries(hot, self.archive, kind, role, status, since, until, limit)
+        return self._consistent(read)
+
+    def load_all(self):
+        """Materialize the tasks, results and status documents"""
+        tasks = {
+            "current_task": self.current_task(),
+            "pending_tasks": self.pending_tasks(),
+            "task_history": self._consistent(lambda: self._history_rows(
+                "tasks", "SELECT history_seq, doc FROM tasks WHERE archived = 1 ORDER BY history_seq"
+            ))
+        }
+        results = {
+            "latest_result": self.latest_result(),
+            "results_history": self._consistent(lambda: self._history_rows(
+                "results", "SELECT seq, doc FROM results ORDER BY seq"
+            ))
+        }
+        return {"tasks": tasks, "results": results, "status": self.status(), "roles": self.roles()}
+
+    def load(self, name):
+        """Return one current document ("tasks", "results", "status" or "roles")"""
+        if name == "status":
+            return self.status()
+        if name == "roles":
+            return self.roles()
+        return self.load_all()[name]
+
+
+BACKENDS = {
+    "json": JournalStore,
+    "sqlite": SqliteStore,
+}
+
+_stores = {}
+
+
+def get_store(state_dir=None, backend=None):
+    """Return the shared store for the given (or default) state directory"""
+    state_dir = state_dir or STATE_DIR
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown AGENT_STATE_BACKEND: {backend}")
+    key = (backend, state_dir)
+    if key not in _stores:
+        _stores[key] = BACKENDS[backend](state_dir)
+    return _stores[key]
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+State Watch - Block until the coordination state directory changes
+
+Uses inotify on Linux so waiting costs no CPU, and falls back to cheap
+stat() polling with backoff everywhere else.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from state_store import LOCK_FILE
+
+# inotify event mask: anything that can change a state file's contents
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event header: wd, mask, cookie, len (the name follows)
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Files whose events are not state changes. Every state read opens and
+# closes the lock file, which would otherwise wake the waiter it serves.
+IGNORED_NAMES = frozenset({LOCK_FILE})
+
+# Stat fallback polling interval bounds (seconds)
+POLL_MIN_INTERVAL = 0.005
+POLL_MAX_INTERVAL = 0.1
+
+
+def _load_inotify():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_inotify()
+
+
+class StateWatcher:
+    """Watch a directory; wait() returns once something in it changed.
+
+    Create the watcher *before* checking state so that a change landing
+    between the check and wait() is not missed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._fd = None
+        self._snapshot = None
+        if _libc is not None:
+            fd = _libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                if _libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) >= 0:
+                    self._fd = fd
+                else:
+                    os.close(fd)
+        if self._fd is None:
+            self._snapshot = self._scan()
+
+    @property
+    def uses_inotify(self):
+        return self._fd is not None
+
+    def _scan(self):
+        signature = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name in IGNORED_NAMES:
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    signature[entry.name] = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pass
+        return signature
+
+    def _drain(self):
+        """Read all queued events; return True if any was a state change"""
+        changed = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return changed
+            if not data:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0").decode(errors="replace")
+                offset += length
+                if mask & IN_Q_OVERFLOW or name not in IGNORED_NAMES:
+                    changed = True
+
+    def wait(self, timeout):
+        """Block up to timeout seconds; return True if the directory changed"""
+        deadline = time.monotonic() + max(timeout, 0)
+        if self._fd is not None:
+            while True:
+                remaining = max(deadline - time.monotonic(), 0)
+                readable, _, _ = select.select([self._fd], [], [], remaining)
+                if not readable:
+                    return False
+                if self._drain():
+                    return True
+
+        interval = POLL_MIN_INTERVAL
+        while True:
+            current = self._scan()
+            if current != self._snapshot:
+                self._snapshot = current
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, POLL_MAX_INTERVAL)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def wait_until(directory, check, timeout):
+    """Return check()'s first truthy value, re-checking on every change.
+
+    Returns None if timeout seconds pass without check() succeeding.
+    """
+    deadline = time.monotonic() + timeout
+    with StateWatcher(directory) as watcher:
+        while True:
+            value = check()
+            if value:
+                return value
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            watcher.wait(remaining)
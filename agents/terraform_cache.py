@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Terraform Cache - Content-addressed caches for the MCP server
+
+Configuration is identified by hashing the files terraform reads; state is
+identified by its lineage and serial. Results keyed on both can be reused
+until either one changes.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Root for caches that live outside the working directories
+CACHE_ROOT = os.getenv(
+    "TERRAFORM_MCP_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "terraform-mcp")
+)
+# Saved plans older than this are re-planned to pick up infrastructure drift
+PLAN_CACHE_TTL = int(os.getenv("TERRAFORM_PLAN_CACHE_TTL", "900"))
+# Saved plans kept per working directory
+PLAN_CACHE_ENTRIES = 10
+# Remote state snapshots are re-checked against `state pull` after this many seconds
+STATE_CACHE_TTL = int(os.getenv("TERRAFORM_STATE_CACHE_TTL", "30"))
+
+CONFIG_SUFFIXES = (".tf", ".tf.json", ".tfvars", ".tfvars.json")
+LOCK_FILE = ".terraform.lock.hcl"
+# Record of the last successful init, kept inside .terraform so it goes away with it
+INIT_RECORD = os.path.join(".terraform", "mcp-init.json")
+
+# Blocks whose contents decide what `terraform init` installs
+_INIT_BLOCK_START = re.compile(r'^[ \t]*(terraform|module[ \t]+"[^"]*")[ \t]*\{', re.M)
+
+# path -> ((mtime_ns, size), sha256 hex)
+_digests: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+
+def file_digest(path: str) -> str:
+    """sha256 of a file, recomputed only when its mtime or size changes"""
+    st = os.stat(path)
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _digests.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _digests[path] = (signature, digest)
+    return digest
+
+
+def config_files(working_dir: str) -> List[str]:
+    """Relative paths of every file that shapes the configuration, sorted.
+
+    Walks nested module directories but skips .terraform and other hidden
+    directories.
+    """
+    files = []
+    for root, dirs, names in os.walk(working_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in names:
+            if name.endswith(CONFIG_SUFFIXES) or (name == LOCK_FILE and root == working_dir):
+                files.append(os.path.relpath(os.path.join(root, name), working_dir))
+    return sorted(files)
+
+
+def config_hash(working_dir: str, extra: Optional[Dict[str, Any]] = None) -> str:
+    """Hash the configuration files plus any extra inputs (arguments, state...)"""
+    h = hashlib.sha256()
+    for rel in config_files(working_dir):
+        h.update(rel.encode() + b"\0" + file_digest(os.path.join(working_dir, rel)).encode() + b"\0")
+    h.update(json.dumps(extra or {}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def current_workspace(working_dir: str, workspace: Optional[str] = None) -> str:
+    """Workspace a command will use: explicit, then TF_WORKSPACE, then the selected one"""
+    workspace = workspace or os.getenv("TF_WORKSPACE")
+    if workspace:
+        return workspace
+    try:
+        with open(os.path.join(working_dir, ".terraform", "environment")) as f:
+            return f.read().strip() or "default"
+    except FileNotFoundError:
+        return "default"
+
+
+def backend_type(working_dir: str) -> str:
+    """Backend recorded by the last init ("local" if none)"""
+    try:
+        with open(os.path.join(working_dir, ".terraform", "terraform.tfstate")) as f:
+            return (json.load(f).get("backend") or {}).get("type") or "local"
+    except (FileNotFoundError, ValueError):
+        return "local"
+
+
+def local_state_path(working_dir: str, workspace: Optional[str] = None) -> str:
+    workspace = current_workspace(working_dir, workspace)
+    if workspace == "default":
+        return os.path.join(working_dir, "terraform.tfstate")
+    return os.path.join(working_dir, "terraform.tfstate.d", workspace, "terraform.tfstate")
+
+
+async def state_identity(working_dir: str,
+                         pull_state: Callable[[], Awaitable[Optional[str]]],
+                         workspace: Optional[str] = None) -> Dict[str, Any]:
+    """Return {"workspace", "lineage", "serial"} for the current state.
+
+    Local state is read straight from disk; remote backends are asked via
+    pull_state() (e.g. `terraform state pull`), which is far cheaper than a plan.
+    """
+    identity = {"workspace": current_workspace(working_dir, workspace), "lineage": None, "serial": None}
+    if backend_type(working_dir) == "local":
+        try:
+            with open(local_state_path(working_dir, workspace)) as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return identity
+    else:
+        raw = await pull_state()
+    try:
+        state = json.loads(raw) if raw else {}
+    except ValueError:
+        state = {}
+    identity["lineage"] = state.get("lineage")
+    identity["serial"] = state.get("serial")
+    return identity
+
+
+def state_signature(working_dir: str) -> Optional[Tuple[str, int, int]]:
+    """(path, mtime, size) of the local state file, None for remote backends or no state"""
+    if backend_type(working_dir) != "local":
+        return None
+    path = local_state_path(working_dir)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (path, st.st_mtime_ns, st.st_size)
+
+
+def _block_body(text: str, start: int) -> str:
+    """Return text[start:] up to the brace closing the block opened before start"""
+    depth, i, quote = 1, start, False
+    while i < len(text) and depth:
+        char = text[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == '"':
+                quote = False
+        elif char == '"':
+            quote = True
+        elif char == "#" or text.startswith("//", i):
+            i = text.find("\n", i)
+            if i < 0:
+                break
+        elif text.startswith("/*", i):
+            i = text.find("*/", i)
+            if i < 0:
+                break
+            i += 1
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        i += 1
+    return text[start:i]
+
+
+def init_fingerprint(working_dir: str, extra: Optional[Dict[str, Any]] = None) -> str:
+    """Hash of everything `terraform init` depends on.
+
+    Covers .terraform.lock.hcl, every terraform {} block (backend,
+    required_providers) and module block in the root and local modules, and
+    the init arguments in extra. Resource edits do not change it.
+    """
+    h = hashlib.sha256()
+    lock_path = os.path.join(working_dir, LOCK_FILE)
+    h.update(file_digest(lock_path).encode() if os.path.exists(lock_path) else b"-")
+    for name in config_files(working_dir):
+        if not name.endswith(".tf"):
+            continue
+        with open(os.path.join(working_dir, name), errors="replace") as f:
+            text = f.read()
+        for match in _INIT_BLOCK_START.finditer(text):
+            h.update(name.encode() + b"\0" + match.group(1).encode() + b"\0")
+            h.update(_block_body(text, match.end()).encode())
+    h.update(json.dumps(extra or {}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def read_init_record(working_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(working_dir, INIT_RECORD)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_init_record(working_dir: str, fingerprint: str, duration: float) -> None:
+    path = os.path.join(working_dir, INIT_RECORD)
+    if not os.path.isdir(os.path.dirname(path)):
+        return
+    with open(path, "w") as f:
+        json.dump({"fingerprint": fingerprint, "initialized_at": time.time(), "duration": duration}, f)
+
+
+class PlanCache:
+    """Saved plan files keyed by configuration + arguments + state hash"""
+
+    def __init__(self, root: str = os.path.join(CACHE_ROOT, "plans"), ttl: int = PLAN_CACHE_TTL):
+        self.root = root
+        self.ttl = ttl
+
+    def directory(self, working_dir: str) -> str:
+        key = hashlib.sha256(os.path.realpath(working_dir).encode()).hexdigest()[:16]
+        return os.path.join(self.root, key)
+
+    def plan_path(self, working_dir: str, key: str) -> str:
+        return os.path.join(self.directory(working_dir), f"{key}.tfplan")
+
+    def lookup(self, working_dir: str, key: str) -> Optional[Dict[str, Any]]:
+        """Return the metadata of a fresh saved plan for key, if any"""
+        meta_path = os.path.join(self.directory(working_dir), f"{key}.json")
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - meta["created_at"] > self.ttl or not os.path.exists(meta["plan_file"]):
+            self.discard(working_dir, key)
+            return None
+        return meta
+
+    def store(self, working_dir: str, key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a successful `plan -out` run whose plan file is plan_path(key)"""
+        directory = self.directory(working_dir)
+        meta = {
+            "key": key,
+            "created_at": time.time(),
+            "plan_file": self.plan_path(working_dir, key),
+            "command": result["command"],
+            "stdout": result["stdout"],
+            "stderr": result["stderr"],
+            "summary": result.get("summary"),
+            "details": result.get("details")
+        }
+        tmp_path = os.path.join(directory, f"{key}.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, f"{key}.json"))
+        self._prune(directory)
+        return meta
+
+    def prepare(self, working_dir: str) -> None:
+        os.makedirs(self.directory(working_dir), exist_ok=True)
+
+    def discard(self, working_dir: str, key: str) -> None:
+        for suffix in (".json", ".tfplan"):
+            try:
+                os.remove(os.path.join(self.directory(working_dir), key + suffix))
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, working_dir: str) -> None:
+        """Drop every saved plan for working_dir (after apply/destroy)"""
+        shutil.rmtree(self.directory(working_dir), ignore_errors=True)
+
+    def _prune(self, directory: str) -> None:
+        metas = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in metas[:max(0, len(metas) - PLAN_CACHE_ENTRIES)]:
+            key = entry.name[:-len(".json")]
+            for suffix in (".json", ".tfplan"):
+                try:
+                    os.remove(os.path.join(directory, key + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+class StateSnapshots:
+    """Parsed state per working directory, valid while lineage and serial are unchanged.
+
+    Local state is re-validated with a stat() of the state file (and only
+    re-read when that changes); remote state is trusted for ttl seconds and
+    then checked with pull_state().
+    """
+
+    def __init__(self, ttl: int = STATE_CACHE_TTL):
+        self.ttl = ttl
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+
+    async def lookup(self, working_dir: str,
+                     pull_state: Callable[[], Awaitable[Optional[str]]]) -> Optional[Dict[str, Any]]:
+        """Return the snapshot for working_dir if state has not moved since it was taken"""
+        key = os.path.realpath(working_dir)
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            return None
+        remote = backend_type(working_dir) != "local"
+        if remote and time.time() - snapshot["checked_at"] < self.ttl:
+            return snapshot
+        signature = state_signature(working_dir)
+        if not remote and signature is not None and signature == snapshot["signature"]:
+            return snapshot
+        if await state_identity(working_dir, pull_state) != snapshot["identity"]:
+            del self._snapshots[key]
+            return None
+        snapshot["signature"], snapshot["checked_at"] = signature, time.time()
+        return snapshot
+
+    def store(self, working_dir: str, identity: Dict[str, Any],
+              signature: Optional[Tuple[str, int, int]], index: Any) -> Dict[str, Any]:
+        """Record index, built from state read after identity/signature were taken"""
+        snapshot = {"identity": identity, "signature": signature, "checked_at": time.time(), "index": index}
+        self._snapshots[os.path.realpath(working_dir)] = snapshot
+        return snapshot
+
+    def invalidate(self, working_dir: str) -> None:
+        """Forget the snapshot for working_dir (after apply/destroy/init)"""
+        self._snapshots.pop(os.path.realpath(working_dir), None)
+
+
+class PlanTimings:
+    """Per-directory plan durations by mode and parallelism, persisted across restarts.
+
+    Each (mode, parallelism) keeps an exponentially weighted average so the
+    figures follow the stack as it grows.
+    """
+
+    def __init__(self, path: str = os.path.join(CACHE_ROOT, "plan-timings.json"), weight: float = 0.3):
+        self.path = path
+        self.weight = weight
+        self._timings: Optional[Dict[str, Any]] = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._timings is None:
+            try:
+                with open(self.path) as f:
+                    self._timings = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._timings = {}
+        return self._timings
+
+    def record(self, working_dir: str, mode: str, parallelism: int, seconds: float) -> None:
+        modes = self._load().setdefault(os.path.realpath(working_dir), {})
+        entry = modes.setdefault(mode, {}).setdefault(str(parallelism), {"seconds": seconds, "runs": 0})
+        entry["seconds"] = round(entry["seconds"] + self.weight * (seconds - entry["seconds"]), 3)
+        entry["runs"] += 1
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._timings, f)
+        os.replace(tmp_path, self.path)
+
+    def stats(self, working_dir: str, mode: str) -> Dict[int, Dict[str, Any]]:
+        """parallelism -> {"seconds", "runs"} for one mode ("refresh", "no_refresh", "refresh_only")"""
+        modes = self._load().get(os.path.realpath(working_dir), {})
+        return {int(p): entry for p, entry in modes.get(mode, {}).items()}
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Terraform Checks - Speculative fmt-check/validate results keyed by file content
+
+Agents almost always run `fmt -check` and `validate` right after editing.
+The server watches the working directories, runs both in the background
+once edits settle, and caches the results against the content hash of the
+configuration, so the agent's own call is usually a lookup.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from terraform_cache import config_files, config_hash, read_init_record
+
+# Set to 0 to disable background checks
+SPECULATIVE_CHECKS = os.getenv("TERRAFORM_SPECULATIVE_CHECKS", "1") != "0"
+# Seconds between looks at the watched directories
+WATCH_INTERVAL = float(os.getenv("TERRAFORM_SPECULATE_INTERVAL", "2"))
+# Files must be unchanged this long before a background check starts
+DEBOUNCE_SECONDS = float(os.getenv("TERRAFORM_SPECULATE_DEBOUNCE", "1.5"))
+
+CHECK_KINDS = ("fmt", "validate")
+
+
+def content_hash(kind: str, working_dir: str) -> str:
+    """What a check result depends on: the config files, plus the last init for validate"""
+    extra = {"check": kind}
+    if kind == "validate":
+        extra["initialized_at"] = (read_init_record(working_dir) or {}).get("initialized_at")
+    return config_hash(working_dir, extra)
+
+
+class CheckCache:
+    """Latest result of each check per directory, with the content hash it was run against"""
+
+    def __init__(self):
+        self._results: Dict[Tuple[str, str], Tuple[str, float, Dict[str, Any]]] = {}
+        self._inflight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+
+    def fresh(self, kind: str, working_dir: str) -> bool:
+        key = (kind, os.path.realpath(working_dir))
+        cached = self._results.get(key)
+        return cached is not None and cached[0] == content_hash(kind, working_dir)
+
+    async def lookup(self, kind: str, working_dir: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """(result, age in seconds) for the current content, waiting for a matching run in progress"""
+        key = (kind, os.path.realpath(working_dir))
+        digest = content_hash(kind, working_dir)
+        inflight = self._inflight.get(key)
+        if inflight and inflight[0] == digest:
+            try:
+                await asyncio.shield(inflight[1])
+            except Exception:
+                return None
+        cached = self._results.get(key)
+        if cached and cached[0] == digest:
+            return cached[2], time.time() - cached[1]
+        return None
+
+    async def run(self, kind: str, working_dir: str,
+                  runner: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Run a check and remember its result under the content hash taken beforehand"""
+        key = (kind, os.path.realpath(working_dir))
+        digest = content_hash(kind, working_dir)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (digest, future)
+        try:
+            result = await runner()
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("check cancelled"))
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(key, (None, None))[1] is future:
+                del self._inflight[key]
+        # A timed-out or unstartable run says nothing about the files
+        if result["returncode"] != -1:
+            self._results[key] = (digest, time.time(), result)
+        future.set_result(result)
+        return result
+
+
+class ChangeWatcher:
+    """Poll directories for configuration changes and report each one once edits settle.
+
+    on_change(directory) returns False to be asked again on the next poll
+    (e.g. while the directory is busy with other terraform commands).
+    """
+
+    def __init__(self, on_change: Callable[[str], bool],
+                 interval: float = WATCH_INTERVAL, debounce: float = DEBOUNCE_SECONDS):
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+        self._dirs: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _signature(directory: str) -> Tuple:
+        entries = []
+        for rel in config_files(directory):
+            try:
+                st = os.stat(os.path.join(directory, rel))
+            except FileNotFoundError:
+                continue
+            entries.append((rel, st.st_mtime_ns, st.st_size))
+        return tuple(entries)
+
+    def watch(self, directory: str) -> None:
+        """Start watching directory; its current contents are checked once right away"""
+        directory = os.path.realpath(directory)
+        if directory not in self._dirs:
+            self._dirs[directory] = {"signature": None, "changed_at": 0.0, "pending": True}
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    @property
+    def directories(self) -> Set[str]:
+        return set(self._dirs)
+
+    def poll(self) -> None:
+        now = time.monotonic()
+        for directory, seen in self._dirs.items():
+            if not os.path.isdir(directory):
+                continue
+            signature = self._signature(directory)
+            if signature != seen["signature"]:
+                seen["signature"], seen["changed_at"], seen["pending"] = signature, now, True
+            elif seen["pending"] and now - seen["changed_at"] >= self.debounce:
+                seen["pending"] = not self.on_change(directory)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                self.poll()
+            except Exception:
+                # A directory vanishing mid-walk must not stop the watcher
+                pass
+            await asyncio.sleep(self.interval)
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Terraform Files - Warm index of the terraform files under a directory
+
+The index walks the tree once (including nested modules) and afterwards
+only stat()s the directories it knows: a directory's mtime changes exactly
+when entries are added, removed or renamed in it, so listing stays a memory
+lookup until something actually moves. File reads support byte and line
+ranges so large files can be fetched in chunks.
+"""
+
+import os
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+TERRAFORM_SUFFIXES = (".tf", ".tf.json", ".tfvars", ".tfvars.json")
+# Reads without an explicit range return at most this many bytes
+READ_CHUNK_BYTES = int(os.getenv("TERRAFORM_READ_CHUNK_BYTES", str(256 * 1024)))
+# Small files whose contents are kept in memory
+CONTENT_CACHE_ENTRIES = 256
+
+
+class FileIndex:
+    """Recursive, module-aware index of terraform files under root"""
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._dirs: Dict[str, int] = {}
+        self._files: Dict[str, List[str]] = {}
+        self._listing: Optional[List[Tuple[str, str]]] = None
+
+    def _scan_dir(self, directory: str) -> None:
+        """(Re)index one directory and any subdirectories not seen before"""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, NotADirectoryError):
+            self._forget(directory)
+            return
+        self._dirs[directory] = mtime
+        self._listing = None
+        names, subdirs = [], []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.endswith(TERRAFORM_SUFFIXES):
+                names.append(entry.name)
+        self._files[directory] = sorted(names)
+        # Drop subdirectories that disappeared, index new ones
+        for known in [d for d in self._dirs if os.path.dirname(d) == directory and d not in subdirs]:
+            self._forget(known)
+        for subdir in subdirs:
+            if subdir not in self._dirs:
+                self._scan_dir(subdir)
+
+    def _forget(self, directory: str) -> None:
+        self._listing = None
+        prefix = directory + os.sep
+        for known in [d for d in self._dirs if d == directory or d.startswith(prefix)]:
+            del self._dirs[known]
+            self._files.pop(known, None)
+
+    def refresh(self) -> None:
+        """Bring the index up to date, re-listing only directories that changed"""
+        if not self._dirs:
+            self._scan_dir(self.root)
+            return
+        for directory, mtime in list(self._dirs.items()):
+            if directory not in self._dirs:
+                continue
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except FileNotFoundError:
+                self._forget(directory)
+                continue
+            if current != mtime:
+                self._scan_dir(directory)
+
+    def files(self) -> List[Tuple[str, str]]:
+        """Return (module, relative path) for every indexed file, sorted by path"""
+        self.refresh()
+        if self._listing is not None:
+            return self._listing
+        listing = []
+        for directory, names in self._files.items():
+            module = os.path.relpath(directory, self.root)
+            module = "root" if module == "." else module
+            for name in names:
+                listing.append((module, os.path.relpath(os.path.join(directory, name), self.root)))
+        self._listing = sorted(listing, key=lambda item: item[1])
+        return self._listing
+
+
+class FileReader:
+    """Ranged file reads with a small content cache keyed by (mtime, size)"""
+
+    def __init__(self, chunk_bytes: int = READ_CHUNK_BYTES, entries: int = CONTENT_CACHE_ENTRIES):
+        self.chunk_bytes = chunk_bytes
+        self.entries = entries
+        self._cache: "OrderedDict[str, Tuple[Tuple[int, int], bytes]]" = OrderedDict()
+
+    def _content(self, path: str, st: os.stat_result) -> bytes:
+        signature = (st.st_mtime_ns, st.st_size)
+        cached = self._cache.get(path)
+        if cached and cached[0] == signature:
+            self._cache.move_to_end(path)
+            return cached[1]
+        with open(path, "rb") as f:
+            data = f.read()
+        self._cache[path] = (signature, data)
+        while len(self._cache) > self.entries:
+            self._cache.popitem(last=False)
+        return data
+
+    def read(self, path: str, offset: Optional[int] = None, length: Optional[int] = None,
+             lines: Optional[Tuple[int, int]] = None) -> str:
+        """Read a byte range, a 1-based inclusive line range, or the first chunk.
+
+        Unranged reads of files larger than chunk_bytes end with a note
+        telling the caller which offset to request next.
+        """
+        st = os.stat(path)
+        if lines is not None:
+            first, last = lines
+            with open(path, errors="replace") as f:
+                return "".join(islice(f, max(first - 1, 0), last))
+
+        ranged = offset is not None or length is not None
+        offset = offset or 0
+        length = length if length is not None else self.chunk_bytes
+        if st.st_size <= self.chunk_bytes:
+            data = self._content(path, st)[offset:offset + length]
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+        text = data.decode(errors="replace")
+        end = offset + len(data)
+        if not ranged and end < st.st_size:
+            text += (f"\n# ... truncated at byte {end} of {st.st_size}; "
+                     f"request ?offset={end}&length={self.chunk_bytes} for the next chunk\n")
+        return text
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Terraform HCL - Lightweight HCL parser and symbol index
+
+Parses the block structure of .tf files (resources, data sources, modules,
+variables, outputs, locals, providers) without running terraform, records
+where each block lives, its attributes and the addresses it references,
+and keeps a per-directory index that re-parses only files that changed.
+"""
+
+import fnmatch
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+_IDENT = re.compile(r"[A-Za-z_][\w-]*")
+_HEREDOC = re.compile(r"<<-?([A-Za-z_][\w-]*)[ \t]*\n")
+_REFERENCE = re.compile(r"(?<![\w.\"])([A-Za-z_][\w-]*(?:\.[A-Za-z_][\w-]*)+)")
+# First traversal steps that never name another block
+_NOT_REFERENCES = {"each", "count", "path", "self", "terraform", "null", "true", "false"}
+
+
+class HCLSyntaxError(ValueError):
+    pass
+
+
+def _skip_string(text: str, pos: int) -> int:
+    """pos is just after an opening quote; return the index after the closing one"""
+    n = len(text)
+    while pos < n:
+        char = text[pos]
+        if char == "\\":
+            pos += 2
+            continue
+        if char == '"':
+            return pos + 1
+        if char in "$%" and text.startswith("{", pos + 1):
+            pos = _skip_nested(text, pos + 2, "}")
+            continue
+        if char == "\n":
+            raise HCLSyntaxError("unterminated string")
+        pos += 1
+    raise HCLSyntaxError("unterminated string")
+
+
+def _skip_heredoc(text: str, pos: int) -> int:
+    """pos is at '<<'; return the index after the closing marker line"""
+    match = _HEREDOC.match(text, pos)
+    marker = match.group(1)
+    line_start = match.end()
+    while line_start < len(text):
+        line_end = text.find("\n", line_start)
+        if line_end < 0:
+            line_end = len(text)
+        if text[line_start:line_end].strip() == marker:
+            return line_end
+        line_start = line_end + 1
+    raise HCLSyntaxError(f"unterminated heredoc {marker}")
+
+
+def _skip_comment(text: str, pos: int) -> Optional[int]:
+    """Return the index after a comment starting at pos, or None if there is none"""
+    if text[pos] == "#" or text.startswith("//", pos):
+        end = text.find("\n", pos)
+        return len(text) if end < 0 else end
+    if text.startswith("/*", pos):
+        end = text.find("*/", pos + 2)
+        if end < 0:
+            raise HCLSyntaxError("unterminated comment")
+        return end + 2
+    return None
+
+
+def _skip_nested(text: str, pos: int, closer: str) -> int:
+    """Skip to just after the bracket closing at this level"""
+    pairs = {"{": "}", "[": "]", "(": ")"}
+    n = len(text)
+    while pos < n:
+        char = text[pos]
+        comment_end = _skip_comment(text, pos)
+        if comment_end is not None:
+            pos = comment_end
+        elif char == '"':
+            pos = _skip_string(text, pos + 1)
+        elif text.startswith("<<", pos) and _HEREDOC.match(text, pos):
+            pos = _skip_heredoc(text, pos)
+        elif char in pairs:
+            pos = _skip_nested(text, pos + 1, pairs[char])
+        elif char == closer:
+            return pos + 1
+        else:
+            pos += 1
+    raise HCLSyntaxError(f"missing '{closer}'")
+
+
+def _expression_end(text: str, pos: int, end: int) -> int:
+    """End of an attribute expression: the first newline outside brackets"""
+    pairs = {"{": "}", "[": "]", "(": ")"}
+    while pos < end:
+        char = text[pos]
+        if char == "\n":
+            return pos
+        comment_end = _skip_comment(text, pos)
+        if comment_end is not None:
+            if text[pos] == "#" or text.startswith("//", pos):
+                return comment_end
+            pos = comment_end
+        elif char == '"':
+            pos = _skip_string(text, pos + 1)
+        elif text.startswith("<<", pos) and _HEREDOC.match(text, pos):
+            pos = _skip_heredoc(text, pos)
+        elif char in pairs:
+            pos = _skip_nested(text, pos + 1, pairs[char])
+        else:
+            pos += 1
+    return end
+
+
+def _strip_literals(expr: str) -> str:
+    """Blank out literal string text, keeping ${...} interpolations"""
+    out, pos, n = [], 0, len(expr)
+    while pos < n:
+        char = expr[pos]
+        if char == '"':
+            pos += 1
+            out.append(" ")
+            while pos < n and expr[pos] != '"':
+                if expr[pos] == "\\":
+                    pos += 2
+                    continue
+                if expr[pos] in "$%" and expr.startswith("{", pos + 1):
+                    inner_end = _skip_nested(expr, pos + 2, "}")
+                    out.append(" " + _strip_literals(expr[pos + 2:inner_end - 1]) + " ")
+                    pos = inner_end
+                    continue
+                pos += 1
+            pos += 1
+        elif expr.startswith("<<", pos) and _HEREDOC.match(expr, pos):
+            body_start = _HEREDOC.match(expr, pos).end()
+            pos = _skip_heredoc(expr, pos)
+            out.append(" " + _interpolations(expr[body_start:pos]) + " ")
+        else:
+            comment_end = _skip_comment(expr, pos)
+            if comment_end is not None:
+                pos = comment_end
+                continue
+            out.append(char)
+            pos += 1
+    return "".join(out)
+
+
+def _interpolations(text: str) -> str:
+    """The ${...} / %{...} contents of template text, joined by spaces"""
+    parts, pos = [], 0
+    while True:
+        pos = min((i for i in (text.find("${", pos), text.find("%{", pos)) if i >= 0), default=-1)
+        if pos < 0:
+            return " ".join(parts)
+        try:
+            end = _skip_nested(text, pos + 2, "}")
+        except HCLSyntaxError:
+            return " ".join(parts)
+        parts.append(_strip_literals(text[pos + 2:end - 1]))
+        pos = end
+
+
+def expression_references(expr: str) -> Set[str]:
+    """Raw traversals such as var.x, local.y, aws_vpc.main.id found in expr"""
+    refs = set()
+    for match in _REFERENCE.finditer(_strip_literals(expr)):
+        parts = match.group(1).split(".")
+        if parts[0] in _NOT_REFERENCES:
+            continue
+        if parts[0] == "data":
+            if len(parts) >= 3:
+                refs.add(".".join(parts[:3]))
+        else:
+            # var.x, local.x, module.x or <resource_type>.<name>
+            refs.add(".".join(parts[:2]))
+    return refs
+
+
+def parse_body(text: str, pos: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Parse attributes and blocks between pos and end.
+
+    Returns items {"kind": "attribute", "name", "expr", "start", "end"} and
+    {"kind": "block", "type", "labels", "body", "start", "end"} with offsets
+    into text.
+    """
+    end = len(text) if end is None else end
+    items = []
+    while pos < end:
+        char = text[pos]
+        if char.isspace() or char == ",":
+            pos += 1
+            continue
+        comment_end = _skip_comment(text, pos)
+        if comment_end is not None:
+            pos = comment_end
+            continue
+        match = _IDENT.match(text, pos)
+        if not match:
+            raise HCLSyntaxError(f"unexpected {char!r} at line {text.count(chr(10), 0, pos) + 1}")
+        name, start = match.group(0), pos
+        pos = match.end()
+        while pos < end and text[pos] in " \t":
+            pos += 1
+        if pos < end and text[pos] in "=:" and not text.startswith("==", pos):
+            expr_end = _expression_end(text, pos + 1, end)
+            items.append({"kind": "attribute", "name": name, "expr": text[pos + 1:expr_end].strip(),
+                          "start": start, "end": expr_end})
+            pos = expr_end
+            continue
+        labels = []
+        while pos < end and text[pos] != "{":
+            if text[pos] == '"':
+                label_end = _skip_string(text, pos + 1)
+                labels.append(text[pos + 1:label_end - 1])
+                pos = label_end
+            elif text[pos] in " \t":
+                pos += 1
+            else:
+                label = _IDENT.match(text, pos)
+                if not label:
+                    raise HCLSyntaxError(f"unexpected {text[pos]!r} at line {text.count(chr(10), 0, pos) + 1}")
+                labels.append(label.group(0))
+                pos = label.end()
+        if pos >= end:
+            raise HCLSyntaxError(f"block {name} has no body")
+        close = _skip_nested(text, pos + 1, "}")
+        items.append({"kind": "block", "type": name, "labels": labels,
+                      "body": parse_body(text, pos + 1, close - 1), "start": start, "end": close})
+        pos = close
+    return items
+
+
+def _block_address(block_type: str, labels: List[str]) -> Optional[Tuple[str, str, Optional[str], str]]:
+    """(address, kind, type, name) for a top-level block"""
+    if block_type == "resource" and len(labels) == 2:
+        return f"{labels[0]}.{labels[1]}", "resource", labels[0], labels[1]
+    if block_type == "data" and len(labels) == 2:
+        return f"data.{labels[0]}.{labels[1]}", "data", labels[0], labels[1]
+    if block_type == "module" and labels:
+        return f"module.{labels[0]}", "module", None, labels[0]
+    if block_type == "variable" and labels:
+        return f"var.{labels[0]}", "variable", None, labels[0]
+    if block_type == "output" and labels:
+        return f"output.{labels[0]}", "output", None, labels[0]
+    if block_type == "provider" and labels:
+        return f"provider.{labels[0]}", "provider", labels[0], labels[0]
+    if block_type == "terraform":
+        return "terraform", "terraform", None, "terraform"
+    return None
+
+
+def _collect(items: List[Dict[str, Any]], text: str, refs: Set[str], nested: List[str]) -> List[str]:
+    attributes = []
+    for item in items:
+        if item["kind"] == "attribute":
+            attributes.append(item["name"])
+            refs.update(expression_references(item["expr"]))
+        else:
+            nested.append(item["type"])
+            _collect(item["body"], text, refs, [])
+    return attributes
+
+
+def _parse_file(text: str, filename: str) -> Tuple[List[Dict[str, Any]], str]:
+    """Symbol records plus a hash of the blocks that have no address (moved, import, check...)"""
+    def line_of(offset):
+        return text.count("\n", 0, offset) + 1
+
+    symbols = []
+    unindexed = hashlib.sha256()
+    for item in parse_body(text):
+        if item["kind"] != "block":
+            continue
+        if item["type"] == "locals":
+            for attr in item["body"]:
+                if attr["kind"] != "attribute":
+                    continue
+                source = text[attr["start"]:attr["end"]]
+                symbols.append({
+                    "address": f"local.{attr['name']}", "kind": "local", "type": None, "name": attr["name"],
+                    "file": filename, "line": line_of(attr["start"]), "end_line": line_of(attr["end"]),
+                    "attributes": [], "blocks": [], "raw_references": sorted(expression_references(attr["expr"])),
+                    "hash": hashlib.sha256(source.encode()).hexdigest()[:16]
+                })
+            continue
+        identity = _block_address(item["type"], item["labels"])
+        if identity is None:
+            unindexed.update(text[item["start"]:item["end"]].encode() + b"\0")
+            continue
+        address, kind, rtype, name = identity
+        refs, nested = set(), []
+        attributes = _collect(item["body"], text, refs, nested)
+        source = text[item["start"]:item["end"]]
+        symbols.append({
+            "address": address, "kind": kind, "type": rtype, "name": name,
+            "file": filename, "line": line_of(item["start"]), "end_line": line_of(item["end"]),
+            "attributes": attributes, "blocks": nested, "raw_references": sorted(refs),
+            "hash": hashlib.sha256(source.encode()).hexdigest()[:16]
+        })
+    return symbols, unindexed.hexdigest()[:16]
+
+
+class SymbolIndex:
+    """Symbols of one module directory, re-parsing only files that changed"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # name -> ((mtime, size), symbols, parse error, hash of blocks without an address)
+        self._files: Dict[str, Tuple[Tuple[int, int], List[Dict[str, Any]], Optional[str], str]] = {}
+        self._resolved: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def refresh(self) -> None:
+        current = set()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".tf"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            current.add(name)
+            signature = (st.st_mtime_ns, st.st_size)
+            cached = self._files.get(name)
+            if cached and cached[0] == signature:
+                continue
+            with open(path, errors="replace") as f:
+                text = f.read()
+            try:
+                symbols, unindexed = _parse_file(text, name)
+                self._files[name] = (signature, symbols, None, unindexed)
+            except HCLSyntaxError as e:
+                self._files[name] = (signature, [], str(e), "")
+            self._resolved = None
+        for name in set(self._files) - current:
+            del self._files[name]
+            self._resolved = None
+
+    def errors(self) -> Dict[str, str]:
+        self.refresh()
+        return {name: entry[2] for name, entry in self._files.items() if entry[2]}
+
+    def symbols(self) -> Dict[str, Dict[str, Any]]:
+        """address -> symbol, with references resolved to known addresses"""
+        self.refresh()
+        if self._resolved is not None:
+            return self._resolved
+        symbols = {}
+        for _, entries, _, _ in self._files.values():
+            for symbol in entries:
+                symbols[symbol["address"]] = dict(symbol)
+        for symbol in symbols.values():
+            # Keep only traversals that name something declared in this module
+            symbol["references"] = sorted(ref for ref in symbol["raw_references"]
+                                          if ref in symbols and ref != symbol["address"])
+        for symbol in symbols.values():
+            symbol["referenced_by"] = []
+        for address, symbol in symbols.items():
+            for ref in symbol["references"]:
+                symbols[ref]["referenced_by"].append(address)
+        self._resolved = symbols
+        return symbols
+
+    def block_hashes(self) -> Tuple[Dict[str, str], str]:
+        """Content hash per block address, plus one hash over blocks without an address.
+
+        Blocks sharing an address (e.g. aliased providers) are hashed together
+        so an edit to any of them shows up.
+        """
+        self.refresh()
+        hashes: Dict[str, List[str]] = {}
+        unindexed = hashlib.sha256()
+        for name in sorted(self._files):
+            _, entries, _, other = self._files[name]
+            for symbol in entries:
+                hashes.setdefault(symbol["address"], []).append(symbol["hash"])
+            unindexed.update(f"{name}\0{other}\0".encode())
+        return {address: "+".join(parts) for address, parts in hashes.items()}, unindexed.hexdigest()
+
+    def find(self, query: Optional[str] = None, kind: Optional[str] = None,
+             rtype: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Symbols whose address matches query (glob or substring), kind and type"""
+        matches = []
+        for address, symbol in sorted(self.symbols().items()):
+            if kind and symbol["kind"] != kind:
+                continue
+            if rtype and symbol["type"] != rtype:
+                continue
+            if query and not (fnmatch.fnmatchcase(address, query) or query in address):
+                continue
+            matches.append(symbol)
+        return matches
+
+    def edges(self) -> List[Tuple[str, str]]:
+        return [(address, ref) for address, symbol in sorted(self.symbols().items())
+                for ref in symbol["references"]]
+
+    def dependents(self, addresses: Set[str]) -> Set[str]:
+        """addresses plus everything that transitively references them"""
+        symbols = self.symbols()
+        seen, stack = set(), [a for a in addresses if a in symbols]
+        while stack:
+            address = stack.pop()
+            if address in seen:
+                continue
+            seen.add(address)
+            stack.extend(symbols[address]["referenced_by"])
+        return seen | set(addresses)
+
+    def dependencies(self, addresses: Set[str]) -> Set[str]:
+        """addresses plus everything they transitively reference"""
+        symbols = self.symbols()
+        seen, stack = set(), [a for a in addresses if a in symbols]
+        while stack:
+            address = stack.pop()
+            if address in seen:
+                continue
+            seen.add(address)
+            stack.extend(symbols[address]["references"])
+        return seen | set(addresses)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Terraform Jobs - Per-working-directory job scheduling for the MCP server
+
+Terraform commands against the same working directory are serialized (they
+would only fight over the state lock), while different directories run in
+parallel up to a concurrency cap. Every command becomes a Job that callers
+can await directly or poll later by ID.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Lines of recent output kept per job for status queries
+JOB_TAIL_LINES = 20
+
+
+class Job:
+    """One scheduled terraform command"""
+
+    def __init__(self, tool: str, working_dir: str, command: str, owner: Optional[str] = None):
+        self.id = f"job-{uuid.uuid4().hex[:12]}"
+        self.owner = owner
+        self.tool = tool
+        self.working_dir = working_dir
+        self.command = command
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.tail = deque(maxlen=JOB_TAIL_LINES)
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    def output_hook(self, forward=None):
+        """Return an on_output callback that records the tail and forwards lines"""
+        async def hook(stream: str, line: str) -> None:
+            self.tail.append(line)
+            if forward is not None:
+                await forward(stream, line)
+        return hook
+
+    def describe(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "job_id": self.id,
+            "client": self.owner or "server",
+            "tool": self.tool,
+            "working_dir": self.working_dir,
+            "command": self.command,
+            "status": self.status,
+            "queued_seconds": round((self.started_at or now) - self.created_at, 3),
+            "run_seconds": round((self.finished_at or now) - self.started_at, 3) if self.started_at else None,
+            "error": self.error,
+            "recent_output": list(self.tail)
+        }
+
+
+class JobScheduler:
+    """Serialize jobs per working directory and cap how many run at once"""
+
+    def __init__(self, max_concurrent: int, history_limit: int = 100):
+        self.max_concurrent = max_concurrent
+        self.history_limit = history_limit
+        self.jobs: Dict[str, Job] = {}
+        self._dir_locks: Dict[str, asyncio.Lock] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _lock_for(self, working_dir: str) -> asyncio.Lock:
+        key = os.path.realpath(working_dir)
+        if key not in self._dir_locks:
+            self._dir_locks[key] = asyncio.Lock()
+        return self._dir_locks[key]
+
+    def submit(self, tool: str, working_dir: str, command: str,
+               runner: Callable[[Job], Awaitable[Dict[str, Any]]], owner: Optional[str] = None) -> Job:
+        """Queue runner(job) behind other jobs for working_dir and return the job.
+
+        owner identifies the client session that submitted it (None for the
+        server's own background jobs).
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+        job = Job(tool, working_dir, command, owner)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, runner))
+        self._prune()
+        return job
+
+    async def _run(self, job: Job, runner) -> Optional[Dict[str, Any]]:
+        try:
+            # Take the directory lock first so a queued job never holds a slot
+            async with self._lock_for(job.working_dir):
+                async with self._slots:
+                    job.status = "running"
+                    job.started_at = time.time()
+                    job.result = await runner(job)
+            job.status = "succeeded" if job.result.get("success") else "failed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+        return job.result
+
+    def busy(self, working_dir: str) -> bool:
+        """True if working_dir has a job queued or running, or every slot is taken"""
+        return self._lock_for(working_dir).locked() or (self._slots is not None and self._slots.locked())
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return sorted(self.jobs.values(), key=lambda job: job.created_at)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; returns False if it already finished"""
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        job.task.cancel()
+        return True
+
+    async def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        """Wait up to timeout seconds for job to finish; True if it did"""
+        if not job.done:
+            try:
+                await asyncio.wait_for(asyncio.shield(job.task), timeout)
+            except asyncio.TimeoutError:
+                return False
+            except (asyncio.CancelledError, Exception):
+                if not job.task.done():
+                    # We were cancelled ourselves, not the job
+                    raise
+        return True
+
+    def _prune(self) -> None:
+        finished = [job for job in self.list() if job.done]
+        for job in finished[:max(0, len(finished) - self.history_limit)]:
+            del self.jobs[job.id]
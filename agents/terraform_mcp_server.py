@@ -4,13 +4,22 @@ Terraform MCP Server for Agentic System
 Provides Terraform operations to Claude agents via MCP protocol
 """
 
+import argparse
 import asyncio
+import glob
+import hashlib
 import json
 import os
-import subprocess
+import signal
 import sys
-from typing import Any, Dict, List, Optional
+import time
+import uuid
+import weakref
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
 
+import anyio
 from mcp.server import Server
 from mcp.types import (
     Resource,
@@ -22,58 +31,146 @@ from mcp.types import (
 )
 import mcp.server.stdio
 
+from terraform_cache import (
+    CACHE_ROOT,
+    PlanCache,
+    PlanTimings,
+    StateSnapshots,
+    config_files,
+    config_hash,
+    current_workspace,
+    file_digest,
+    init_fingerprint,
+    read_init_record,
+    state_identity,
+    state_signature,
+    write_init_record
+)
+from terraform_checks import CHECK_KINDS, SPECULATIVE_CHECKS, ChangeWatcher, CheckCache
+from terraform_files import FileIndex, FileReader
+from terraform_hcl import SymbolIndex
+from terraform_jobs import JobScheduler
+from terraform_metrics import METRICS_URI, Metrics
+from terraform_summary import (
+    PlanSummary,
+    ResultPages,
+    StateIndex,
+    summarize_state,
+    summarize_validate,
+    with_pages
+)
+
 # Server instance
 server = Server("terraform-agent")
 
 # Get the terraform directory from environment or use current directory
 TERRAFORM_DIR = os.getenv("TERRAFORM_DIR", os.getcwd())
 
+# Terraform commands are stopped after this long (seconds)
+COMMAND_TIMEOUT = 300
+# Time terraform gets to exit after SIGINT before its process group is killed
+KILL_GRACE_PERIOD = 10
+# Output kept per stream for the final tool response; older lines are dropped
+OUTPUT_MAX_LINES = int(os.getenv("TERRAFORM_OUTPUT_MAX_LINES", "2000"))
+OUTPUT_MAX_BYTES = int(os.getenv("TERRAFORM_OUTPUT_MAX_BYTES", str(1024 * 1024)))
+# Provider plugin cache shared by every working directory
+PLUGIN_CACHE_DIR = os.getenv("TF_PLUGIN_CACHE_DIR") or os.path.join(CACHE_ROOT, "plugin-cache")
+# Optional local provider mirror; init then installs from it without network access
+PROVIDER_MIRROR = os.getenv("TERRAFORM_PROVIDER_MIRROR")
+# Transport used when none is given on the command line: stdio or http
+TRANSPORT = os.getenv("TERRAFORM_MCP_TRANSPORT", "stdio")
+# Address of the shared HTTP server (keep it on loopback: there is no authentication)
+HTTP_HOST = os.getenv("TERRAFORM_MCP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.getenv("TERRAFORM_MCP_PORT", "8765"))
+# Niceness of background (speculative) terraform runs
+BACKGROUND_NICENESS = 10
+# Working directories that may run terraform at the same time
+MAX_CONCURRENT_JOBS = int(os.getenv("TERRAFORM_MAX_CONCURRENT_JOBS", "4"))
+# Incremental plans fall back to a full plan when the last one is older than this (seconds)
+INCREMENTAL_FULL_INTERVAL = int(os.getenv("TERRAFORM_INCREMENTAL_FULL_INTERVAL", "3600"))
+# ...or when more addresses than this would have to be targeted
+INCREMENTAL_MAX_TARGETS = int(os.getenv("TERRAFORM_INCREMENTAL_MAX_TARGETS", "50"))
+# terraform's own -parallelism default, and the most a quick check will try
+DEFAULT_PARALLELISM = 10
+MAX_PARALLELISM = 40
+# Quick checks still refresh when a full plan of the directory is known to be this fast
+QUICK_FULL_PLAN_SECONDS = float(os.getenv("TERRAFORM_QUICK_FULL_PLAN_SECONDS", "15"))
+# Quick checks slower than this try a higher -parallelism next time
+QUICK_SLOW_SECONDS = 30
+
+scheduler = JobScheduler(MAX_CONCURRENT_JOBS)
+plan_cache = PlanCache()
+plan_timings = PlanTimings()
+state_snapshots = StateSnapshots()
+result_pages = ResultPages()
+file_index = FileIndex(TERRAFORM_DIR)
+file_reader = FileReader()
+symbol_indexes: Dict[str, SymbolIndex] = {}
+check_cache = CheckCache()
+# realpath -> block hashes and other inputs of the last successful untargeted plan
+plan_baselines: Dict[str, Dict[str, Any]] = {}
+metrics = Metrics()
+# Client session -> client ID used as the owner of its jobs
+_client_ids: "weakref.WeakKeyDictionary[Any, str]" = weakref.WeakKeyDictionary()
+INIT_STATS = {"runs": 0, "skipped": 0, "failed": 0, "seconds": 0.0}
+
 @server.list_resources()
 async def list_resources() -> List[Resource]:
     """List available Terraform resources"""
-    resources = []
-    
-    # List terraform files
-    for file in os.listdir(TERRAFORM_DIR):
-        if file.endswith('.tf'):
-            resources.append(
-                Resource(
-                    uri=f"file://{TERRAFORM_DIR}/{file}",
-                    name=f"Terraform Config: {file}",
-                    mimeType="text/plain",
-                    description=f"Terraform configuration file: {file}"
-                )
-            )
+    resources = [
+        Resource(
+            uri=METRICS_URI,
+            name="Terraform agent metrics",
+            mimeType="application/json",
+            description="Tool/directory/command latency, output sizes, timeouts and cache hit rates "
+                        "(append ?format=prometheus for Prometheus text)"
+        )
+    ]
     
-    # List tfvars files
-    for file in os.listdir(TERRAFORM_DIR):
-        if file.endswith('.tfvars'):
-            resources.append(
-                Resource(
-                    uri=f"file://{TERRAFORM_DIR}/{file}",
-                    name=f"Terraform Variables: {file}",
-                    mimeType="text/plain",
-                    description=f"Terraform variables file: {file}"
-                )
+    # Terraform files of the root and nested modules, from the warm index
+    for module, rel in file_index.files():
+        path = os.path.join(file_index.root, rel)
+        kind = "Variables" if rel.endswith((".tfvars", ".tfvars.json")) else "Config"
+        resources.append(
+            Resource(
+                uri=f"file://{path}",
+                name=f"Terraform {kind}: {rel}",
+                mimeType="text/plain",
+                description=f"Terraform {kind.lower()} file: {rel} (module: {module})"
             )
+        )
     
     return resources
 
 @server.read_resource()
-async def read_resource(uri: str) -> str:
-    """Read a terraform resource file"""
-    if not uri.startswith("file://"):
+async def read_resource(uri) -> str:
+    """Read a terraform resource file.
+    
+    Large files are returned in chunks. Append ?offset=N&length=M for a byte
+    range or ?lines=A-B for a line range.
+    """
+    parts = urlsplit(str(uri))
+    if str(uri).split("?")[0] == METRICS_URI:
+        if parse_qs(parts.query).get("format") == ["prometheus"]:
+            return metrics.prometheus()
+        return metrics.to_json()
+    if parts.scheme != "file":
         raise ValueError(f"Unsupported URI scheme: {uri}")
     
-    path = uri[7:]  # Remove "file://" prefix
+    path = unquote(parts.path)
     
     if not os.path.exists(path):
         raise FileNotFoundError(f"File not found: {path}")
     
-    with open(path, 'r') as f:
-        content = f.read()
+    query = parse_qs(parts.query)
+    lines = None
+    if "lines" in query:
+        first, _, last = query["lines"][0].partition("-")
+        lines = (int(first), int(last or first))
+    offset = int(query["offset"][0]) if "offset" in query else None
+    length = int(query["length"][0]) if "length" in query else None
     
-    return content
+    return file_reader.read(path, offset, length, lines)
 
 @server.list_tools()
 async def list_tools() -> List[Tool]:
@@ -89,6 +186,26 @@ async def list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Working directory for Terraform (optional)",
                         "default": TERRAFORM_DIR
+                    },
+                    "force": {
+                        "type": "boolean",
+                        "description": "Run init even if nothing relevant changed since the last init",
+                        "default": False
+                    },
+                    "upgrade": {
+                        "type": "boolean",
+                        "description": "Upgrade providers and modules within their version constraints",
+                        "default": False
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Send output lines as log notifications while the command runs",
+                        "default": False
+                    },
+                    "async": {
+                        "type": "boolean",
+                        "description": "Return a job ID immediately instead of waiting for the result",
+                        "default": False
                     }
                 }
             }
@@ -111,6 +228,56 @@ async def list_tools() -> List[Tool]:
                     "target": {
                         "type": "string",
                         "description": "Target specific resources (optional)"
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Send output lines as log notifications while the command runs",
+                        "default": False
+                    },
+                    "async": {
+                        "type": "boolean",
+                        "description": "Return a job ID immediately instead of waiting for the result",
+                        "default": False
+                    },
+                    "use_cache": {
+                        "type": "boolean",
+                        "description": "Reuse the saved plan when configuration, arguments and state are unchanged",
+                        "default": True
+                    },
+                    "output": {
+                        "type": "string",
+                        "enum": ["summary", "text"],
+                        "description": "summary: compact JSON (counts, diagnostics with file:line, outputs); text: raw terraform output",
+                        "default": "summary"
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Refresh remote objects first; false gives a fast config-vs-state diff that is never auto-applied",
+                        "default": True
+                    },
+                    "refresh_only": {
+                        "type": "boolean",
+                        "description": "Only detect drift between state and real infrastructure (-refresh-only)",
+                        "default": False
+                    },
+                    "parallelism": {
+                        "type": "integer",
+                        "description": "Concurrent provider operations (-parallelism, terraform default 10)"
+                    },
+                    "quick": {
+                        "type": "boolean",
+                        "description": "Quick check: let the server pick refresh and parallelism from this directory's past plan timings",
+                        "default": False
+                    },
+                    "incremental": {
+                        "type": "boolean",
+                        "description": "Plan only the blocks changed since the last successful plan, and what references them (-target)",
+                        "default": False
+                    },
+                    "full": {
+                        "type": "boolean",
+                        "description": "With incremental: force a full plan (drift detection)",
+                        "default": False
                     }
                 }
             }
@@ -134,6 +301,21 @@ async def list_tools() -> List[Tool]:
                         "type": "boolean",
                         "description": "Auto-approve the apply",
                         "default": False
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Send output lines as log notifications while the command runs",
+                        "default": False
+                    },
+                    "async": {
+                        "type": "boolean",
+                        "description": "Return a job ID immediately instead of waiting for the result",
+                        "default": False
+                    },
+                    "use_cache": {
+                        "type": "boolean",
+                        "description": "Reuse the saved plan when configuration, arguments and state are unchanged",
+                        "default": True
                     }
                 }
             }
@@ -157,6 +339,16 @@ async def list_tools() -> List[Tool]:
                         "type": "boolean",
                         "description": "Auto-approve the destroy",
                         "default": False
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Send output lines as log notifications while the command runs",
+                        "default": False
+                    },
+                    "async": {
+                        "type": "boolean",
+                        "description": "Return a job ID immediately instead of waiting for the result",
+                        "default": False
                     }
                 }
             }
@@ -171,6 +363,12 @@ async def list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Working directory for Terraform (optional)",
                         "default": TERRAFORM_DIR
+                    },
+                    "output": {
+                        "type": "string",
+                        "enum": ["summary", "text"],
+                        "description": "summary: compact JSON (counts, diagnostics with file:line, outputs); text: raw terraform output",
+                        "default": "summary"
                     }
                 }
             }
@@ -207,8 +405,17 @@ async def list_tools() -> List[Tool]:
                     },
                     "format": {
                         "type": "string",
-                        "description": "Output format (json, text)",
-                        "default": "text"
+                        "enum": ["summary", "json", "text"],
+                        "description": "Output format: compact summary (resource counts by type, outputs), raw json or text",
+                        "default": "summary"
+                    },
+                    "type": {
+                        "type": "string",
+                        "description": "Only include resources of this type, e.g. aws_subnet (optional)"
+                    },
+                    "address_prefix": {
+                        "type": "string",
+                        "description": "Only include addresses starting with this, e.g. module.network. (optional)"
                     }
                 }
             }
@@ -223,58 +430,1115 @@ async def list_tools() -> List[Tool]:
                         "type": "string",
                         "description": "Working directory for Terraform (optional)",
                         "default": TERRAFORM_DIR
+                    },
+                    "type": {
+                        "type": "string",
+                        "description": "Only include resources of this type, e.g. aws_subnet (optional)"
+                    },
+                    "address_prefix": {
+                        "type": "string",
+                        "description": "Only include addresses starting with this, e.g. module.network. (optional)"
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="terraform_validate_many",
+            description="Validate many working directories in parallel and return one aggregated report",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "dirs": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Working directories, absolute or relative to TERRAFORM_DIR (optional)"
+                    },
+                    "glob": {
+                        "type": "string",
+                        "description": "Glob relative to TERRAFORM_DIR selecting working directories, e.g. 'stacks/*' (optional)"
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Send a log notification as each stack finishes",
+                        "default": False
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="terraform_plan_many",
+            description="Plan many working directories and workspaces in parallel and return one aggregated report",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "dirs": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Working directories, absolute or relative to TERRAFORM_DIR (optional)"
+                    },
+                    "glob": {
+                        "type": "string",
+                        "description": "Glob relative to TERRAFORM_DIR selecting working directories, e.g. 'stacks/*' (optional)"
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Send a log notification as each stack finishes",
+                        "default": False
+                    },
+                    "workspaces": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Workspaces to plan in every directory (optional, default: the selected one)"
+                    },
+                    "var_file": {
+                        "type": "string",
+                        "description": "Variable file to use, relative to each directory (optional)"
+                    },
+                    "use_cache": {
+                        "type": "boolean",
+                        "description": "Reuse saved plans when configuration, arguments and state are unchanged",
+                        "default": True
+                    },
+                    "quick": {
+                        "type": "boolean",
+                        "description": "Quick check: pick refresh and parallelism per directory from past plan timings",
+                        "default": False
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="terraform_fmt_many",
+            description="Check (or fix) formatting in many working directories in parallel",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "dirs": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Working directories, absolute or relative to TERRAFORM_DIR (optional)"
+                    },
+                    "glob": {
+                        "type": "string",
+                        "description": "Glob relative to TERRAFORM_DIR selecting working directories, e.g. 'stacks/*' (optional)"
+                    },
+                    "stream": {
+                        "type": "boolean",
+                        "description": "Send a log notification as each stack finishes",
+                        "default": False
+                    },
+                    "check": {
+                        "type": "boolean",
+                        "description": "Only report files that need formatting",
+                        "default": True
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="terraform_find_resource",
+            description="Find resources, data sources, modules, variables, outputs and locals in the configuration without running terraform",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "working_dir": {
+                        "type": "string",
+                        "description": "Working directory for Terraform (optional)",
+                        "default": TERRAFORM_DIR
+                    },
+                    "query": {
+                        "type": "string",
+                        "description": "Address glob or substring, e.g. 'aws_instance.*' or 'nat' (optional)"
+                    },
+                    "kind": {
+                        "type": "string",
+                        "enum": ["resource", "data", "module", "variable", "output", "local", "provider", "terraform"],
+                        "description": "Only return blocks of this kind (optional)"
+                    },
+                    "type": {
+                        "type": "string",
+                        "description": "Only return resources/data sources of this type, e.g. aws_subnet (optional)"
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="terraform_references",
+            description="Show what a block references and what references it, from the parsed configuration",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "working_dir": {
+                        "type": "string",
+                        "description": "Working directory for Terraform (optional)",
+                        "default": TERRAFORM_DIR
+                    },
+                    "address": {
+                        "type": "string",
+                        "description": "Block address, e.g. aws_vpc.main, var.cidr, local.tags, module.db"
+                    },
+                    "transitive": {
+                        "type": "boolean",
+                        "description": "Also list all transitive dependencies and dependents",
+                        "default": False
+                    }
+                },
+                "required": ["address"]
+            }
+        ),
+        Tool(
+            name="terraform_graph",
+            description="Reference graph of the configuration (edges point from a block to what it references)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "working_dir": {
+                        "type": "string",
+                        "description": "Working directory for Terraform (optional)",
+                        "default": TERRAFORM_DIR
+                    },
+                    "address": {
+                        "type": "string",
+                        "description": "Only include blocks connected to this address (optional)"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["edges", "dot"],
+                        "description": "JSON edge list or Graphviz dot",
+                        "default": "edges"
                     }
                 }
             }
+        ),
+        Tool(
+            name="terraform_result_page",
+            description="Page through the full detail behind a summarized plan, validate or show result",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "result_id": {
+                        "type": "string",
+                        "description": "result_id from a summary"
+                    },
+                    "section": {
+                        "type": "string",
+                        "description": "Section listed under 'pages' in the summary (e.g. changes, diagnostics, resources)"
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Index of the first item to return",
+                        "default": 0
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of items to return",
+                        "default": 50
+                    }
+                },
+                "required": ["result_id", "section"]
+            }
+        ),
+        Tool(
+            name="terraform_job_status",
+            description="Show the status and recent output of a terraform job (all jobs if job_id is omitted)",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {
+                        "type": "string",
+                        "description": "Job ID returned by an async tool call (optional)"
+                    },
+                    "all": {
+                        "type": "boolean",
+                        "description": "List the jobs of every connected client, not just this one's",
+                        "default": False
+                    }
+                }
+            }
+        ),
+        Tool(
+            name="terraform_job_result",
+            description="Get the result of a terraform job, optionally waiting for it to finish",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {
+                        "type": "string",
+                        "description": "Job ID returned by an async tool call"
+                    },
+                    "wait": {
+                        "type": "number",
+                        "description": "Seconds to wait for the job to finish",
+                        "default": 0
+                    }
+                },
+                "required": ["job_id"]
+            }
+        ),
+        Tool(
+            name="terraform_job_cancel",
+            description="Cancel a queued or running terraform job",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "job_id": {
+                        "type": "string",
+                        "description": "Job ID returned by an async tool call"
+                    }
+                },
+                "required": ["job_id"]
+            }
         )
     ]
 
-async def run_terraform_command(cmd: List[str], working_dir: str = None) -> Dict[str, Any]:
-    """Run a terraform command and return result"""
+class OutputBuffer:
+    """Ring buffer holding the most recent output lines of one stream.
+
+    Memory stays bounded by max_lines/max_bytes however chatty terraform is;
+    pass None for both to keep everything (e.g. for -json output).
+    """
+
+    def __init__(self, max_lines: Optional[int] = OUTPUT_MAX_LINES,
+                 max_bytes: Optional[int] = OUTPUT_MAX_BYTES):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.lines = deque()
+        self.size = 0
+        self.dropped = 0
+        self.total_bytes = 0
+
+    def append(self, line: str) -> None:
+        self.lines.append(line)
+        self.size += len(line) + 1
+        self.total_bytes += len(line) + 1
+        while self.lines and (
+            (self.max_lines is not None and len(self.lines) > self.max_lines)
+            or (self.max_bytes is not None and self.size > self.max_bytes)
+        ):
+            self.size -= len(self.lines.popleft()) + 1
+            self.dropped += 1
+
+    def text(self) -> str:
+        body = "\n".join(self.lines)
+        if self.dropped:
+            return f"... {self.dropped} earlier line(s) omitted ...\n{body}"
+        return body
+
+async def _pump_output(stream, name: str, buffer: OutputBuffer, on_output) -> None:
+    """Split a subprocess stream into lines, buffering and forwarding each one"""
+    pending = b""
+    while True:
+        chunk = await stream.read(65536)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for raw in lines:
+            line = raw.decode(errors="replace").rstrip("\r")
+            buffer.append(line)
+            if on_output is not None:
+                await on_output(name, line)
+    if pending:
+        line = pending.decode(errors="replace")
+        buffer.append(line)
+        if on_output is not None:
+            await on_output(name, line)
+
+async def _stop_process_group(proc) -> None:
+    """Interrupt terraform's process group, killing it if it does not exit in time.
+
+    SIGINT lets terraform stop gracefully and release the state lock; the final
+    SIGKILL also reaps provider plugins left behind in the group.
+    """
+    try:
+        if proc.returncode is None:
+            os.killpg(proc.pid, signal.SIGINT)
+            try:
+                await asyncio.wait_for(proc.wait(), KILL_GRACE_PERIOD)
+            except asyncio.TimeoutError:
+                pass
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+async def run_terraform_command(cmd: List[str], working_dir: str = None, on_output=None,
+                                max_lines: Optional[int] = OUTPUT_MAX_LINES,
+                                max_bytes: Optional[int] = OUTPUT_MAX_BYTES,
+                                env: Optional[Dict[str, str]] = None,
+                                low_priority: bool = False) -> Dict[str, Any]:
+    """Run a terraform command without blocking the event loop and return result.
+
+    The command runs in its own process group so that a timeout, a cancelled
+    tool call or a failing output hook stops terraform and every provider
+    plugin it started. Each output
+    line is passed to `await on_output(stream, line)` as soon as it arrives;
+    the returned stdout/stderr hold only the most recent lines (see OutputBuffer).
+    """
     if working_dir is None:
         working_dir = TERRAFORM_DIR
+    subcommand = cmd[1] if len(cmd) > 1 else cmd[0]
     
     try:
-        result = subprocess.run(
-            cmd,
+        os.makedirs(PLUGIN_CACHE_DIR, exist_ok=True)
+        spawn_started = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
             cwd=working_dir,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=dict(os.environ, TF_PLUGIN_CACHE_DIR=PLUGIN_CACHE_DIR, **(env or {})),
+            start_new_session=True
         )
-        
-        return {
-            "success": result.returncode == 0,
-            "returncode": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "command": " ".join(cmd)
-        }
-    except subprocess.TimeoutExpired:
+    except Exception as e:
+        metrics.spawn_failed(subcommand)
         return {
             "success": False,
             "returncode": -1,
             "stdout": "",
-            "stderr": "Command timed out after 5 minutes",
+            "stderr": str(e),
             "command": " ".join(cmd)
         }
-    except Exception as e:
+    started = time.monotonic()
+    if low_priority:
+        try:
+            os.setpriority(os.PRIO_PROCESS, proc.pid, BACKGROUND_NICENESS)
+        except (AttributeError, OSError):
+            pass
+    
+    def record(timed_out: bool = False) -> None:
+        metrics.observe_command(subcommand, working_dir, started - spawn_started, time.monotonic() - started,
+                                stdout.total_bytes, stderr.total_bytes, timed_out)
+    
+    stdout = OutputBuffer(max_lines, max_bytes)
+    stderr = OutputBuffer(max_lines, max_bytes)
+    io = asyncio.gather(
+        _pump_output(proc.stdout, "stdout", stdout, on_output),
+        _pump_output(proc.stderr, "stderr", stderr, on_output),
+        proc.wait()
+    )
+    # Consume the outcome so an interrupted gather is not reported as unhandled
+    io.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        await asyncio.wait_for(io, COMMAND_TIMEOUT)
+    except asyncio.TimeoutError:
+        await _stop_process_group(proc)
+        record(timed_out=True)
         return {
             "success": False,
             "returncode": -1,
-            "stdout": "",
-            "stderr": str(e),
+            "stdout": stdout.text(),
+            "stderr": f"Command timed out after {COMMAND_TIMEOUT // 60} minutes",
             "command": " ".join(cmd)
         }
+    except BaseException:
+        # Cancelled, or an output hook failed: never leave terraform running
+        # unread. Finish the cleanup even if the caller is cancelled again.
+        io.cancel()
+        await asyncio.shield(_stop_process_group(proc))
+        record()
+        raise
+    
+    record()
+    return {
+        "success": proc.returncode == 0,
+        "returncode": proc.returncode,
+        "stdout": stdout.text(),
+        "stderr": stderr.text(),
+        "command": " ".join(cmd)
+    }
+
+def client_id() -> Optional[str]:
+    """ID of the client session making the current request (None outside a request)"""
+    try:
+        session = server.request_context.session
+    except LookupError:
+        return None
+    if session not in _client_ids:
+        _client_ids[session] = f"client-{uuid.uuid4().hex[:8]}"
+    return _client_ids[session]
+
+def _output_notifier(arguments: Dict[str, Any]):
+    """Forward output lines to the calling client while a command runs.
+
+    Uses progress notifications when the client sent a progress token, and
+    log notifications when the tool was called with stream=true.
+    """
+    try:
+        ctx = server.request_context
+    except LookupError:
+        return None
+    token = ctx.meta.progressToken if ctx.meta else None
+    if token is None and not arguments.get("stream", False):
+        return None
+    lines_sent = 0
+    
+    async def notify(stream: str, line: str) -> None:
+        nonlocal lines_sent
+        lines_sent += 1
+        try:
+            if token is not None:
+                await ctx.session.send_progress_notification(
+                    token, lines_sent, message=line, related_request_id=ctx.request_id
+                )
+            else:
+                await ctx.session.send_log_message(
+                    "info" if stream == "stdout" else "warning",
+                    line,
+                    logger="terraform",
+                    related_request_id=ctx.request_id
+                )
+        except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+            # The client went away; keep running and just buffer the output
+            pass
+    
+    return notify
+
+def init_stats_line() -> str:
+    runs = INIT_STATS["runs"]
+    average = INIT_STATS["seconds"] / runs if runs else 0
+    return (f"📊 Init stats: {runs} run(s), {INIT_STATS['skipped']} skipped, "
+            f"{INIT_STATS['failed']} failed, {average:.1f}s average")
+
+async def run_init(cmd: List[str], working_dir: str, arguments: Dict[str, Any], on_output) -> Dict[str, Any]:
+    """Run init unless nothing it depends on changed since the last successful init"""
+    inputs = {"args": cmd[2:]}
+    if not arguments.get("force", False) and not arguments.get("upgrade", False):
+        record = read_init_record(working_dir)
+        fresh = record is not None and record["fingerprint"] == init_fingerprint(working_dir, inputs)
+        metrics.cache("init", fresh)
+        if fresh:
+            INIT_STATS["skipped"] += 1
+            return {
+                "success": True,
+                "returncode": 0,
+                "stdout": "",
+                "stderr": "",
+                "command": " ".join(cmd),
+                "note": f"⏭️ Skipped init: lock file, backend and module blocks unchanged since the last "
+                        f"init {int(time.time() - record['initialized_at'])}s ago\n{init_stats_line()}"
+            }
+    
+    started = time.monotonic()
+    result = await run_terraform_command(cmd, working_dir, on_output)
+    duration = time.monotonic() - started
+    INIT_STATS["runs"] += 1
+    INIT_STATS["seconds"] += duration
+    if result["success"]:
+        # Fingerprint after init, which may have just written the lock file
+        write_init_record(working_dir, init_fingerprint(working_dir, inputs), duration)
+        # Init may have switched or migrated the backend
+        state_snapshots.invalidate(working_dir)
+    else:
+        INIT_STATS["failed"] += 1
+    result["note"] = f"⏱️ Init took {duration:.1f}s\n{init_stats_line()}"
+    return result
+
+def workspace_env(workspace: Optional[str]) -> Optional[Dict[str, str]]:
+    return {"TF_WORKSPACE": workspace} if workspace else None
+
+def state_puller(working_dir: str, workspace: Optional[str] = None):
+    """pull_state callback for state_identity: `terraform state pull` in working_dir"""
+    async def pull_state():
+        result = await run_terraform_command(
+            ["terraform", "state", "pull"], working_dir, max_lines=None, max_bytes=None,
+            env=workspace_env(workspace)
+        )
+        return result["stdout"] if result["success"] else None
+    return pull_state
+
+async def plan_key(working_dir: str, var_file: Optional[str], target: Optional[str],
+                   workspace: Optional[str] = None, mode: str = "refresh") -> str:
+    """Cache key for a plan: config files, arguments, plan mode and the current state serial"""
+    var_path = os.path.join(working_dir, var_file) if var_file else None
+    inputs = {
+        "var_file": var_file,
+        "var_file_digest": file_digest(var_path) if var_path and os.path.exists(var_path) else None,
+        "target": target,
+        "mode": mode,
+        "state": await state_identity(working_dir, state_puller(working_dir, workspace), workspace)
+    }
+    return config_hash(working_dir, inputs)
+
+def attach_summary(result: Dict[str, Any], summary: Dict[str, Any], details: Dict[str, List[Any]]) -> None:
+    """Replace raw output in the response with a summary; details stay pageable"""
+    result["summary"] = with_pages(summary, details, result_pages.add(details))
+
+def plan_mode(arguments: Dict[str, Any]) -> str:
+    if arguments.get("refresh_only", False):
+        return "refresh_only"
+    return "refresh" if arguments.get("refresh", True) else "no_refresh"
+
+def quick_plan_settings(working_dir: str) -> Dict[str, Any]:
+    """Fastest safe refresh/parallelism for a quick check, from recorded plan timings"""
+    def fastest(stats):
+        return min(stats.items(), key=lambda item: item[1]["seconds"])
+    
+    full = plan_timings.stats(working_dir, "refresh")
+    if full:
+        parallelism, best = fastest(full)
+        if best["seconds"] <= QUICK_FULL_PLAN_SECONDS:
+            return {"refresh": True, "parallelism": parallelism,
+                    "reason": f"full plans here take ~{best['seconds']:.1f}s"}
+    quick = plan_timings.stats(working_dir, "no_refresh")
+    if not quick:
+        return {"refresh": False, "parallelism": DEFAULT_PARALLELISM, "reason": "no timings recorded yet"}
+    parallelism, best = fastest(quick)
+    higher = min(parallelism * 2, MAX_PARALLELISM)
+    if best["seconds"] > QUICK_SLOW_SECONDS and higher not in quick:
+        return {"refresh": False, "parallelism": higher,
+                "reason": f"~{best['seconds']:.1f}s at parallelism {parallelism}, trying {higher}"}
+    return {"refresh": False, "parallelism": parallelism,
+            "reason": f"fastest recorded: ~{best['seconds']:.1f}s"}
+
+def plan_inputs(working_dir: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+    """Block hashes of the root module plus a hash of every input the block index does not cover"""
+    index = get_symbol_index(working_dir)
+    hashes, unindexed = index.block_hashes()
+    h = hashlib.sha256(json.dumps({
+        "var_file": arguments.get("var_file"),
+        "workspace": current_workspace(working_dir, arguments.get("workspace")),
+        "unindexed_blocks": unindexed
+    }, sort_keys=True).encode())
+    for rel in config_files(working_dir):
+        # tfvars, .tf.json, the lock file and nested module files
+        if not (rel.endswith(".tf") and os.sep not in rel):
+            h.update(f"{rel}\0{file_digest(os.path.join(working_dir, rel))}\0".encode())
+    return {"hashes": hashes, "context": h.hexdigest(), "parse_errors": bool(index.errors())}
+
+def incremental_scope(working_dir: str, arguments: Dict[str, Any],
+                      current: Dict[str, Any]) -> Tuple[Optional[List[str]], str]:
+    """Addresses to -target for an incremental plan.
+
+    Returns (None, reason) when a full plan is needed and ([], reason) when
+    nothing changed since the last successful plan.
+    """
+    baseline = plan_baselines.get(os.path.realpath(working_dir))
+    if arguments.get("full", False):
+        return None, "full plan requested"
+    if baseline is None:
+        return None, "no earlier plan of this directory to compare against"
+    if baseline["full_at"] is None or time.time() - baseline["full_at"] > INCREMENTAL_FULL_INTERVAL:
+        return None, "scheduled full plan for drift detection"
+    if current["parse_errors"]:
+        return None, "some .tf files could not be parsed"
+    if current["context"] != baseline["context"]:
+        return None, "variables files, nested modules, the lock file or moved/import blocks changed"
+    old, new = baseline["hashes"], current["hashes"]
+    changed = {address for address in old.keys() | new.keys() if old.get(address) != new.get(address)}
+    if not changed:
+        return [], "no blocks changed since the last successful plan"
+    if any(address == "terraform" or address.startswith("provider.") for address in changed):
+        return None, "terraform or provider configuration changed"
+    index = get_symbol_index(working_dir)
+    # Changed blocks, everything that references them, and removed blocks (planned for destroy)
+    affected = index.dependents(changed & set(new)) | (changed - set(new))
+    targets = sorted(a for a in affected if not a.startswith(("var.", "local.", "output.")))
+    if not targets:
+        return None, "only variables, locals or outputs without dependent resources changed"
+    if len(targets) > INCREMENTAL_MAX_TARGETS:
+        return None, f"{len(targets)} addresses affected, more than {INCREMENTAL_MAX_TARGETS}"
+    return targets, f"{len(changed)} changed block(s): {', '.join(sorted(changed))}"
+
+def record_plan_baseline(working_dir: str, current: Dict[str, Any], full_refresh: bool) -> None:
+    key = os.path.realpath(working_dir)
+    previous = plan_baselines.get(key) or {}
+    plan_baselines[key] = dict(
+        current,
+        planned_at=time.time(),
+        full_at=time.time() if full_refresh else previous.get("full_at")
+    )
+
+async def run_plan(cmd: List[str], working_dir: str, arguments: Dict[str, Any], on_output) -> Dict[str, Any]:
+    """Plan with -out, reusing the saved plan when config, args and state are unchanged.
+
+    Only plans with a normal refresh are keyed so that terraform_apply can
+    pick them up; -refresh=false and -refresh-only plans are never auto-applied.
+    """
+    notes = []
+    if arguments.get("quick", False):
+        settings = quick_plan_settings(working_dir)
+        arguments = dict(settings, **arguments)
+        notes.append(f"⚡ Quick check: refresh={str(arguments.get('refresh', True)).lower()}, "
+                     f"parallelism={arguments['parallelism']} ({settings['reason']})")
+    mode = plan_mode(arguments)
+    if mode == "refresh_only":
+        cmd = cmd + ["-refresh-only"]
+    elif mode == "no_refresh":
+        cmd = cmd + ["-refresh=false"]
+    parallelism = arguments.get("parallelism")
+    if parallelism:
+        cmd = cmd + [f"-parallelism={parallelism}"]
+    
+    # Inputs of untargeted plans become the baseline for the next incremental plan
+    current = None if arguments.get("target") else plan_inputs(working_dir, arguments)
+    targets = None
+    if arguments.get("incremental", False) and current is not None:
+        targets, reason = incremental_scope(working_dir, arguments, current)
+        if targets == []:
+            return {
+                "success": True,
+                "returncode": 0,
+                "stdout": "",
+                "stderr": "",
+                "command": " ".join(cmd),
+                "note": f"🟰 Incremental plan: {reason}; nothing to plan (full=true forces a full plan)"
+            }
+        if targets is None:
+            notes.append(f"🔭 Incremental plan ran as a full plan: {reason}")
+        else:
+            notes.append(f"🎯 Incremental plan: {reason} -> targeting {', '.join(targets)}. "
+                         f"A full plan runs every {INCREMENTAL_FULL_INTERVAL // 60} min or with full=true")
+            cmd = cmd + [f"-target={target}" for target in targets]
+    
+    structured = arguments.get("output", "summary") == "summary"
+    workspace = arguments.get("workspace")
+    target_key = "incremental:" + ",".join(targets) if targets else arguments.get("target")
+    key = await plan_key(working_dir, arguments.get("var_file"), target_key, workspace, mode)
+    if arguments.get("use_cache", True):
+        cached = plan_cache.lookup(working_dir, key)
+        hit = cached is not None and (cached.get("summary") is not None) == structured
+        metrics.cache("plan", hit)
+        if hit:
+            result = {
+                "success": True,
+                "returncode": 0,
+                "stdout": cached["stdout"],
+                "stderr": cached["stderr"],
+                "command": cached["command"],
+                "note": "\n".join(notes + [
+                    f"♻️ Reused saved plan from {int(time.time() - cached['created_at'])}s ago "
+                    "(configuration and state unchanged)"
+                ])
+            }
+            if structured:
+                attach_summary(result, cached["summary"], cached["details"])
+            if current is not None:
+                record_plan_baseline(working_dir, current, full_refresh=False)
+            return result
+    
+    summary = None
+    if structured:
+        cmd = cmd + ["-json"]
+        summary = PlanSummary()
+        on_output = summary.hook(on_output)
+    plan_cache.prepare(working_dir)
+    started = time.monotonic()
+    result = await run_terraform_command(
+        cmd + [f"-out={plan_cache.plan_path(working_dir, key)}"], working_dir, on_output,
+        env=workspace_env(workspace)
+    )
+    if summary is not None:
+        result["summary"], result["details"] = summary.summary(), summary.details()
+    if result["success"]:
+        if not target_key:
+            # Targeted plans would understate how long the directory takes
+            plan_timings.record(working_dir, mode, parallelism or DEFAULT_PARALLELISM, time.monotonic() - started)
+        if current is not None:
+            record_plan_baseline(working_dir, current, full_refresh=not targets and mode == "refresh")
+        plan_cache.store(working_dir, key, result)
+        if targets:
+            notes.append("💾 Targeted plan saved for identical plan calls; terraform_apply does not reuse it")
+        elif mode == "refresh":
+            notes.append("💾 Plan saved; terraform_apply with auto_approve will apply it without re-planning")
+        else:
+            notes.append(f"💾 Plan saved for identical plan calls; {mode} plans are never applied by terraform_apply")
+    if notes:
+        result["note"] = "\n".join(notes)
+    if summary is not None:
+        attach_summary(result, result["summary"], result.pop("details"))
+    return result
+
+async def run_apply(cmd: List[str], working_dir: str, arguments: Dict[str, Any], on_output) -> Dict[str, Any]:
+    """Apply the matching saved plan if there is one, otherwise plan and apply"""
+    if arguments.get("auto_approve", False) and arguments.get("use_cache", True):
+        key = await plan_key(working_dir, arguments.get("var_file"), None)
+        cached = plan_cache.lookup(working_dir, key)
+        metrics.cache("saved_plan_apply", cached is not None)
+        if cached:
+            result = await run_terraform_command(
+                ["terraform", "apply", cached["plan_file"]], working_dir, on_output
+            )
+            output = (result["stdout"] + result["stderr"]).lower()
+            if result["success"] or "stale" not in output:
+                plan_cache.invalidate(working_dir)
+                state_snapshots.invalidate(working_dir)
+                result["note"] = "♻️ Applied the saved plan from terraform_plan"
+                return result
+            # State moved on since the plan was saved; fall back to a fresh apply
+    
+    result = await run_terraform_command(cmd, working_dir, on_output)
+    plan_cache.invalidate(working_dir)
+    state_snapshots.invalidate(working_dir)
+    return result
+
+def state_result(name: str, arguments: Dict[str, Any], snapshot: Dict[str, Any],
+                 origin: str = "📸 Served from state snapshot") -> Dict[str, Any]:
+    """Answer terraform_state_list/terraform_show from a state snapshot"""
+    index = snapshot["index"]
+    resources = index.select(arguments.get("type"), arguments.get("address_prefix"))
+    serial = snapshot["identity"]["serial"]
+    result = {
+        "success": True,
+        "returncode": 0,
+        "stdout": "",
+        "stderr": "",
+        "command": "terraform show -json",
+        "note": f"{origin} ({'no state' if serial is None else f'serial {serial}'}, "
+                f"{len(resources)} of {len(index.resources)} resources)"
+    }
+    filtered = arguments.get("type") or arguments.get("address_prefix")
+    if name == "terraform_state_list":
+        result["stdout"] = "".join(f"{resource['address']}\n" for resource in resources)
+    elif arguments.get("format", "summary") == "json":
+        result["stdout"] = json.dumps({"resources": resources} if filtered else index.document, indent=2)
+    else:
+        summarized = summarize_state(index.document, resources)
+        attach_summary(result, summarized["summary"], summarized["details"])
+    return result
+
+async def run_state_query(name: str, working_dir: str, arguments: Dict[str, Any], on_output) -> Dict[str, Any]:
+    """Read state with `show -json`, keep it as a snapshot and answer from it"""
+    # Identify the state before reading it so a concurrent change invalidates the snapshot
+    identity = await state_identity(working_dir, state_puller(working_dir))
+    signature = state_signature(working_dir)
+    result = await run_terraform_command(
+        ["terraform", "show", "-json"], working_dir, on_output, max_lines=None, max_bytes=None
+    )
+    if not result["success"]:
+        return result
+    try:
+        index = StateIndex(json.loads(result["stdout"]) if result["stdout"].strip() else {})
+    except ValueError:
+        return result
+    snapshot = state_snapshots.store(working_dir, identity, signature, index)
+    return state_result(name, arguments, snapshot, origin="💾 State read and cached")
+
+def format_result(result: Dict[str, Any]) -> str:
+    """Format a run_terraform_command result for the tool response"""
+    if result.get("summary") is not None:
+        # Structured output replaces the raw JSON on stdout
+        result = dict(result, stdout=f"{json.dumps(result['summary'], indent=2)}\n"
+                                     "(use terraform_result_page with result_id for full detail)")
+    if result["success"]:
+        response = f"✅ Command executed successfully:\n{result['command']}\n\n"
+        if result.get("note"):
+            response += f"{result['note']}\n\n"
+        if result["stdout"]:
+            response += f"Output:\n{result['stdout']}\n"
+        if result["stderr"]:
+            response += f"Warnings:\n{result['stderr']}\n"
+    else:
+        response = f"❌ Command failed:\n{result['command']}\n\n"
+        if result.get("note"):
+            response += f"{result['note']}\n\n"
+        response += f"Exit code: {result['returncode']}\n"
+        if result["stderr"]:
+            response += f"Error:\n{result['stderr']}\n"
+        if result["stdout"]:
+            response += f"Output:\n{result['stdout']}\n"
+    return response
+
+def format_job(job) -> str:
+    """Format a finished job for the tool response"""
+    if job.result is not None:
+        return format_result(job.result)
+    if job.status == "cancelled":
+        return f"🛑 Job {job.id} was cancelled:\n{job.command}\n"
+    return f"❌ Job {job.id} failed:\n{job.command}\n\nError:\n{job.error}\n"
+
+async def call_job_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+    """Handle terraform_job_status, terraform_job_result and terraform_job_cancel"""
+    job_id = arguments.get("job_id")
+    me = client_id()
+    if name == "terraform_job_status" and not job_id:
+        everyone = arguments.get("all", False)
+        jobs = [job.describe() for job in scheduler.list() if everyone or job.owner in (None, me)]
+        return [TextContent(type="text", text=json.dumps(jobs, indent=2))]
+    
+    job = scheduler.get(job_id)
+    if job is None:
+        return [TextContent(type="text", text=f"❌ Unknown job: {job_id}")]
+    if name != "terraform_job_status" and job.owner not in (None, me) and me is not None:
+        # Other clients' jobs are visible (for coordination) but not theirs to read or stop
+        return [TextContent(type="text", text=f"🔒 Job {job_id} belongs to another client")]
+    
+    if name == "terraform_job_status":
+        text = json.dumps(job.describe(), indent=2)
+    elif name == "terraform_job_result":
+        if await scheduler.wait(job, arguments.get("wait", 0)):
+            text = format_job(job)
+        else:
+            text = f"⏳ Job {job.id} is still {job.status}\n\n" + json.dumps(job.describe(), indent=2)
+    else:
+        if scheduler.cancel(job.id):
+            await scheduler.wait(job)
+            text = f"🛑 Job {job.id} cancelled:\n{job.command}\n"
+        else:
+            text = f"ℹ️ Job {job.id} already {job.status}\n"
+    return [TextContent(type="text", text=text)]
+
+def get_symbol_index(working_dir: str) -> SymbolIndex:
+    key = os.path.realpath(working_dir)
+    if key not in symbol_indexes:
+        symbol_indexes[key] = SymbolIndex(key)
+    return symbol_indexes[key]
+
+def describe_symbol(symbol: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "address": symbol["address"],
+        "kind": symbol["kind"],
+        "type": symbol["type"],
+        "location": f"{symbol['file']}:{symbol['line']}-{symbol['end_line']}",
+        "attributes": symbol["attributes"],
+        "blocks": symbol["blocks"],
+        "references": symbol["references"],
+        "referenced_by": symbol["referenced_by"]
+    }
+
+def call_symbol_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+    """Answer terraform_find_resource, terraform_references and terraform_graph from the HCL index"""
+    index = get_symbol_index(arguments.get("working_dir", TERRAFORM_DIR))
+    symbols = index.symbols()
+    
+    if name == "terraform_find_resource":
+        matches = index.find(arguments.get("query"), arguments.get("kind"), arguments.get("type"))
+        response = {"count": len(matches), "matches": [describe_symbol(symbol) for symbol in matches]}
+    
+    elif name == "terraform_references":
+        address = arguments["address"]
+        if address not in symbols:
+            return [TextContent(type="text", text=f"❓ No block with address {address}")]
+        response = describe_symbol(symbols[address])
+        if arguments.get("transitive", False):
+            response["all_dependencies"] = sorted(index.dependencies({address}) - {address})
+            response["all_dependents"] = sorted(index.dependents({address}) - {address})
+    
+    else:
+        edges = index.edges()
+        if arguments.get("address"):
+            address = arguments["address"]
+            nodes = index.dependencies({address}) | index.dependents({address})
+            edges = [(src, dst) for src, dst in edges if src in nodes and dst in nodes]
+        if arguments.get("format") == "dot":
+            lines = ["digraph terraform {"] + [f'  "{src}" -> "{dst}";' for src, dst in edges] + ["}"]
+            return [TextContent(type="text", text="\n".join(lines))]
+        response = {"nodes": len({node for edge in edges for node in edge}), "edges": edges}
+    
+    errors = index.errors()
+    if errors:
+        response["parse_errors"] = errors
+    return [TextContent(type="text", text=json.dumps(response, indent=2))]
+
+CHECK_COMMANDS = {
+    "fmt": ["terraform", "fmt", "-check"],
+    "validate": ["terraform", "validate", "-json"]
+}
+
+def check_result(kind: str, raw: Dict[str, Any], note: Optional[str] = None) -> Dict[str, Any]:
+    """Tool result for a fmt-check/validate run (validate gets its summary)"""
+    result = dict(raw)
+    if note:
+        result["note"] = note
+    if kind == "validate":
+        try:
+            summarized = summarize_validate(result["stdout"])
+        except ValueError:
+            return result
+        attach_summary(result, summarized["summary"], summarized["details"])
+    return result
+
+async def cached_check(kind: str, working_dir: str) -> Optional[Dict[str, Any]]:
+    """Result of a check already run against the current file contents, if any"""
+    found = await check_cache.lookup(kind, working_dir)
+    if found is None:
+        return None
+    raw, age = found
+    return check_result(kind, raw, f"⚡ Answered from a check of the current files {age:.0f}s ago")
+
+async def run_check(kind: str, working_dir: str, on_output=None, low_priority: bool = False) -> Dict[str, Any]:
+    """Run fmt -check or validate -json and remember the result for the current file contents"""
+    return await check_cache.run(kind, working_dir, lambda: run_terraform_command(
+        CHECK_COMMANDS[kind], working_dir, on_output, max_lines=None, max_bytes=None, low_priority=low_priority
+    ))
+
+async def finish_check(kind: str, working_dir: str, on_output) -> Dict[str, Any]:
+    """Job runner for fmt-check/validate: a background run may have finished while queued"""
+    cached = await cached_check(kind, working_dir)
+    metrics.cache(f"{kind}_check", cached is not None)
+    if cached is not None:
+        return cached
+    return check_result(kind, await run_check(kind, working_dir, on_output))
+
+def speculate(working_dir: str) -> bool:
+    """ChangeWatcher callback: queue background fmt-check and validate once edits settle"""
+    if scheduler.busy(working_dir):
+        # Never delay the agent's own commands; try again on the next poll
+        return False
+    for kind in CHECK_KINDS:
+        if not check_cache.fresh(kind, working_dir):
+            scheduler.submit(f"background_{kind}", working_dir, " ".join(CHECK_COMMANDS[kind]),
+                             lambda job, kind=kind: run_check(kind, working_dir, job.output_hook(), low_priority=True))
+    return True
+
+change_watcher = ChangeWatcher(speculate)
+
+def resolve_stacks(arguments: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """Directories named by dirs and/or glob (relative to TERRAFORM_DIR).
+
+    Returns (stacks, skipped): directories without .tf files are skipped.
+    """
+    paths = [os.path.join(TERRAFORM_DIR, path) for path in arguments.get("dirs", [])]
+    if arguments.get("glob"):
+        paths.extend(sorted(glob.glob(os.path.join(TERRAFORM_DIR, arguments["glob"]), recursive=True)))
+    stacks, skipped, seen = [], [], set()
+    for path in paths:
+        real = os.path.realpath(path)
+        if real in seen or not os.path.isdir(path):
+            continue
+        seen.add(real)
+        if any(name.endswith((".tf", ".tf.json")) for name in os.listdir(path)):
+            stacks.append(path)
+        else:
+            skipped.append(os.path.relpath(path, TERRAFORM_DIR))
+    return stacks, skipped
+
+def many_runner(name: str, working_dir: str, workspace: Optional[str], arguments: Dict[str, Any]):
+    """Command and runner for one stack of a fan-out tool"""
+    if name == "terraform_validate_many":
+        return CHECK_COMMANDS["validate"], lambda hook: finish_check("validate", working_dir, hook)
+    if name == "terraform_fmt_many":
+        if arguments.get("check", True):
+            return CHECK_COMMANDS["fmt"], lambda hook: finish_check("fmt", working_dir, hook)
+        cmd = ["terraform", "fmt"]
+        return cmd, lambda hook: run_terraform_command(cmd, working_dir, hook)
+    cmd = ["terraform", "plan"]
+    if arguments.get("var_file"):
+        cmd.extend(["-var-file", arguments["var_file"]])
+    plan_arguments = {"var_file": arguments.get("var_file"), "use_cache": arguments.get("use_cache", True),
+                      "output": "summary", "workspace": workspace, "quick": arguments.get("quick", False)}
+    return cmd, lambda hook: run_plan(cmd, working_dir, plan_arguments, hook)
+
+def stack_report(name: str, job, workspace: Optional[str]) -> Dict[str, Any]:
+    """One stack's line in a fan-out report"""
+    entry = {
+        "working_dir": os.path.relpath(job.working_dir, TERRAFORM_DIR),
+        "status": job.status,
+        "seconds": round(job.finished_at - job.started_at, 3) if job.started_at and job.finished_at else None,
+        "queued_seconds": round((job.started_at or job.finished_at) - job.created_at, 3)
+    }
+    if name == "terraform_plan_many":
+        entry["workspace"] = current_workspace(job.working_dir, workspace)
+    result = job.result
+    if result is None:
+        entry["error"] = job.error or job.status
+        return entry
+    if result.get("summary") is not None:
+        entry["summary"] = result["summary"]
+    elif name == "terraform_fmt_many":
+        entry["files"] = result["stdout"].split()
+    if not result["success"] and result.get("summary") is None and not entry.get("files"):
+        entry["error"] = "\n".join((result["stderr"] or result["stdout"]).strip().splitlines()[-5:])
+    return entry
+
+async def call_many_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+    """Run one tool across many stacks (and workspaces) and aggregate the results.
+
+    Every stack is its own scheduler job, so concurrency stays bounded by
+    TERRAFORM_MAX_CONCURRENT_JOBS and one stack failing does not stop the rest.
+    """
+    stacks, skipped = resolve_stacks(arguments)
+    if not stacks:
+        return [TextContent(type="text", text="❓ No directories with terraform files matched dirs/glob")]
+    workspaces = (arguments.get("workspaces") or [None]) if name == "terraform_plan_many" else [None]
+    notify = _output_notifier(arguments)
+    started = time.monotonic()
+    jobs = []
+    for working_dir in stacks:
+        for workspace in workspaces:
+            cmd, runner = many_runner(name, working_dir, workspace, arguments)
+            job = scheduler.submit(name, working_dir, " ".join(cmd),
+                                   lambda job, runner=runner: runner(job.output_hook()), owner=client_id())
+            jobs.append((job, workspace))
+    
+    finished = 0
+    async def finish(job, workspace) -> None:
+        nonlocal finished
+        await scheduler.wait(job)
+        finished += 1
+        if notify is not None:
+            label = os.path.relpath(job.working_dir, TERRAFORM_DIR) + (f" [{workspace}]" if workspace else "")
+            mark = "✅" if job.status == "succeeded" else "❌"
+            await notify("stdout", f"{mark} {label} {job.status} ({finished}/{len(jobs)})")
+    
+    try:
+        await asyncio.gather(*(finish(job, workspace) for job, workspace in jobs))
+    except asyncio.CancelledError:
+        for job, _ in jobs:
+            scheduler.cancel(job.id)
+        raise
+    
+    results = [stack_report(name, job, workspace) for job, workspace in jobs]
+    timed = [entry for entry in results if entry["seconds"] is not None]
+    report = {
+        "tool": name[:-len("_many")],
+        "stacks": len(results),
+        "succeeded": sum(1 for entry in results if entry["status"] == "succeeded"),
+        "failed": [
+            entry["working_dir"] + (f" [{entry['workspace']}]" if "workspace" in entry else "")
+            for entry in results if entry["status"] != "succeeded"
+        ],
+        "wall_seconds": round(time.monotonic() - started, 3),
+        "total_run_seconds": round(sum(entry["seconds"] for entry in timed), 3),
+        "slowest": max(timed, key=lambda entry: entry["seconds"])["working_dir"] if timed else None,
+        "skipped": skipped,
+        "results": results
+    }
+    mark = "✅" if not report["failed"] else "⚠️"
+    text = f"{mark} {report['succeeded']}/{len(results)} stacks succeeded\n\n{json.dumps(report, indent=2)}"
+    return [TextContent(type="text", text=text)]
 
 @server.call_tool()
 async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
-    """Handle tool calls"""
+    """Handle tool calls, recording their latency"""
+    started = time.monotonic()
+    try:
+        return await dispatch_tool(name, arguments)
+    finally:
+        metrics.observe_tool(name, time.monotonic() - started)
+
+async def dispatch_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
+    """Run one tool call"""
+    if name in ("terraform_job_status", "terraform_job_result", "terraform_job_cancel"):
+        return await call_job_tool(name, arguments)
+    if name in ("terraform_validate_many", "terraform_plan_many", "terraform_fmt_many"):
+        return await call_many_tool(name, arguments)
+    if name in ("terraform_find_resource", "terraform_references", "terraform_graph"):
+        return call_symbol_tool(name, arguments)
+    if name == "terraform_result_page":
+        try:
+            page = result_pages.page(
+                arguments["result_id"], arguments["section"],
+                arguments.get("offset", 0), arguments.get("limit", 50)
+            )
+        except KeyError as e:
+            return [TextContent(type="text", text=f"❌ {e.args[0]}")]
+        return [TextContent(type="text", text=json.dumps(page, indent=2))]
+    
     working_dir = arguments.get("working_dir", TERRAFORM_DIR)
+    run_async = arguments.get("async", False)
+    # Notifications can only be sent while the request is still open
+    notify = None if run_async else _output_notifier(arguments)
+    runner = None
     
     if name == "terraform_init":
         cmd = ["terraform", "init"]
-        result = await run_terraform_command(cmd, working_dir)
+        if arguments.get("upgrade", False):
+            cmd.append("-upgrade")
+        if PROVIDER_MIRROR:
+            cmd.append(f"-plugin-dir={PROVIDER_MIRROR}")
+        runner = lambda hook: run_init(cmd, working_dir, arguments, hook)
         
     elif name == "terraform_plan":
         cmd = ["terraform", "plan"]
@@ -282,7 +1546,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             cmd.extend(["-var-file", arguments["var_file"]])
         if arguments.get("target"):
             cmd.extend(["-target", arguments["target"]])
-        result = await run_terraform_command(cmd, working_dir)
+        runner = lambda hook: run_plan(cmd, working_dir, arguments, hook)
         
     elif name == "terraform_apply":
         cmd = ["terraform", "apply"]
@@ -290,7 +1554,7 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             cmd.extend(["-var-file", arguments["var_file"]])
         if arguments.get("auto_approve", False):
             cmd.append("-auto-approve")
-        result = await run_terraform_command(cmd, working_dir)
+        runner = lambda hook: run_apply(cmd, working_dir, arguments, hook)
         
     elif name == "terraform_destroy":
         cmd = ["terraform", "destroy"]
@@ -298,50 +1562,96 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> List[TextContent]:
             cmd.extend(["-var-file", arguments["var_file"]])
         if arguments.get("auto_approve", False):
             cmd.append("-auto-approve")
-        result = await run_terraform_command(cmd, working_dir)
-        
-    elif name == "terraform_validate":
-        cmd = ["terraform", "validate"]
-        result = await run_terraform_command(cmd, working_dir)
-        
-    elif name == "terraform_fmt":
-        cmd = ["terraform", "fmt"]
-        if arguments.get("check", False):
-            cmd.append("-check")
-        result = await run_terraform_command(cmd, working_dir)
+        runner = lambda hook: run_apply(cmd, working_dir, dict(arguments, use_cache=False), hook)
         
-    elif name == "terraform_show":
-        cmd = ["terraform", "show"]
-        if arguments.get("format") == "json":
-            cmd.append("-json")
-        result = await run_terraform_command(cmd, working_dir)
+    elif name in ("terraform_validate", "terraform_fmt"):
+        if name == "terraform_validate":
+            kind = "validate" if arguments.get("output", "summary") == "summary" else None
+            cmd = CHECK_COMMANDS["validate"] if kind else ["terraform", "validate"]
+        else:
+            kind = "fmt" if arguments.get("check", False) else None
+            cmd = CHECK_COMMANDS["fmt"] if kind else ["terraform", "fmt"]
+        if SPECULATIVE_CHECKS:
+            change_watcher.watch(working_dir)
+        if kind:
+            # Usually already answered by the background check of the current files
+            cached = await cached_check(kind, working_dir)
+            if cached is not None:
+                metrics.cache(f"{kind}_check", True)
+                return [TextContent(type="text", text=format_result(cached))]
+            runner = lambda hook: finish_check(kind, working_dir, hook)
         
-    elif name == "terraform_state_list":
-        cmd = ["terraform", "state", "list"]
-        result = await run_terraform_command(cmd, working_dir)
+    elif name in ("terraform_show", "terraform_state_list"):
+        if name == "terraform_show" and arguments.get("format", "summary") == "text":
+            cmd = ["terraform", "show"]
+        else:
+            # Served from the in-memory state snapshot until state changes
+            snapshot = await state_snapshots.lookup(working_dir, state_puller(working_dir))
+            metrics.cache("state_snapshot", snapshot is not None)
+            if snapshot is not None:
+                return [TextContent(type="text", text=format_result(state_result(name, arguments, snapshot)))]
+            cmd = ["terraform", "show", "-json"]
+            runner = lambda hook: run_state_query(name, working_dir, arguments, hook)
         
     else:
         raise ValueError(f"Unknown tool: {name}")
     
-    # Format the response
-    if result["success"]:
-        response = f"✅ Command executed successfully:\n{result['command']}\n\n"
-        if result["stdout"]:
-            response += f"Output:\n{result['stdout']}\n"
-        if result["stderr"]:
-            response += f"Warnings:\n{result['stderr']}\n"
-    else:
-        response = f"❌ Command failed:\n{result['command']}\n\n"
-        response += f"Exit code: {result['returncode']}\n"
-        if result["stderr"]:
-            response += f"Error:\n{result['stderr']}\n"
-        if result["stdout"]:
-            response += f"Output:\n{result['stdout']}\n"
+    if runner is None:
+        runner = lambda hook: run_terraform_command(cmd, working_dir, hook)
+    
+    # Commands for the same working directory run one at a time
+    job = scheduler.submit(name, working_dir, " ".join(cmd), lambda job: runner(job.output_hook(notify)),
+                           owner=client_id())
+    if run_async:
+        response = f"🕐 Job {job.id} queued:\n{job.command}\n\n"
+        response += "Poll it with terraform_job_status, fetch the output with terraform_job_result "
+        response += "or stop it with terraform_job_cancel.\n"
+        return [TextContent(type="text", text=response)]
+    
+    try:
+        await scheduler.wait(job)
+    except asyncio.CancelledError:
+        scheduler.cancel(job.id)
+        raise
+    
+    return [TextContent(type="text", text=format_job(job))]
+
+async def serve_http(host: str, port: int):
+    """Serve many clients over streamable HTTP at http://host:port/mcp.
+
+    All clients share this process, so per-directory locks, caches and
+    metrics are shared; each client session only sees its own jobs.
+    """
+    import uvicorn
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from mcp.server.transport_security import TransportSecuritySettings
+    from starlette.applications import Starlette
+    from starlette.routing import Route
+    
+    loopback = [host, "127.0.0.1", "localhost", "[::1]"]
+    session_manager = StreamableHTTPSessionManager(
+        app=server,
+        security_settings=TransportSecuritySettings(
+            allowed_hosts=[f"{name}:*" for name in loopback],
+            allowed_origins=[f"http://{name}:*" for name in loopback]
+        )
+    )
+    
+    class MCPEndpoint:
+        async def __call__(self, scope, receive, send):
+            await session_manager.handle_request(scope, receive, send)
     
-    return [TextContent(type="text", text=response)]
+    app = Starlette(routes=[Route("/mcp", endpoint=MCPEndpoint())], lifespan=lambda app: session_manager.run())
+    print(f"Terraform MCP server listening on http://{host}:{port}/mcp", file=sys.stderr)
+    await uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning")).serve()
 
-async def main():
+async def main(transport: str = TRANSPORT, host: str = HTTP_HOST, port: int = HTTP_PORT):
     """Main entry point"""
+    if SPECULATIVE_CHECKS:
+        change_watcher.watch(TERRAFORM_DIR)
+    if transport == "http":
+        await serve_http(host, port)
+        return
     async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
         await server.run(
             read_stream,
@@ -350,8 +1660,14 @@ async def main():
         )
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Terraform MCP server")
+    parser.add_argument("--transport", choices=["stdio", "http"], default=TRANSPORT,
+                        help="stdio (one client) or http (one shared server for every agent terminal)")
+    parser.add_argument("--host", default=HTTP_HOST, help="HTTP bind address")
+    parser.add_argument("--port", type=int, default=HTTP_PORT, help="HTTP port")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args.transport, args.host, args.port))
     except KeyboardInterrupt:
         print("\nServer interrupted by user")
         sys.exit(0)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Terraform Metrics - Latency, output-size and cache instrumentation for the MCP server
+
+Keeps per-tool, per-working-directory and per-command duration histograms,
+subprocess spawn overhead, output byte counts, timeouts and cache hit rates
+in memory. They are served as the metrics://terraform-agent resource and,
+when TERRAFORM_METRICS_FILE is set, written there in Prometheus text format
+(e.g. for node_exporter's textfile collector).
+"""
+
+import json
+import math
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Upper bounds (seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, math.inf)
+# Prometheus text file rewritten after every observation (optional)
+METRICS_FILE = os.getenv("TERRAFORM_METRICS_FILE")
+
+METRICS_URI = "metrics://terraform-agent"
+
+
+class Histogram:
+    """Cumulative-bucket duration histogram with an exact max"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (capped at max)"""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total_seconds": round(self.sum, 3),
+            "avg_seconds": round(self.sum / self.count, 3) if self.count else None,
+            "p50_seconds": round(self.quantile(0.5), 3) if self.count else None,
+            "p95_seconds": round(self.quantile(0.95), 3) if self.count else None,
+            "max_seconds": round(self.max, 3)
+        }
+
+    def prometheus(self, name: str, labels: str) -> str:
+        lines, cumulative = [], 0
+        sep = "," if labels else ""
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return "\n".join(lines)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """All server metrics; observations are cheap in-memory updates"""
+
+    def __init__(self, path: Optional[str] = METRICS_FILE):
+        self.path = path
+        self.started_at = time.time()
+        self.tools: Dict[str, Histogram] = {}
+        self.working_dirs: Dict[str, Histogram] = {}
+        self.commands: Dict[str, Histogram] = {}
+        self.spawn = Histogram()
+        self.output_bytes: Dict[Tuple[str, str], int] = {}
+        self.timeouts: Dict[str, int] = {}
+        self.spawn_failures: Dict[str, int] = {}
+        self.caches: Dict[Tuple[str, str], int] = {}
+
+    def observe_tool(self, tool: str, seconds: float) -> None:
+        """Latency of one tool call as seen by the client"""
+        self.tools.setdefault(tool, Histogram()).observe(seconds)
+        self.write()
+
+    def observe_command(self, command: str, working_dir: str, spawn_seconds: float, seconds: float,
+                        stdout_bytes: int, stderr_bytes: int, timed_out: bool = False) -> None:
+        """One terraform process: spawn overhead, run time and output volume"""
+        self.spawn.observe(spawn_seconds)
+        self.commands.setdefault(command, Histogram()).observe(seconds)
+        self.working_dirs.setdefault(os.path.realpath(working_dir), Histogram()).observe(seconds)
+        for stream, size in (("stdout", stdout_bytes), ("stderr", stderr_bytes)):
+            self.output_bytes[(command, stream)] = self.output_bytes.get((command, stream), 0) + size
+        if timed_out:
+            self.timeouts[command] = self.timeouts.get(command, 0) + 1
+        self.write()
+
+    def spawn_failed(self, command: str) -> None:
+        self.spawn_failures[command] = self.spawn_failures.get(command, 0) + 1
+        self.write()
+
+    def cache(self, name: str, hit: bool) -> None:
+        """Record a hit or miss of one of the server's caches (plan, init, state...)"""
+        key = (name, "hit" if hit else "miss")
+        self.caches[key] = self.caches.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view; working directories sorted slowest (total time) first"""
+        commands = {}
+        for command, histogram in sorted(self.commands.items()):
+            commands[command] = dict(
+                histogram.describe(),
+                stdout_bytes=self.output_bytes.get((command, "stdout"), 0),
+                stderr_bytes=self.output_bytes.get((command, "stderr"), 0),
+                timeouts=self.timeouts.get(command, 0),
+                spawn_failures=self.spawn_failures.get(command, 0)
+            )
+        caches = {}
+        for name in sorted({name for name, _ in self.caches}):
+            hits, misses = self.caches.get((name, "hit"), 0), self.caches.get((name, "miss"), 0)
+            caches[name] = {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3)}
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "tools": {tool: h.describe() for tool, h in sorted(self.tools.items())},
+            "working_dirs": {
+                directory: h.describe()
+                for directory, h in sorted(self.working_dirs.items(), key=lambda item: -item[1].sum)
+            },
+            "commands": commands,
+            "spawn_overhead": self.spawn.describe(),
+            "caches": caches
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        out = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+
+        family("terraform_mcp_tool_duration_seconds", "histogram", "Tool call latency")
+        for tool, h in sorted(self.tools.items()):
+            out.append(h.prometheus("terraform_mcp_tool_duration_seconds", f'tool="{_label(tool)}"'))
+        family("terraform_mcp_working_dir_duration_seconds", "histogram", "Terraform run time per working directory")
+        for directory, h in sorted(self.working_dirs.items()):
+            out.append(h.prometheus("terraform_mcp_working_dir_duration_seconds",
+                                    f'working_dir="{_label(directory)}"'))
+        family("terraform_mcp_command_duration_seconds", "histogram", "Terraform run time per subcommand")
+        for command, h in sorted(self.commands.items()):
+            out.append(h.prometheus("terraform_mcp_command_duration_seconds", f'command="{_label(command)}"'))
+        family("terraform_mcp_spawn_seconds", "histogram", "Time to start a terraform process")
+        out.append(self.spawn.prometheus("terraform_mcp_spawn_seconds", ""))
+        family("terraform_mcp_output_bytes_total", "counter", "Bytes terraform wrote per subcommand and stream")
+        for (command, stream), size in sorted(self.output_bytes.items()):
+            out.append(f'terraform_mcp_output_bytes_total{{command="{_label(command)}",stream="{stream}"}} {size}')
+        family("terraform_mcp_timeouts_total", "counter", "Terraform commands stopped by the timeout")
+        for command, count in sorted(self.timeouts.items()):
+            out.append(f'terraform_mcp_timeouts_total{{command="{_label(command)}"}} {count}')
+        family("terraform_mcp_spawn_failures_total", "counter", "Terraform commands that failed to start")
+        for command, count in sorted(self.spawn_failures.items()):
+            out.append(f'terraform_mcp_spawn_failures_total{{command="{_label(command)}"}} {count}')
+        family("terraform_mcp_cache_requests_total", "counter", "Cache lookups by cache and result")
+        for (name, result), count in sorted(self.caches.items()):
+            out.append(f'terraform_mcp_cache_requests_total{{cache="{_label(name)}",result="{result}"}} {count}')
+        return "\n".join(out) + "\n"
+
+    def write(self) -> None:
+        """Rewrite the Prometheus text file, if configured (atomically)"""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Metrics must never break a tool call
+            pass
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Terraform Summary - Compact structured results from terraform's JSON output
+
+Turns `plan -json`, `validate -json` and `show -json` into small summaries
+(change counts, diagnostics with file:line, outputs). The full lists are kept
+server-side as pages that agents fetch only when they need the detail.
+"""
+
+import json
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Items of each list included directly in a summary
+SUMMARY_PREVIEW = 10
+# Paged results kept in memory
+RESULT_PAGES_LIMIT = 50
+
+
+def _location(diagnostic: Dict[str, Any]) -> Optional[str]:
+    rng = diagnostic.get("range") or {}
+    if not rng.get("filename"):
+        return None
+    line = (rng.get("start") or {}).get("line")
+    return f"{rng['filename']}:{line}" if line else rng["filename"]
+
+
+def compact_diagnostic(diagnostic: Dict[str, Any]) -> Dict[str, Any]:
+    compact = {
+        "severity": diagnostic.get("severity"),
+        "summary": diagnostic.get("summary"),
+        "location": _location(diagnostic)
+    }
+    if diagnostic.get("address"):
+        compact["address"] = diagnostic["address"]
+    return compact
+
+
+def _count(counts: Dict[str, int], key: str) -> None:
+    counts[key] = counts.get(key, 0) + 1
+
+
+class PlanSummary:
+    """Incrementally summarize the JSON lines of `terraform plan -json`"""
+
+    def __init__(self):
+        self.changes: List[Dict[str, Any]] = []
+        self.drift: List[Dict[str, Any]] = []
+        self.diagnostics: List[Dict[str, Any]] = []
+        self.outputs: Dict[str, Any] = {}
+        self.totals: Optional[Dict[str, Any]] = None
+
+    def hook(self, forward=None):
+        """on_output callback: parse stdout lines, forward their human message"""
+        async def on_output(stream: str, line: str) -> None:
+            message = self.feed(line) if stream == "stdout" else line
+            if forward is not None and message:
+                await forward(stream, message)
+        return on_output
+
+    def feed(self, line: str) -> Optional[str]:
+        """Consume one output line; return its human-readable message"""
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return line
+        if not isinstance(entry, dict):
+            return line
+        kind = entry.get("type")
+        if kind in ("planned_change", "resource_drift"):
+            change = entry.get("change") or {}
+            resource = change.get("resource") or {}
+            record = {
+                "address": resource.get("addr"),
+                "type": resource.get("resource_type"),
+                "action": change.get("action"),
+                "module": resource.get("module") or None
+            }
+            if change.get("reason"):
+                record["reason"] = change["reason"]
+            (self.changes if kind == "planned_change" else self.drift).append(record)
+        elif kind == "diagnostic":
+            diagnostic = dict(entry.get("diagnostic") or {})
+            diagnostic.setdefault("severity", entry.get("@level"))
+            self.diagnostics.append(compact_diagnostic(diagnostic))
+        elif kind == "outputs":
+            self.outputs = {
+                name: output.get("action", "unknown") for name, output in (entry.get("outputs") or {}).items()
+            }
+        elif kind == "change_summary":
+            self.totals = entry.get("changes")
+        return entry.get("@message")
+
+    def summary(self) -> Dict[str, Any]:
+        by_action, by_type = {}, {}
+        for change in self.changes:
+            if change["action"] == "no-op":
+                continue
+            _count(by_action, change["action"])
+            _count(by_type.setdefault(change["type"], {}), change["action"])
+        return {
+            "changes": by_action,
+            "by_type": by_type,
+            "totals": self.totals,
+            "drifted": len(self.drift),
+            "diagnostics": self.diagnostics[:SUMMARY_PREVIEW],
+            "error_count": sum(1 for d in self.diagnostics if d["severity"] == "error"),
+            "warning_count": sum(1 for d in self.diagnostics if d["severity"] == "warning"),
+            "outputs": self.outputs
+        }
+
+    def details(self) -> Dict[str, List[Any]]:
+        return {
+            "changes": [c for c in self.changes if c["action"] != "no-op"],
+            "drift": self.drift,
+            "diagnostics": self.diagnostics
+        }
+
+
+def summarize_validate(text: str) -> Dict[str, Any]:
+    """Summarize `terraform validate -json`"""
+    report = json.loads(text)
+    diagnostics = [compact_diagnostic(d) for d in report.get("diagnostics", [])]
+    summary = {
+        "valid": report.get("valid"),
+        "error_count": report.get("error_count", 0),
+        "warning_count": report.get("warning_count", 0),
+        "diagnostics": diagnostics[:SUMMARY_PREVIEW]
+    }
+    return {"summary": summary, "details": {"diagnostics": diagnostics}}
+
+
+def state_resources(module: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten the resources of a `show -json` module tree"""
+    resources = list(module.get("resources", []))
+    for child in module.get("child_modules", []):
+        resources.extend(state_resources(child))
+    return resources
+
+
+def summarize_state(document: Dict[str, Any], resources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Summarize a parsed `show -json` document limited to resources"""
+    values = document.get("values") or {}
+    by_type = {}
+    for resource in resources:
+        _count(by_type, resource.get("type"))
+    outputs = {
+        name: "(sensitive)" if output.get("sensitive") else output.get("value")
+        for name, output in (values.get("outputs") or {}).items()
+    }
+    summary = {
+        "terraform_version": document.get("terraform_version"),
+        "resource_count": len(resources),
+        "by_type": by_type,
+        "outputs": outputs
+    }
+    return {"summary": summary, "details": {"resources": resources}}
+
+
+class StateIndex:
+    """Resources of one `show -json` state document, indexed by address and type"""
+
+    def __init__(self, document: Dict[str, Any]):
+        self.document = document
+        values = document.get("values") or {}
+        self.resources = sorted(state_resources(values.get("root_module") or {}),
+                                key=lambda resource: resource.get("address", ""))
+        self.addresses = [resource.get("address", "") for resource in self.resources]
+        self.by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for resource in self.resources:
+            self.by_type.setdefault(resource.get("type"), []).append(resource)
+
+    def select(self, rtype: Optional[str] = None, prefix: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Resources of type rtype whose address starts with prefix (both optional)"""
+        if rtype:
+            resources = self.by_type.get(rtype, [])
+            return [r for r in resources if r.get("address", "").startswith(prefix)] if prefix else resources
+        if not prefix:
+            return self.resources
+        # Addresses are sorted, so a prefix is one contiguous run
+        start = end = bisect_left(self.addresses, prefix)
+        while end < len(self.addresses) and self.addresses[end].startswith(prefix):
+            end += 1
+        return self.resources[start:end]
+
+
+class ResultPages:
+    """Full result lists, kept for paginated follow-up requests (LRU bounded)"""
+
+    def __init__(self, limit: int = RESULT_PAGES_LIMIT):
+        self.limit = limit
+        self._results: "OrderedDict[str, Dict[str, List[Any]]]" = OrderedDict()
+
+    def add(self, details: Dict[str, List[Any]]) -> str:
+        result_id = f"res-{uuid.uuid4().hex[:12]}"
+        self._results[result_id] = details
+        while len(self._results) > self.limit:
+            self._results.popitem(last=False)
+        return result_id
+
+    def page(self, result_id: str, section: str, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        if result_id not in self._results:
+            raise KeyError(f"Unknown or expired result: {result_id}")
+        self._results.move_to_end(result_id)
+        sections = self._results[result_id]
+        if section not in sections:
+            raise KeyError(f"Unknown section {section!r}; available: {', '.join(sections)}")
+        items = sections[section]
+        return {
+            "result_id": result_id,
+            "section": section,
+            "offset": offset,
+            "total": len(items),
+            "items": items[offset:offset + limit],
+            "next_offset": offset + limit if offset + limit < len(items) else None
+        }
+
+
+def with_pages(summary: Dict[str, Any], details: Dict[str, List[Any]], result_id: str) -> Dict[str, Any]:
+    """Attach the result ID and section sizes that terraform_result_page serves"""
+    return dict(summary, result_id=result_id, pages={name: len(items) for name, items in details.items()})
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Contention test for claim_next: many processes drain one shared queue
+(run with: python -m pytest agents)
+"""
+
+import multiprocessing
+
+import pytest
+
+from state_store import BACKENDS, empty_documents, new_task_id
+
+CLAIMERS = 8
+TASKS = 200
+
+
+def _drain(backend, state_dir, worker, start, claimed):
+    store = BACKENDS[backend](state_dir)
+    ids = []
+    start.wait()
+    while True:
+        task = store.claim_next(fields={"started_by": f"worker-{worker}"})
+        if task is None:
+            break
+        ids.append(task["id"])
+    claimed.put(ids)
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_every_task_claimed_exactly_once(tmp_path, backend):
+    state_dir = str(tmp_path)
+    store = BACKENDS[backend](state_dir)
+    store.reset(empty_documents())
+    task_ids = [new_task_id() for _ in range(TASKS)]
+    store.apply(*({"op": "task_add", "task": {
+        "id": task_id, "type": "test", "description": "contention",
+        "data": {"target_role": "ARCHITECT"}, "priority": 0, "status": "pending"
+    }} for task_id in task_ids))
+
+    # Start every claimer before any of them drains, so they really contend
+    start, claimed = multiprocessing.Event(), multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_drain, args=(backend, state_dir, worker, start, claimed))
+        for worker in range(CLAIMERS)
+    ]
+    for process in workers:
+        process.start()
+    start.set()
+    results = [claimed.get(timeout=60) for _ in workers]
+    for process in workers:
+        process.join(timeout=10)
+        assert process.exitcode == 0
+
+    all_claims = [task_id for ids in results for task_id in ids]
+    assert len(all_claims) == len(set(all_claims)), "a task was claimed twice"
+    assert sorted(all_claims) == sorted(task_ids), "a task was never claimed"
+
+    store = BACKENDS[backend](state_dir)
+    counts = store.task_counts()
+    assert counts["pending"] == 0
+    assert counts["in_progress"] == TASKS
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental (targeted) plans (run with: python -m pytest agents)
+"""
+
+import asyncio
+import os
+import time
+
+import terraform_mcp_server as srv
+
+MAIN_TF = '''
+variable "cidr" {
+  default = "10.0.0.0/16"
+}
+
+resource "aws_vpc" "main" {
+  cidr_block = var.cidr
+}
+
+resource "aws_subnet" "a" {
+  vpc_id = aws_vpc.main.id
+}
+
+resource "aws_eip" "old" {}
+
+resource "aws_s3_bucket" "logs" {}
+
+output "vpc_id" {
+  value = aws_vpc.main.id
+}
+'''
+
+
+def _write(path, text):
+    # Step the mtime forward so the symbol index notices edits made within the same second
+    stamp = os.path.getmtime(path) + 5 if path.exists() else time.time()
+    path.write_text(text)
+    os.utime(path, (stamp, stamp))
+
+
+def _stack(tmp_path):
+    stack = tmp_path / "stack"
+    stack.mkdir()
+    _write(stack / "main.tf", MAIN_TF)
+    return stack
+
+
+def _baseline(stack, full_refresh=True):
+    srv.record_plan_baseline(str(stack), srv.plan_inputs(str(stack), {}), full_refresh)
+
+
+def _scope(stack, **arguments):
+    return srv.incremental_scope(str(stack), arguments, srv.plan_inputs(str(stack), arguments))
+
+
+def test_full_plan_fallbacks(tmp_path, fake_terraform, monkeypatch):
+    stack = _stack(tmp_path)
+    assert _scope(stack) == (None, "no earlier plan of this directory to compare against")
+    _baseline(stack)
+    assert _scope(stack, full=True) == (None, "full plan requested")
+
+    _baseline(stack, full_refresh=False)
+    monkeypatch.setattr(srv, "INCREMENTAL_FULL_INTERVAL", -1)
+    assert _scope(stack) == (None, "scheduled full plan for drift detection")
+    monkeypatch.setattr(srv, "INCREMENTAL_FULL_INTERVAL", 3600)
+
+    _write(stack / "prod.tfvars", 'cidr = "10.1.0.0/16"\n')
+    targets, reason = _scope(stack)
+    assert targets is None and "variables files" in reason
+    _baseline(stack)
+
+    _write(stack / "providers.tf", 'provider "aws" {\n  region = "us-east-1"\n}\n')
+    _baseline(stack)
+    _write(stack / "providers.tf", 'provider "aws" {\n  region = "eu-west-1"\n}\n')
+    assert _scope(stack) == (None, "terraform or provider configuration changed")
+    _baseline(stack)
+
+    _write(stack / "broken.tf", 'resource "aws_eip" "x" {\n')
+    assert _scope(stack) == (None, "some .tf files could not be parsed")
+    (stack / "broken.tf").unlink()
+
+    _write(stack / "main.tf", MAIN_TF.replace('value = aws_vpc.main.id', 'value = aws_vpc.main.arn'))
+    assert _scope(stack) == (None, "only variables, locals or outputs without dependent resources changed")
+
+
+def test_targets_cover_dependents_and_removed_blocks(tmp_path, fake_terraform, monkeypatch):
+    stack = _stack(tmp_path)
+    _baseline(stack)
+    assert _scope(stack)[0] == []
+
+    _write(stack / "main.tf", MAIN_TF.replace("10.0.0.0/16", "10.2.0.0/16").replace('resource "aws_eip" "old" {}', ""))
+    targets, reason = _scope(stack)
+    # The variable is not targetable, but everything built from it is; the deleted EIP is planned for destroy
+    assert targets == ["aws_eip.old", "aws_subnet.a", "aws_vpc.main"]
+    assert reason == "2 changed block(s): aws_eip.old, var.cidr"
+
+    monkeypatch.setattr(srv, "INCREMENTAL_MAX_TARGETS", 2)
+    assert _scope(stack) == (None, "3 addresses affected, more than 2")
+
+
+def _plan(stack, **arguments):
+    return asyncio.run(srv.run_plan(["terraform", "plan"], str(stack), dict(arguments, output="raw"), None))
+
+
+def test_incremental_plan_passes_targets(tmp_path, fake_terraform):
+    stack = _stack(tmp_path)
+    first = _plan(stack, incremental=True)
+    assert "ran as a full plan" in first["note"]
+
+    unchanged = _plan(stack, incremental=True, use_cache=False)
+    assert "nothing to plan" in unchanged["note"]
+    assert len(fake_terraform) == 1
+
+    _write(stack / "main.tf", MAIN_TF.replace('resource "aws_s3_bucket" "logs" {}',
+                                              'resource "aws_s3_bucket" "logs" {\n  bucket = "logs"\n}'))
+    _plan(stack, incremental=True)
+    assert [arg for arg in fake_terraform[-1] if arg.startswith("-target=")] == ["-target=aws_s3_bucket.logs"]
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Tests for the coordination state store (run with: python -m pytest agents)
+"""
+
+import os
+import shutil
+import threading
+
+import pytest
+
+import state_store
+from state_store import JournalStore, SqliteStore, empty_documents, new_task_id
+
+
+def _task(role="ARCHITECT"):
+    return {"id": new_task_id(), "type": "test", "description": "test task",
+            "data": {"target_role": role}, "priority": 0, "status": "pending"}
+
+
+def _run_task(store):
+    task = _task()
+    store.apply({"op": "task_add", "task": task, "current": True})
+    store.claim_task(task["id"], {"started_by": "test"})
+    store.apply({"op": "task_finish", "id": task["id"], "set": {"status": "completed"}})
+    return task["id"]
+
+
+def _replay_after_compaction(state_dir):
+    """Compact, then put the old journal back as a crash before the truncate would"""
+    store = JournalStore(state_dir)
+    journal = os.path.join(state_dir, state_store.JOURNAL_FILE)
+    shutil.copy(journal, journal + ".before")
+    store.compact()
+    os.replace(journal + ".before", journal)
+    return JournalStore(state_dir)
+
+
+def test_replay_after_compaction_does_not_requeue_finished_tasks(tmp_path):
+    store = JournalStore(str(tmp_path))
+    store.reset(empty_documents())
+    task_id = _run_task(store)
+
+    replayed = _replay_after_compaction(str(tmp_path))
+    tasks = replayed.load("tasks")
+    assert tasks["pending_tasks"] == []
+    assert [t["id"] for t in tasks["task_history"]] == [task_id]
+    assert replayed.task_counts()["completed"] == 1
+
+
+def test_replay_after_compaction_skips_archived_tasks(tmp_path, monkeypatch):
+    monkeypatch.setattr(state_store, "HISTORY_HOT_LIMIT", 1)
+    monkeypatch.setattr(state_store, "HISTORY_SEGMENT_SIZE", 1)
+    store = JournalStore(str(tmp_path))
+    store.reset(empty_documents())
+    task_ids = [_run_task(store) for _ in range(3)]
+
+    replayed = _replay_after_compaction(str(tmp_path))
+    tasks = replayed.load("tasks")
+    assert tasks["pending_tasks"] == []
+    assert [t["id"] for t in tasks["task_history"]] == task_ids[-1:]
+    assert replayed.archive.count("tasks") == 2
+    assert replayed.task_counts()["completed"] == 3
+
+
+def _small_history(monkeypatch):
+    monkeypatch.setattr(state_store, "HISTORY_HOT_LIMIT", 2)
+    monkeypatch.setattr(state_store, "HISTORY_SEGMENT_SIZE", 3)
+
+
+def test_sqlite_rotation_counts_stay_monotonic_for_readers(tmp_path, monkeypatch):
+    _small_history(monkeypatch)
+    store = SqliteStore(str(tmp_path))
+    store.reset(empty_documents())
+    seen, done = [], threading.Event()
+
+    def watch_counts():
+        reader = SqliteStore(str(tmp_path))
+        while not done.is_set():
+            seen.append(reader.task_counts()["completed"])
+
+    reader = threading.Thread(target=watch_counts)
+    reader.start()
+    try:
+        task_ids = [_run_task(store) for _ in range(40)]
+    finally:
+        done.set()
+        reader.join()
+
+    assert seen == sorted(seen), "completed count went backwards during rotation"
+    assert store.task_counts()["completed"] == 40
+    history = [t["id"] for t in store.query_history("tasks")]
+    assert sorted(history) == sorted(task_ids)
+    assert store.archive.count("tasks") + len(store.load("tasks")["task_history"]) == 40
+
+
+def test_sqlite_interrupted_rotation_is_not_archived_twice(tmp_path, monkeypatch):
+    _small_history(monkeypatch)
+    store = SqliteStore(str(tmp_path))
+    store.reset(empty_documents())
+    append_segment = store.archive.append_segment
+
+    def append_then_fail(*args, **kwargs):
+        append_segment(*args, **kwargs)
+        raise OSError("simulated crash before the rotation commits")
+
+    monkeypatch.setattr(store.archive, "append_segment", append_then_fail)
+    task_ids = [_run_task(store) for _ in range(4)]
+    with pytest.raises(OSError):
+        task_ids.append(_run_task(store))
+    # The segment exists but its rows were never deleted; readers count them once
+    assert store.archive.count("tasks") == 3
+    assert store.task_counts()["completed"] == 5
+    assert len(store.query_history("tasks")) == 5
+
+    monkeypatch.setattr(store.archive, "append_segment", append_segment)
+    task_ids += [_run_task(store) for _ in range(5)]
+    history = [t["id"] for t in store.query_history("tasks")]
+    assert len(history) == len(set(history)) == 10
+    assert set(task_ids) <= set(history)
+    assert store.task_counts()["completed"] == 10
+
+
+def _add(store, depends_on=()):
+    task = dict(_task(), depends_on=list(depends_on))
+    store.apply({"op": "task_add", "task": task})
+    return task["id"]
+
+
+def _finish(store, task_id, status):
+    store.apply({"op": "task_finish", "id": task_id,
+                 "set": {"status": status, "completed_at": "2025-01-01T00:00:00"}})
+
+
+@pytest.mark.parametrize("backend", sorted(state_store.BACKENDS))
+def test_failed_dependency_fails_dependents_transitively(tmp_path, backend):
+    store = state_store.BACKENDS[backend](str(tmp_path))
+    store.reset(empty_documents())
+    design = _add(store)
+    build = _add(store, [design])
+    review = _add(store, [build])
+    other = _add(store)
+    assert store.task_counts()["blocked"] == 2
+
+    _finish(store, design, "failed")
+    for task_id, dep_id in ((build, design), (review, build)):
+        task = store.get_task(task_id)
+        assert task["status"] == state_store.DEPENDENCY_FAILED
+        assert task["failed_dependency"] == dep_id
+    assert store.task_counts() == {"pending": 1, "in_progress": 0, "blocked": 0, "completed": 0}
+    assert [t["id"] for t in store.pending_tasks()] == [other]
+
+
+@pytest.mark.parametrize("backend", sorted(state_store.BACKENDS))
+def test_dependency_that_already_failed_is_not_satisfied(tmp_path, backend):
+    store = state_store.BACKENDS[backend](str(tmp_path))
+    store.reset(empty_documents())
+    done, broken = _add(store), _add(store)
+    _finish(store, done, "completed")
+    _finish(store, broken, "failed")
+
+    assert store.get_task(_add(store, [done]))["status"] == "pending"
+    late = _add(store, [done, broken])
+    assert store.get_task(late)["status"] == state_store.DEPENDENCY_FAILED
+    assert store.get_task(late)["failed_dependency"] == broken
+    assert store.task_counts()["blocked"] == 0
+
+
+def test_send_tasks_rejects_unknown_dependency(tmp_path, monkeypatch):
+    import orchestrator_helper
+    monkeypatch.setattr(state_store, "STATE_DIR", str(tmp_path))
+    state_store.get_store().reset(empty_documents())
+    with pytest.raises(ValueError, match="desing"):
+        orchestrator_helper.send_tasks([
+            {"key": "design", "type": "t", "description": "design"},
+            {"type": "t", "description": "build", "depends_on": ["desing"]},
+        ])
+    assert state_store.get_store().pending_tasks() == []
+
+
+@pytest.mark.parametrize("backend", sorted(state_store.BACKENDS))
+def test_claim_order_follows_priority_then_age(tmp_path, backend):
+    store = state_store.BACKENDS[backend](str(tmp_path))
+    store.reset(empty_documents())
+    ids = {}
+    for name, priority, role in [("low", 0, "ARCHITECT"), ("high", 5, "ARCHITECT"), ("high2", 5, "ARCHITECT"),
+                                 ("mid", 3, "ARCHITECT"), ("other", 9, "SECURITY")]:
+        task = dict(_task(role), priority=priority)
+        store.apply({"op": "task_add", "task": task})
+        ids[name] = task["id"]
+    names = {task_id: name for name, task_id in ids.items()}
+
+    assert names[store.next_pending()["id"]] == "other"
+    assert names[store.next_pending("ARCHITECT")["id"]] == "high"
+    assert names[store.claim_next("ARCHITECT", {"started_by": "test"})["id"]] == "high"
+    assert names[store.next_pending("ARCHITECT")["id"]] == "high2"
+
+    # A task handed back to the queue keeps its place; a priority bump moves it up
+    store.apply({"op": "task_update", "id": ids["high"], "set": {"status": "pending"}})
+    assert names[store.next_pending("ARCHITECT")["id"]] == "high"
+    store.apply({"op": "task_update", "id": ids["low"], "set": {"priority": 7}})
+    claimed = [names[store.claim_next("ARCHITECT", {"started_by": "test"})["id"]] for _ in range(4)]
+    assert claimed == ["low", "high", "high2", "mid"]
+    assert store.next_pending("ARCHITECT") is None
+    assert [t["id"] for t in store.pending_tasks("ARCHITECT")] == [ids["low"], ids["high"], ids["high2"], ids["mid"]]
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests for the state watcher behind wait_for_task/wait_for_result
+(run with: python -m pytest agents)
+"""
+
+import threading
+import time
+
+import pytest
+
+from state_store import BACKENDS, empty_documents, new_task_id
+from state_watch import wait_until
+
+
+def _task():
+    return {"id": new_task_id(), "type": "test", "description": "watch",
+            "data": {"target_role": "ARCHITECT"}, "priority": 0, "status": "pending"}
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_idle_wait_uses_almost_no_cpu(tmp_path, backend):
+    store = BACKENDS[backend](str(tmp_path))
+    store.reset(empty_documents())
+    checks = []
+
+    def check():
+        checks.append(1)
+        return store.next_pending("ARCHITECT")
+
+    started, cpu = time.monotonic(), time.process_time()
+    assert wait_until(store.state_dir, check, 1.0) is None
+    assert time.monotonic() - started >= 1.0
+    # Checking state must not wake the watcher it is waiting on
+    assert time.process_time() - cpu < 0.2
+    assert len(checks) < 50
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_wait_wakes_on_new_task(tmp_path, backend):
+    store = BACKENDS[backend](str(tmp_path))
+    store.reset(empty_documents())
+    task = _task()
+    writer = BACKENDS[backend](str(tmp_path))
+    timer = threading.Timer(0.2, writer.apply, [{"op": "task_add", "task": task}])
+    timer.start()
+    try:
+        started = time.monotonic()
+        found = wait_until(store.state_dir, lambda: store.next_pending("ARCHITECT"), 5.0)
+    finally:
+        timer.join()
+    assert found is not None and found["id"] == task["id"]
+    assert time.monotonic() - started < 2.0
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the content-addressed plan cache (run with: python -m pytest agents)
+"""
+
+import asyncio
+import json
+
+import terraform_mcp_server as srv
+from terraform_cache import PlanCache
+
+
+def _stack(tmp_path, serial=1):
+    stack = tmp_path / "stack"
+    stack.mkdir(exist_ok=True)
+    (stack / "main.tf").write_text('resource "aws_vpc" "main" {\n  cidr_block = "10.0.0.0/16"\n}\n')
+    _write_state(stack, serial)
+    return stack
+
+
+def _write_state(stack, serial):
+    (stack / "terraform.tfstate").write_text(json.dumps({"version": 4, "lineage": "l-1", "serial": serial}))
+
+
+def _key(stack, var_file=None, target=None, mode="refresh"):
+    return asyncio.run(srv.plan_key(str(stack), var_file, target, None, mode))
+
+
+def test_plan_key_tracks_config_arguments_and_state(tmp_path):
+    stack = _stack(tmp_path)
+    (stack / "prod.tfvars").write_text('region = "us-east-1"\n')
+    key = _key(stack)
+    assert _key(stack) == key
+
+    assert _key(stack, target="aws_vpc.main") != key
+    assert _key(stack, mode="no_refresh") != key
+    with_vars = _key(stack, var_file="prod.tfvars")
+    assert with_vars != key
+    (stack / "prod.tfvars").write_text('region = "eu-west-1"\n')
+    assert _key(stack, var_file="prod.tfvars") != with_vars
+
+    key = _key(stack)
+    _write_state(stack, 2)
+    assert _key(stack) != key
+    _write_state(stack, 1)
+    assert _key(stack) == key
+    (stack / "main.tf").write_text('resource "aws_vpc" "main" {}\n')
+    assert _key(stack) != key
+
+
+def test_plan_cache_lookup_ttl_and_invalidate(tmp_path):
+    cache = PlanCache(root=str(tmp_path / "plans"), ttl=60)
+    stack = str(tmp_path)
+    assert cache.lookup(stack, "k1") is None
+
+    cache.prepare(stack)
+    with open(cache.plan_path(stack, "k1"), "w") as f:
+        f.write("saved plan")
+    cache.store(stack, "k1", {"command": "terraform plan", "stdout": "ok", "stderr": ""})
+    hit = cache.lookup(stack, "k1")
+    assert hit is not None and hit["plan_file"] == cache.plan_path(stack, "k1")
+    assert cache.lookup(stack, "k2") is None
+
+    cache.ttl = -1
+    assert cache.lookup(stack, "k1") is None, "expired plans are re-planned"
+    cache.ttl = 60
+    assert cache.lookup(stack, "k1") is None, "an expired entry is discarded"
+
+    cache.prepare(stack)
+    with open(cache.plan_path(stack, "k3"), "w") as f:
+        f.write("saved plan")
+    cache.store(stack, "k3", {"command": "terraform plan", "stdout": "", "stderr": ""})
+    cache.invalidate(stack)
+    assert cache.lookup(stack, "k3") is None
+
+
+def _plan(stack):
+    return asyncio.run(srv.run_plan(["terraform", "plan"], str(stack), {"output": "raw"}, None))
+
+
+def _apply(stack):
+    return asyncio.run(srv.run_apply(
+        ["terraform", "apply", "-auto-approve"], str(stack), {"auto_approve": True}, None
+    ))
+
+
+def test_second_plan_is_a_cache_hit(tmp_path, fake_terraform):
+    stack = _stack(tmp_path)
+    first = _plan(stack)
+    assert first["success"] and "Reused saved plan" not in first.get("note", "")
+    second = _plan(stack)
+    assert "Reused saved plan" in second["note"]
+    assert [cmd[0] for cmd in fake_terraform] == ["plan"]
+
+
+def test_apply_uses_saved_plan_then_invalidates(tmp_path, fake_terraform):
+    stack = _stack(tmp_path)
+    _plan(stack)
+    plan_file = [arg for arg in fake_terraform[0] if arg.startswith("-out=")][0][len("-out="):]
+
+    result = _apply(stack)
+    assert fake_terraform[-1] == ["apply", plan_file]
+    assert "Applied the saved plan" in result["note"]
+    assert srv.plan_cache.lookup(str(stack), _key(stack)) is None
+
+    # Nothing is reused after the apply, even though config and state look the same
+    assert "Reused saved plan" not in _plan(stack).get("note", "")
+    assert [cmd[0] for cmd in fake_terraform] == ["plan", "apply", "plan"]
+
+
+def test_apply_without_saved_plan_still_invalidates(tmp_path, fake_terraform):
+    stack = _stack(tmp_path)
+    asyncio.run(srv.run_plan(["terraform", "plan"], str(stack), {"output": "raw", "target": "aws_vpc.main"}, None))
+    _apply(stack)
+    assert fake_terraform[-1] == ["apply", "-auto-approve"]
+    assert not list((tmp_path / "cache" / "plans").glob("*/*.json"))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for the HCL symbol index (run with: python -m pytest agents)
+"""
+
+import os
+import time
+
+from terraform_hcl import SymbolIndex
+
+MAIN_TF = '''
+variable "cidr" {
+  default = "10.0.0.0/16"
+}
+
+locals {
+  name = "web-${var.cidr}"
+}
+
+# resource "aws_vpc" "commented_out" {}
+resource "aws_vpc" "main" {
+  cidr_block = var.cidr
+  tags = {
+    Name = local.name
+    Note = "not a reference: aws_vpc.fake.id }"
+  }
+}
+
+resource "aws_subnet" "a" {
+  vpc_id = aws_vpc.main.id
+
+  lifecycle {
+    create_before_destroy = true
+  }
+}
+
+data "aws_ami" "ubuntu" {
+  most_recent = true
+}
+
+resource "aws_instance" "web" {
+  ami       = data.aws_ami.ubuntu.id
+  subnet_id = aws_subnet.a.id
+  user_data = <<-EOT
+    #!/bin/sh
+    echo "${aws_vpc.main.cidr_block}" }
+  EOT
+}
+
+module "dns" {
+  source = "./dns"
+  ip     = aws_instance.web.private_ip
+}
+
+output "web_ip" {
+  value = aws_instance.web.public_ip
+}
+
+resource "aws_s3_bucket" "logs" {}
+'''
+
+
+def _index(tmp_path, text=MAIN_TF):
+    (tmp_path / "main.tf").write_text(text)
+    return SymbolIndex(str(tmp_path))
+
+
+def test_parses_top_level_blocks(tmp_path):
+    symbols = _index(tmp_path).symbols()
+    assert set(symbols) == {
+        "var.cidr", "local.name", "aws_vpc.main", "aws_subnet.a", "data.aws_ami.ubuntu",
+        "aws_instance.web", "module.dns", "output.web_ip", "aws_s3_bucket.logs"
+    }
+    subnet = symbols["aws_subnet.a"]
+    assert (subnet["kind"], subnet["type"], subnet["name"]) == ("resource", "aws_subnet", "a")
+    assert (subnet["file"], subnet["line"], subnet["end_line"]) == ("main.tf", 19, 25)
+    assert subnet["attributes"] == ["vpc_id"] and subnet["blocks"] == ["lifecycle"]
+    assert symbols["data.aws_ami.ubuntu"]["kind"] == "data"
+
+
+def test_references_ignore_strings_and_comments(tmp_path):
+    symbols = _index(tmp_path).symbols()
+    assert symbols["aws_vpc.main"]["references"] == ["local.name", "var.cidr"]
+    assert symbols["local.name"]["references"] == ["var.cidr"]
+    # The heredoc interpolation is a real reference; the quoted text is not
+    assert symbols["aws_instance.web"]["references"] == ["aws_subnet.a", "aws_vpc.main", "data.aws_ami.ubuntu"]
+    assert sorted(symbols["aws_vpc.main"]["referenced_by"]) == ["aws_instance.web", "aws_subnet.a"]
+    assert symbols["aws_s3_bucket.logs"]["references"] == []
+
+
+def test_dependents_are_transitive(tmp_path):
+    index = _index(tmp_path)
+    assert index.dependents({"aws_subnet.a"}) == {
+        "aws_subnet.a", "aws_instance.web", "module.dns", "output.web_ip"
+    }
+    assert index.dependents({"var.cidr"}) == {
+        "var.cidr", "local.name", "aws_vpc.main", "aws_subnet.a",
+        "aws_instance.web", "module.dns", "output.web_ip"
+    }
+    assert index.dependents({"aws_s3_bucket.logs"}) == {"aws_s3_bucket.logs"}
+    # Unknown addresses (e.g. removed blocks) are kept as given
+    assert index.dependents({"aws_eip.gone"}) == {"aws_eip.gone"}
+
+
+def test_refresh_picks_up_edits_and_syntax_errors(tmp_path):
+    index = _index(tmp_path)
+    hashes, _ = index.block_hashes()
+
+    path = tmp_path / "main.tf"
+    path.write_text(MAIN_TF.replace('resource "aws_s3_bucket" "logs" {}', 'resource "aws_s3_bucket" "logs" {\n  bucket = "x"\n}'))
+    future = time.time() + 5
+    os.utime(path, (future, future))
+    changed, _ = index.block_hashes()
+    assert {a for a in hashes if hashes[a] != changed.get(a)} == {"aws_s3_bucket.logs"}
+
+    (tmp_path / "broken.tf").write_text('resource "aws_eip" "x" {\n')
+    assert set(index.errors()) == {"broken.tf"}
+    assert "aws_s3_bucket.logs" in index.symbols()
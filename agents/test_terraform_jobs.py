@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the MCP server's per-working-directory job scheduler
+(run with: python -m pytest agents)
+"""
+
+import asyncio
+
+from terraform_jobs import JobScheduler
+
+
+class Tracker:
+    """Runner factory that records how many jobs run at once, overall and per directory"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.running = {}
+        self.peak = 0
+        self.peak_per_dir = {}
+
+    def runner(self, working_dir):
+        async def run(job):
+            self.running[working_dir] = self.running.get(working_dir, 0) + 1
+            self.peak = max(self.peak, sum(self.running.values()))
+            self.peak_per_dir[working_dir] = max(self.peak_per_dir.get(working_dir, 0),
+                                                 self.running[working_dir])
+            try:
+                await asyncio.sleep(self.delay)
+            finally:
+                self.running[working_dir] -= 1
+            return {"success": True}
+        return run
+
+
+def test_jobs_in_one_directory_run_one_at_a_time(tmp_path):
+    async def scenario():
+        scheduler, tracker = JobScheduler(max_concurrent=4), Tracker()
+        jobs = [scheduler.submit("plan", str(tmp_path), "plan", tracker.runner("a")) for _ in range(3)]
+        assert [job.status for job in jobs] == ["queued"] * 3
+        for job in jobs:
+            assert await scheduler.wait(job, 5)
+        assert tracker.peak_per_dir["a"] == 1
+        assert all(job.status == "succeeded" for job in jobs)
+        # Queued behind each other, in submission order
+        assert jobs[0].finished_at <= jobs[1].started_at <= jobs[1].finished_at <= jobs[2].started_at
+    asyncio.run(scenario())
+
+
+def test_concurrency_cap_across_directories(tmp_path):
+    async def scenario():
+        scheduler, tracker = JobScheduler(max_concurrent=2), Tracker()
+        dirs = [tmp_path / str(i) for i in range(5)]
+        jobs = []
+        for directory in dirs:
+            directory.mkdir()
+            jobs.append(scheduler.submit("plan", str(directory), "plan", tracker.runner(directory)))
+        await asyncio.gather(*(scheduler.wait(job, 5) for job in jobs))
+        assert tracker.peak == 2
+        assert all(job.status == "succeeded" for job in jobs)
+    asyncio.run(scenario())
+
+
+def test_busy_while_directory_has_work(tmp_path):
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=4)
+        assert not scheduler.busy(str(tmp_path))
+        job = scheduler.submit("plan", str(tmp_path), "plan", Tracker().runner("a"))
+        await asyncio.sleep(0.01)
+        assert scheduler.busy(str(tmp_path))
+        await scheduler.wait(job, 5)
+        assert not scheduler.busy(str(tmp_path))
+    asyncio.run(scenario())
+
+
+def test_cancel_running_and_queued_jobs(tmp_path):
+    async def scenario():
+        scheduler, tracker = JobScheduler(max_concurrent=4), Tracker(delay=30)
+        running = scheduler.submit("apply", str(tmp_path), "apply", tracker.runner("a"))
+        queued = scheduler.submit("plan", str(tmp_path), "plan", tracker.runner("a"))
+        await asyncio.sleep(0.01)
+        assert (running.status, queued.status) == ("running", "queued")
+
+        assert scheduler.cancel(queued.id)
+        assert scheduler.cancel(running.id)
+        assert await scheduler.wait(running, 5) and await scheduler.wait(queued, 5)
+        assert (running.status, queued.status) == ("cancelled", "cancelled")
+        assert queued.started_at is None
+        assert not scheduler.cancel(running.id), "a finished job cannot be cancelled again"
+
+        # The directory lock was released, so new work still runs
+        tracker.delay = 0
+        follow_up = scheduler.submit("plan", str(tmp_path), "plan", tracker.runner("a"))
+        assert await scheduler.wait(follow_up, 5)
+        assert follow_up.status == "succeeded"
+    asyncio.run(scenario())
+
+
+def test_runner_errors_fail_the_job(tmp_path):
+    async def scenario():
+        scheduler = JobScheduler(max_concurrent=1)
+
+        async def broken(job):
+            raise RuntimeError("terraform not found")
+
+        job = scheduler.submit("plan", str(tmp_path), "plan", broken)
+        assert await scheduler.wait(job, 5)
+        assert job.status == "failed" and job.error == "terraform not found"
+    asyncio.run(scenario())